@@ -0,0 +1,225 @@
+import os
+import re
+import gzip
+import json
+import shutil
+import asyncio
+import threading
+import traceback
+from datetime import datetime, timedelta
+import logging
+local_logger = logging.getLogger(__name__)
+
+PARTITION_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+INDEX_FILE = "index.json"
+EXTENSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def _zstd_module():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+class ArchiveStream:
+    """File of the archive written chunk by chunk, see MessageArchive.open_stream()."""
+
+    def __init__(self, archive, partition, path, file):
+        self.archive = archive
+        self.partition = partition
+        self.path = path
+        self._file = file
+        self._size = 0
+
+    async def write(self, chunk):
+        await asyncio.to_thread(self._file.write, chunk)
+
+    async def close(self):
+        await asyncio.to_thread(self._close_blocking)
+        local_logger.info("Archived %s", self.path)
+        return self.path
+
+    def _close_blocking(self):
+        self._file.close()
+        self.archive._add_to_index(self.partition, os.path.getsize(self.path))
+
+
+class MessageArchive:
+    """Date-partitioned archive of sent messages and raw API responses.
+
+    Files land in `root/YYYY-MM-DD/<name>[_<tag>]_<HHMMSS_micro>.<ext>[.gz|.zst]`.
+    `index.json` keeps the file count and size of every partition, so
+    retention drops whole partitions (older than `retention_days`, then the
+    oldest ones while the archive exceeds `max_bytes`) without listing or
+    stat-ing the archived files. All disk I/O runs on worker threads.
+    """
+
+    def __init__(self, root, compression="gzip", retention_days=30, max_bytes=0, level=6):
+        self.root = root
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.level = level
+
+        compression = (compression or "none").lower()
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown archive compression: {compression}")
+        if compression == "zstd" and _zstd_module() is None:
+            local_logger.warning("Package 'zstandard' not installed, archiving with gzip instead.")
+            compression = "gzip"
+        self.compression = compression
+
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.index = self._load_index()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv("ARCHIVE_DIR", os.path.join(os.getcwd(), "SOAP_Archive")),
+            compression=os.getenv("ARCHIVE_COMPRESSION", "gzip"),
+            retention_days=int(os.getenv("ARCHIVE_RETENTION_DAYS", 30)),
+            max_bytes=int(float(os.getenv("ARCHIVE_MAX_MB", 1024)) * 1024 * 1024)
+        )
+
+    # ---------------- index ----------------
+
+    def _load_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return self._rebuild_index()
+        except Exception as e:
+            local_logger.warning("Unreadable archive index %s, rebuilding it: %s", path, e)
+            return self._rebuild_index()
+
+    def _rebuild_index(self):
+        # One-off scan, only when the index is missing: also moves the flat APMT_ETC_*.xml
+        # files of earlier versions into their partition so retention covers them
+        index = {}
+        for entry in os.scandir(self.root):
+            if entry.is_file() and entry.name.startswith("APMT_ETC_") and entry.name.endswith(".xml"):
+                partition = datetime.fromtimestamp(entry.stat().st_mtime).strftime("%Y-%m-%d")
+                os.makedirs(os.path.join(self.root, partition), exist_ok=True)
+                os.replace(entry.path, os.path.join(self.root, partition, entry.name))
+
+        for entry in os.scandir(self.root):
+            if entry.is_dir() and PARTITION_RE.match(entry.name):
+                files = [f for f in os.scandir(entry.path) if f.is_file()]
+                index[entry.name] = {"files": len(files), "bytes": sum(f.stat().st_size for f in files)}
+        self._save_index(index)
+        local_logger.info("Archive index rebuilt for %s: %s partition(s)", self.root, len(index))
+        return index
+
+    def _save_index(self, index=None):
+        path = os.path.join(self.root, INDEX_FILE)
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, "w") as file:
+            json.dump(self.index if index is None else index, file, indent=1, sort_keys=True)
+        os.replace(tmp_file, path)
+
+    def _add_to_index(self, partition, size):
+        with self._lock:
+            entry = self.index.setdefault(partition, {"files": 0, "bytes": 0})
+            entry["files"] += 1
+            entry["bytes"] += size
+            self._save_index()
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(entry["bytes"] for entry in self.index.values())
+
+    # ---------------- writing ----------------
+
+    def _new_path(self, name, ext, tag):
+        now = datetime.now()
+        partition = now.strftime("%Y-%m-%d")
+        directory = os.path.join(self.root, partition)
+        os.makedirs(directory, exist_ok=True)
+        stem = f"{name}_{tag}" if tag else name
+        base = os.path.join(directory, f"{stem}_{now.strftime('%H%M%S_%f')}")
+        suffix = f".{ext}{EXTENSIONS[self.compression]}"
+        path, counter = f"{base}{suffix}", 1
+        while os.path.exists(path):
+            path, counter = f"{base}_{counter}{suffix}", counter + 1
+        return partition, path
+
+    def _open(self, path):
+        if self.compression == "gzip":
+            return gzip.open(path, "wb", compresslevel=self.level)
+        if self.compression == "zstd":
+            file = open(path, "wb")
+            return _zstd_module().ZstdCompressor(level=self.level).stream_writer(file, closefd=True)
+        return open(path, "wb")
+
+    def _write_blocking(self, name, payload, ext, tag):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._lock:
+            partition, path = self._new_path(name, ext, tag)
+            # Reserve the name before releasing the lock
+            open(path, "xb").close()
+        with self._open(path) as file:
+            file.write(payload)
+        self._add_to_index(partition, os.path.getsize(path))
+        return path
+
+    async def write(self, name, payload, ext="xml", tag=None):
+        """Archive a whole message; returns its path, or None if it could not be written."""
+        try:
+            path = await asyncio.to_thread(self._write_blocking, name, payload, ext, tag)
+            local_logger.info("Archived %s", path)
+            return path
+        except Exception as e:
+            local_logger.error("Error archiving %s: %s", name, str(traceback.format_exc()))
+            return None
+
+    def _open_stream_blocking(self, name, ext, tag):
+        with self._lock:
+            partition, path = self._new_path(name, ext, tag)
+            open(path, "xb").close()
+        return ArchiveStream(self, partition, path, self._open(path))
+
+    async def open_stream(self, name, ext="xml", tag=None):
+        """Archive a message written chunk by chunk; close() the returned stream when done."""
+        return await asyncio.to_thread(self._open_stream_blocking, name, ext, tag)
+
+    # ---------------- retention ----------------
+
+    def _prune_blocking(self):
+        with self._lock:
+            partitions = sorted(self.index)
+            expired = []
+            if self.retention_days:
+                cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime("%Y-%m-%d")
+                expired = [p for p in partitions if p < cutoff]
+            total = sum(self.index[p]["bytes"] for p in partitions if p not in expired)
+            today = datetime.now().strftime("%Y-%m-%d")
+            for partition in partitions:
+                # The current partition is never dropped for size, it is still being written
+                if not self.max_bytes or total <= self.max_bytes or partition >= today:
+                    break
+                if partition not in expired:
+                    expired.append(partition)
+                    total -= self.index[partition]["bytes"]
+            for partition in expired:
+                del self.index[partition]
+            if expired:
+                self._save_index()
+
+        for partition in expired:
+            shutil.rmtree(os.path.join(self.root, partition), ignore_errors=True)
+        return expired
+
+    async def prune(self):
+        try:
+            expired = await asyncio.to_thread(self._prune_blocking)
+            if expired:
+                local_logger.info("Archive retention removed partition(s): %s", expired)
+            return expired
+        except Exception as e:
+            local_logger.error("Error pruning the archive: %s", str(traceback.format_exc()))
+            return []
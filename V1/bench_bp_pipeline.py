@@ -0,0 +1,437 @@
+"""Benchmarks for the Berth Plan pipeline: metrics, datetime formatting and XML building.
+
+Usage:
+    python bench_bp_pipeline.py                       # 10, 100, 1k and 10k berth calls
+    python bench_bp_pipeline.py --sizes 100 1000 --repeat 20 --json result.json
+    python bench_bp_pipeline.py --compare HEAD~3 HEAD  # same benchmark against two git revisions
+    python bench_bp_pipeline.py --verify               # XML output byte-identical to ElementTree
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+import statistics
+import logging
+from io import BytesIO
+import xml.etree.ElementTree as ET
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+OPERATORS = ["MSK", "HCL", "HAP", "MSC", "CGM", "XCL", "ONE", "PEREZ & CIA"]
+
+
+def make_berth_plan(count, seed=42):
+    """Synthetic Berth Plan API payload shaped like the Maersk response."""
+    rnd = random.Random(seed)
+    berths = []
+    for i in range(count):
+        day = 1 + i % 28
+        bollard = rnd.randint(10, 81)
+        berths.append({
+            "arrivalVoyage": f"{400 + i % 600}{rnd.choice('NSEW')}",
+            "vesselName": f"VESSEL {i} & SONS",
+            "vesselCode": f"V{i % 1000:03d}",
+            "imoCode": str(9000000 + i),
+            "vesselLOA": rnd.choice([199.9, 294.13, 300.0, 366.0, 399.9]),
+            "plannedBollard": rnd.choice([f"B{bollard}", f"B{bollard}.{rnd.randint(1, 9)}", ""]),
+            "isStarboardBerth": rnd.choice(["1", "0"]),
+            "etb": f"2026-10-{day:02d}T{rnd.randint(0, 23):02d}:00:00",
+            "etd": f"2026-10-{day:02d}T{rnd.randint(0, 23):02d}:30:00.000",
+            "etc": rnd.choice(["", f"2026-10-{day:02d}T12:00:00"]),
+            "operatorCode": rnd.choice(OPERATORS),
+            "service_Route": "ME1",
+            "serviceName": "Med Express",
+            "plannedLoadMoves": rnd.randint(0, 1500),
+            "plannedDischargeMoves": rnd.randint(0, 1500),
+            "plannedShiftingMoves": rnd.randint(0, 80),
+            "averageCranes": rnd.uniform(1, 6),
+        })
+    return berths
+
+
+def make_edge_cases():
+    """Records exercising escaping, empty leaves and non-ASCII text."""
+    berths = make_berth_plan(6, seed=7)
+    berths[0]["vesselName"] = "A < B && C > D"
+    berths[1]["vesselName"] = ""
+    berths[1]["serviceName"] = ""
+    berths[2]["serviceName"] = "Ligne Méditerranée → Tanger"
+    berths[3]["operatorCode"] = "UNKNOWN"
+    berths[4] = {key: value for key, value in berths[4].items() if key not in ("etb", "arrivalVoyage")}
+    berths[5]["vesselName"] = "\"quoted\" 'name'"
+    return berths
+
+
+def _berth_call_module():
+    # The script's own directory is on sys.path too: only use berth_call if the benchmarked revision has it
+    import xml_builder
+    if not os.path.exists(os.path.join(os.path.dirname(xml_builder.__file__), "berth_call.py")):
+        return None
+    import berth_call
+    return berth_call
+
+
+def ingest(berths):
+    """The records as the pipeline stages take them: BerthCalls where the revision has them, raw dicts before.
+
+    Stages that take records call it inside the timing, so every revision starts from the same API records.
+    """
+    berth_call = _berth_call_module()
+    return berth_call.parse_berth_calls(berths)[0] if berth_call else berths
+
+
+async def aingest(records):
+    berth_call = _berth_call_module()
+    async for record in records:
+        yield berth_call.parse_berth_call(record) if berth_call else record
+
+
+def reference_berth_plan_xml(metrics, berth_data_list, start_date, end_date, pretty=True):
+    """The Berth Plan envelope built with ElementTree, as xml_file_builder() originally did."""
+    import xml_builder
+
+    ET.register_namespace("soapenv", xml_builder.SOAPENV)
+    ET.register_namespace("tmsa", xml_builder.TMSA)
+
+    def sub(parent, tag, text=None):
+        element = ET.SubElement(parent, tag)
+        element.text = text
+        return element
+
+    envelope = ET.Element(xml_builder.ns("Envelope", xml_builder.SOAPENV))
+    ET.SubElement(envelope, xml_builder.ns("Header", xml_builder.SOAPENV))
+    body = ET.SubElement(envelope, xml_builder.ns("Body", xml_builder.SOAPENV))
+    process = ET.SubElement(body, xml_builder.ns("processBerthPlan", xml_builder.TMSA))
+    demande = ET.SubElement(ET.SubElement(process, "berthPlanRequest"), "DemandeInitiale")
+    header_elem = ET.SubElement(demande, "header")
+    sub(header_elem, "msgVersion", "3.0")
+    sub(header_elem, "GenerationTime", "")
+    sub(header_elem, "sender", "APMT")
+    body_elem = ET.SubElement(demande, "body")
+    sub(body_elem, "startDate", xml_builder.format_datetime(start_date))
+    sub(body_elem, "endDate", xml_builder.format_datetime(end_date))
+    berths = ET.SubElement(body_elem, "berths")
+
+    for berth in berth_data_list:
+        is_starboard = berth.get("isStarboardBerth") == "1"
+        after_metric_point, forward_metric_point, _ = metrics.get_metrics(
+            berth.get("plannedBollard", ""), berth.get("vesselLOA", 0.0), is_starboard)
+        binfo = ET.SubElement(berths, "berthinformation")
+        sub(binfo, "berthPurpose", "DischargeLoad")
+        sub(binfo, "requestStatus", "Reservation")
+        sub(binfo, "voyageNumber", str(berth.get("arrivalVoyage", "")))
+        sub(binfo, "vesselName", str(berth.get("vesselName", "")))
+        sub(binfo, "vesselCode", str(berth.get("vesselCode", "")))
+        sub(binfo, "IMO", str(berth.get("imoCode", "")))
+        sub(binfo, "vesselType", "Container")
+        sub(binfo, "LOA", str(berth.get("vesselLOA", "")))
+        sub(binfo, "afterMetricPoint", str(after_metric_point))
+        sub(binfo, "forwardMetricPoint", str(forward_metric_point))
+        sub(binfo, "ETB", xml_builder.format_datetime(berth.get("etb", "")))
+        sub(binfo, "ETD", xml_builder.format_datetime(berth.get("etd", "")))
+        sub(binfo, "ETC", xml_builder.format_datetime(berth.get("etc", "")))
+        sub(binfo, "forwardDraught", "0")
+        sub(binfo, "afterDraught", "0")
+        sub(binfo, "dockName", "1")
+        sub(binfo, "EMP", str(berth.get("operatorCode", "")))
+        sub(binfo, "bowBollard", str(forward_metric_point))
+        sub(binfo, "berthingSide", "StarbordSide" if is_starboard else "PortSide")
+        sub(binfo, "serviceCode", str(berth.get("service_Route", "")))
+        sub(binfo, "serviceName", str(berth.get("serviceName", "")))
+        moves = [berth.get(key, 0) for key in ("plannedDischargeMoves", "plannedLoadMoves", "plannedShiftingMoves")]
+        sub(binfo, "totalMoves", str(sum(moves)))
+        sub(binfo, "dischargeMoves", str(moves[0]))
+        sub(binfo, "loadMoves", str(moves[1]))
+        sub(binfo, "restowMoves", str(moves[2]))
+        sub(binfo, "numberOfCranesAvg", f"{berth.get('averageCranes', 0.0):.2f}")
+        sub(binfo, "marineAgent", str(xml_builder.agency.get(berth.get("operatorCode", "NOA"), "NOA")))
+        securite = ET.SubElement(binfo, "securite")
+        sub(securite, "siCertificatISPS", "false")
+        sub(securite, "referenceCertificatISPS", "0")
+
+    tree = ET.ElementTree(envelope)
+    if pretty:
+        ET.indent(tree, space="  ")
+    buffer = BytesIO()
+    tree.write(buffer, encoding="utf-8", xml_declaration=True)
+    return buffer.getvalue()
+
+
+def verify_output(sizes):
+    """Compare the streamed XML with the ElementTree reference; returns the number of mismatches."""
+    from metrics import BerthMetricCalculator
+    import xml_builder
+
+    calculator = BerthMetricCalculator()
+    # The generation time is the only field expected to differ
+    generation_time = re.compile(rb"<GenerationTime>[^<]*</GenerationTime>|<GenerationTime />")
+    cases = [("empty", [])] + [("edge cases", make_edge_cases())] + [(str(size), make_berth_plan(size)) for size in sizes]
+    failures = 0
+    for pretty in (True, False):
+        for name, berths in cases:
+            expected = reference_berth_plan_xml(calculator, berths, "2026-10-10", "2026-11-27", pretty=pretty)
+            actual = b"".join(xml_builder.iter_berth_plan_xml(
+                calculator, ingest(berths), "2026-10-10", "2026-11-27", pretty=pretty, chunk_size=4096))
+            expected, actual = generation_time.sub(b"", expected), generation_time.sub(b"", actual)
+            if actual == expected:
+                print(f"ok        pretty={pretty!s:<5} {name:>10} records  {len(actual):>10,} bytes")
+                continue
+            failures += 1
+            offset = next((i for i, (a, b) in enumerate(zip(actual, expected)) if a != b), min(len(actual), len(expected)))
+            print(f"MISMATCH  pretty={pretty!s:<5} {name:>10} records  at byte {offset}: "
+                  f"{actual[offset - 40:offset + 40]!r} != {expected[offset - 40:offset + 40]!r}")
+    return failures
+
+
+def _numpy_available():
+    try:
+        import numpy  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _percentile(sorted_values, pct):
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def measure(fn, items, repeat):
+    """Time fn() `repeat` times and measure its peak traced memory once."""
+    fn()  # warm-up
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    durations.sort()
+    p50 = _percentile(durations, 50)
+    return {
+        "items": items,
+        "runs": repeat,
+        "p50_ms": p50 * 1000,
+        "p95_ms": _percentile(durations, 95) * 1000,
+        "p99_ms": _percentile(durations, 99) * 1000,
+        "mean_ms": statistics.fmean(durations) * 1000,
+        "items_per_s": items / p50 if p50 else float("inf"),
+        "peak_kib": peak / 1024,
+    }
+
+
+def run_benchmarks(sizes, repeat):
+    from metrics import BerthMetricCalculator
+    import xml_builder
+
+    # The pipeline modules log at DEBUG level, keep that out of the timings
+    logging.getLogger().setLevel(logging.WARNING)
+    quiet_logger = logging.getLogger("bench")
+    quiet_logger.setLevel(logging.WARNING)
+
+    calculator = BerthMetricCalculator()
+    loop = asyncio.new_event_loop()
+    results = []
+    try:
+        for size in sizes:
+            records = make_berth_plan(size)
+            columns = [
+                (b["plannedBollard"], b["vesselLOA"], b["isStarboardBerth"] == "1") for b in records
+            ]
+            timestamps = [value for b in records for value in (b["etb"], b["etd"], b["etc"])]
+
+            def metrics_stage():
+                for planned_bollard, loa, is_starboard in columns:
+                    calculator.get_metrics(planned_bollard, loa, is_starboard)
+
+            bollard_column = [c[0] for c in columns]
+            loa_column = [c[1] for c in columns]
+            starboard_column = [c[2] for c in columns]
+
+            def metrics_batch_stage(backend="python"):
+                calculator.get_metrics_batch(bollard_column, loa_column, starboard_column, backend=backend)
+
+            def datetime_stage():
+                # Measure the parser itself, not the memo cache of newer revisions
+                if hasattr(xml_builder.format_datetime, "cache_clear"):
+                    xml_builder.format_datetime.cache_clear()
+                for value in timestamps:
+                    xml_builder.format_datetime(value)
+
+            def xml_stage():
+                loop.run_until_complete(xml_builder.xml_file_builder(
+                    calculator, ingest(records), "2026-10-10", "2026-11-27", quiet_logger))
+
+            # The API response as bytes: load-then-build vs. parse-while-building
+            payload = json.dumps(records).encode("utf-8")
+
+            def json_load_xml_stage():
+                loop.run_until_complete(xml_builder.xml_file_builder(
+                    calculator, ingest(json.loads(payload)), "2026-10-10", "2026-11-27", quiet_logger))
+
+            def json_stream_xml_stage(first_chunk_only=False):
+                from json_stream import aiter_json_array
+
+                async def body():
+                    for start in range(0, len(payload), 64 * 1024):
+                        yield payload[start:start + 64 * 1024]
+
+                async def run():
+                    chunks = body()
+                    records = aiter_json_array(chunks)
+                    calls = aingest(records)
+                    xml_chunks = xml_builder.aiter_berth_plan_xml(calculator, calls, "2026-10-10", "2026-11-27")
+                    try:
+                        async for _ in xml_chunks:
+                            if first_chunk_only:
+                                break
+                    finally:
+                        # Stopping after the first chunk leaves the whole generator chain suspended
+                        for generator in (xml_chunks, calls, records, chunks):
+                            await generator.aclose()
+
+                loop.run_until_complete(run())
+
+            stages = [
+                ("get_metrics", metrics_stage, size),
+                ("get_metrics_batch", metrics_batch_stage, size),
+                ("format_datetime", datetime_stage, len(timestamps)),
+                ("xml_file_builder", xml_stage, size),
+                ("json_load_xml", json_load_xml_stage, size),
+            ]
+            if _berth_call_module():
+                # Parsing and validating the API records into BerthCalls, once per plan; part of the stages below
+                stages.append(("berth_call_parse", lambda: ingest(records), size))
+            if hasattr(xml_builder, "berth_information_values"):
+                # Serialization alone: field values computed up front, one rendered record per berth
+                values = [xml_builder.berth_information_values(calculator, b) for b in ingest(records)]
+                template = xml_builder.compile_template(xml_builder.BERTH_INFORMATION, 7)
+
+                def record_stage():
+                    for record in values:
+                        template.render(record)
+
+                stages.append(("berth_record_render", record_stage, size))
+            if os.path.exists(os.path.join(os.path.dirname(xml_builder.__file__), "bp_conflicts.py")):
+                from bp_conflicts import find_conflicts
+                stages.append(("bp_conflicts", lambda: find_conflicts(calculator, ingest(records)), size))
+            if hasattr(xml_builder, "aiter_berth_plan_xml"):
+                stages.append(("json_stream_xml", json_stream_xml_stage, size))
+                # Time to the first outgoing XML chunk; for json_load_xml that is the whole stage
+                stages.append(("json_stream_ttfb", lambda: json_stream_xml_stage(first_chunk_only=True), size))
+            if not hasattr(calculator, "get_metrics_batch"):
+                # Older revisions have no batch API
+                stages.pop(1)
+            elif _numpy_available():
+                stages.insert(2, ("get_metrics_batch_np", lambda: metrics_batch_stage("numpy"), size))
+
+            for stage, fn, items in stages:
+                # Keep total work per stage roughly constant across sizes
+                stage_repeat = max(3, min(repeat, repeat * 1000 // max(size, 1)))
+                result = measure(fn, items, stage_repeat)
+                result.update(stage=stage, size=size)
+                results.append(result)
+    finally:
+        loop.close()
+    return results
+
+
+def print_results(results, title=None):
+    if title:
+        print(f"\n== {title} ==")
+    print(f"{'stage':<22}{'size':>7}{'runs':>6}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'items/s':>13}{'peak KiB':>11}")
+    for r in results:
+        print(f"{r['stage']:<22}{r['size']:>7}{r['runs']:>6}{r['p50_ms']:>11.3f}{r['p95_ms']:>11.3f}"
+              f"{r['p99_ms']:>11.3f}{r['items_per_s']:>13,.0f}{r['peak_kib']:>11.1f}")
+
+
+def print_comparison(base, head, base_rev, head_rev):
+    print(f"\n== {base_rev} -> {head_rev} (p50, lower is better) ==")
+    print(f"{'stage':<22}{'size':>7}{base_rev[:12]:>14}{head_rev[:12]:>14}{'change':>10}")
+    base_by_key = {(r["stage"], r["size"]): r for r in base}
+    for r in head:
+        old = base_by_key.get((r["stage"], r["size"]))
+        if old is None:
+            continue
+        change = (r["p50_ms"] / old["p50_ms"] - 1) * 100 if old["p50_ms"] else 0.0
+        print(f"{r['stage']:<22}{r['size']:>7}{old['p50_ms']:>12.3f}ms{r['p50_ms']:>12.3f}ms{change:>+9.1f}%")
+
+
+def run_revision(rev, sizes, repeat, workdir):
+    """Run this benchmark against the pipeline modules of another git revision."""
+    repo_root = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    ).stdout.strip()
+    module_dir = os.path.relpath(os.path.dirname(os.path.abspath(__file__)), repo_root)
+    checkout = os.path.join(workdir, rev.replace("/", "_").replace("~", "_").replace("^", "_"))
+    os.makedirs(checkout, exist_ok=True)
+
+    archive = subprocess.run(["git", "archive", rev, module_dir], capture_output=True, check=True, cwd=repo_root)
+    subprocess.run(["tar", "-x", "-C", checkout], input=archive.stdout, check=True)
+
+    output = os.path.join(workdir, f"{os.path.basename(checkout)}.json")
+    subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--modules-dir", os.path.join(checkout, module_dir),
+         "--json", output, "--quiet", "--repeat", str(repeat), "--sizes", *map(str, sizes)],
+        check=True
+    )
+    with open(output) as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Berth Plan pipeline stages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Number of berth calls per payload")
+    parser.add_argument("--repeat", type=int, default=30, help="Timed runs per stage for the smallest payloads")
+    parser.add_argument("--json", help="Write the raw results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE_REV", "HEAD_REV"), help="Compare two git revisions")
+    parser.add_argument("--verify", action="store_true",
+                        help="Check the XML output against the ElementTree reference instead of timing")
+    parser.add_argument("--modules-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--quiet", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.verify:
+        sys.path.insert(0, args.modules_dir or os.path.dirname(os.path.abspath(__file__)))
+        failures = verify_output(args.sizes)
+        print(f"{failures} mismatch(es)" if failures else "XML output identical to the ElementTree reference")
+        sys.exit(1 if failures else 0)
+
+    if args.compare:
+        base_rev, head_rev = args.compare
+        with tempfile.TemporaryDirectory(prefix="bp_bench_") as workdir:
+            base = run_revision(base_rev, args.sizes, args.repeat, workdir)
+            head = run_revision(head_rev, args.sizes, args.repeat, workdir)
+        print_results(base, base_rev)
+        print_results(head, head_rev)
+        print_comparison(base, head, base_rev, head_rev)
+        results = {"base": {"rev": base_rev, "results": base}, "head": {"rev": head_rev, "results": head}}
+    else:
+        modules_dir = args.modules_dir or os.path.dirname(os.path.abspath(__file__))
+        sys.path.insert(0, modules_dir)
+        results = run_benchmarks(args.sizes, args.repeat)
+        if not args.quiet:
+            print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Cold-start benchmark of the one-shot CLI: interpreter start, imports and handler setup per command.
+
+Every run is a fresh interpreter that imports main and sets up the pipelines
+of one command (etc, bp, all) the way main.cli() does, without any network
+call. Reports wall time from process start to the end of setup, the time of
+the imports + setup alone, and which of the heavy modules got loaded.
+
+Usage:
+    python bench_startup.py                          # 15 cold starts per command
+    python bench_startup.py --runs 40 --json startup.json
+    python bench_startup.py --compare HEAD~1 HEAD    # same against two git revisions
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+COMMANDS = {"etc": ("etc",), "bp": ("bp",), "all": ("etc", "bp")}
+
+# Modules worth knowing about on a small VM: the ODBC driver, the HTTP stack and what only one pipeline needs
+WATCHED_MODULES = (
+    "pyodbc", "db_pool", "etc_handler_api", "bp_handler_api", "httpx", "dotenv", "sqlite3", "outbound_queue",
+    "scheduler", "xml.etree.ElementTree",
+)
+
+CHILD = """
+import sys, json, time
+started = time.perf_counter()
+import main
+if hasattr(main, "setup"):
+    main.load_env()
+    main.setup_logging()
+    main.setup({pipelines!r})
+# Older revisions build every handler when main is imported
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "setup_s": elapsed,
+    "modules": len(sys.modules),
+    "loaded": [name for name in {watched!r} if name in sys.modules],
+}}))
+"""
+
+
+def child_environ(workdir):
+    """Dummy credentials and endpoints: the handlers only read them in setup, nothing is contacted."""
+    environ = dict(os.environ)
+    environ.update({
+        "TOKEN_URL": "https://maersk.invalid/oauth2/token",
+        "BP_URL": "https://maersk.invalid/berth-plan",
+        "BP_XML_SEND_URL": "https://tc1.invalid/bp",
+        "ETC_URI": "https://tc1.invalid/etc",
+        "CLIENT_ID": "bench", "CLIENT_SECRET": "bench", "SCOPE": "bench", "CONSUMER_KEY": "bench",
+        "BP_XML_USER": "bench", "BP_XML_PASSWORD": "bench", "BP_TOKEN_EXP_DATA": "2099-12-31",
+        "ETC_AUTH_USER": "bench", "ETC_AUTH_PASSWORD": "bench",
+        "DB_DATA_SOURCE": "bench", "DB_INITIAL_CATALOG": "bench", "DB_USER_ID": "bench", "DB_PASSWORD": "bench",
+        "ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "METRICS_SUMMARY_FILE": os.path.join(workdir, "metrics_summary.json"),
+        "LOG_LEVEL": "WARNING",
+    })
+    environ.pop("OUTBOUND_QUEUE_PATH", None)
+    return environ
+
+
+def cold_start(modules_dir, pipelines, environ):
+    code = CHILD.format(pipelines=pipelines, watched=WATCHED_MODULES)
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-c", code], cwd=modules_dir, env=environ, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if process.returncode != 0:
+        raise RuntimeError(f"Cold start failed in {modules_dir}:\n{process.stderr}")
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result["wall_s"] = wall
+    return result
+
+
+def run_benchmarks(modules_dir, runs):
+    results = []
+    with tempfile.TemporaryDirectory(prefix="tc1_startup_") as workdir:
+        environ = child_environ(workdir)
+        # Bare interpreter start, the floor under every command
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, "-c", "pass"], env=environ, check=True)
+            samples.append(time.perf_counter() - started)
+        results.append({"command": "python -c pass", "wall_p50_ms": statistics.median(samples) * 1000,
+                        "wall_p95_ms": _p95(samples) * 1000, "setup_p50_ms": 0.0, "modules": None, "loaded": []})
+
+        for command, pipelines in COMMANDS.items():
+            cold_start(modules_dir, pipelines, environ)  # compiles the .pyc files
+            samples = [cold_start(modules_dir, pipelines, environ) for _ in range(runs)]
+            walls = [sample["wall_s"] for sample in samples]
+            results.append({
+                "command": command,
+                "wall_p50_ms": statistics.median(walls) * 1000,
+                "wall_p95_ms": _p95(walls) * 1000,
+                "setup_p50_ms": statistics.median(sample["setup_s"] for sample in samples) * 1000,
+                "modules": samples[-1]["modules"],
+                "loaded": samples[-1]["loaded"],
+            })
+    return results
+
+
+def _p95(values):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(0.95 * len(values) + 0.5) - 1)]
+
+
+def print_results(results, title=None):
+    if title:
+        print(f"\n== {title}")
+    print(f"{'command':<15}{'wall p50 ms':>13}{'wall p95 ms':>13}{'setup p50 ms':>14}{'modules':>9}  heavy modules loaded")
+    for row in results:
+        modules = "-" if row["modules"] is None else row["modules"]
+        print(f"{row['command']:<15}{row['wall_p50_ms']:>13.1f}{row['wall_p95_ms']:>13.1f}{row['setup_p50_ms']:>14.1f}"
+              f"{modules:>9}  {', '.join(row['loaded'])}")
+
+
+def print_comparison(base, head, base_rev, head_rev):
+    print(f"\n== {base_rev} -> {head_rev} (wall p50)")
+    head_rows = {row["command"]: row for row in head}
+    for row in base:
+        other = head_rows.get(row["command"])
+        if other and row["wall_p50_ms"]:
+            change = (other["wall_p50_ms"] - row["wall_p50_ms"]) / row["wall_p50_ms"] * 100
+            print(f"{row['command']:<15}{row['wall_p50_ms']:>10.1f} ms -> {other['wall_p50_ms']:>8.1f} ms  {change:+6.1f}%")
+
+
+def checkout_revision(rev, workdir):
+    """Extract the V1 modules of a git revision, returns their directory."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    repo_root = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"], capture_output=True, text=True, check=True, cwd=here
+    ).stdout.strip()
+    module_dir = os.path.relpath(here, repo_root)
+    checkout = os.path.join(workdir, rev.replace("/", "_").replace("~", "_").replace("^", "_"))
+    os.makedirs(checkout, exist_ok=True)
+    archive = subprocess.run(["git", "archive", rev, module_dir], capture_output=True, check=True, cwd=repo_root)
+    subprocess.run(["tar", "-x", "-C", checkout], input=archive.stdout, check=True)
+    return os.path.join(checkout, module_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cold start of the one-shot CLI per command")
+    parser.add_argument("--runs", type=int, default=15, help="Cold starts per command")
+    parser.add_argument("--json", help="Write the raw results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE_REV", "HEAD_REV"), help="Compare two git revisions")
+    args = parser.parse_args()
+
+    if args.compare:
+        base_rev, head_rev = args.compare
+        with tempfile.TemporaryDirectory(prefix="tc1_startup_rev_") as workdir:
+            base = run_benchmarks(checkout_revision(base_rev, workdir), args.runs)
+            head = run_benchmarks(checkout_revision(head_rev, workdir), args.runs)
+        print_results(base, base_rev)
+        print_results(head, head_rev)
+        print_comparison(base, head, base_rev, head_rev)
+        results = {"base": {"rev": base_rev, "results": base}, "head": {"rev": head_rev, "results": head}}
+    else:
+        results = run_benchmarks(os.path.dirname(os.path.abspath(__file__)), args.runs)
+        print_results(results)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import logging
+
+from xml_builder import format_datetime
+from bp_diff import berth_key, berth_fingerprint
+local_logger = logging.getLogger(__name__)
+
+STARBOARD_VALUES = {"1": True, "true": True, "0": False, "false": False, "": False}
+
+
+def _number(record, field, default=0):
+    # Missing fields take the API default; numeric strings are accepted, anything else is a bad record
+    value = record.get(field, default)
+    if type(value) is int or type(value) is float:
+        return value
+    if isinstance(value, bool) or value is None:
+        raise ValueError(f"{field} is {value!r}, expected a number")
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    raise ValueError(f"{field} is {value!r}, expected a number")
+
+
+def _timestamp(record, field):
+    value = record.get(field, "")
+    if type(value) is not str and value is not None:
+        raise ValueError(f"{field} is {value!r}, expected a timestamp string")
+    return format_datetime(value)
+
+
+def _starboard(record):
+    value = record.get("isStarboardBerth")
+    if value is None or isinstance(value, bool):
+        return bool(value)
+    starboard = STARBOARD_VALUES.get(str(value).strip().lower())
+    if starboard is None:
+        raise ValueError(f"isStarboardBerth is {value!r}, expected '1' or '0'")
+    return starboard
+
+
+class BerthCall:
+    """One Berth Plan record, parsed and validated once when the plan comes in.
+
+    Text fields hold exactly what the XML carries (str() of the API value,
+    "" when missing), timestamps are normalized with format_datetime(),
+    numbers are typed and the move total is precomputed. from_json() raises
+    ValueError for records the pipeline cannot use.
+    """
+
+    __slots__ = (
+        "voyage", "vessel_name", "vessel_code", "imo", "loa_text", "loa", "planned_bollard", "is_starboard",
+        "etb", "etd", "etc", "operator", "agency_key", "service_code", "service_name",
+        "discharge_moves", "load_moves", "restow_moves", "total_moves", "average_cranes", "key", "fingerprint",
+    )
+
+    @classmethod
+    def from_json(cls, record, fingerprint=False):
+        """Build from an API record; `fingerprint` also keeps the bp_diff fingerprint of the raw record."""
+        if not isinstance(record, dict):
+            raise ValueError(f"expected a JSON object, got {type(record).__name__}")
+        call = cls()
+        call.voyage = str(record.get("arrivalVoyage", ""))
+        call.vessel_name = str(record.get("vesselName", ""))
+        call.vessel_code = str(record.get("vesselCode", ""))
+        call.imo = str(record.get("imoCode", ""))
+        call.loa_text = str(record.get("vesselLOA", ""))
+        call.loa = _number(record, "vesselLOA", 0.0)
+        call.planned_bollard = record.get("plannedBollard", "")
+        call.is_starboard = _starboard(record)
+        call.etb = _timestamp(record, "etb")
+        call.etd = _timestamp(record, "etd")
+        call.etc = _timestamp(record, "etc")
+        call.operator = str(record.get("operatorCode", ""))
+        call.agency_key = record.get("operatorCode", "NOA")
+        call.service_code = str(record.get("service_Route", ""))
+        call.service_name = str(record.get("serviceName", ""))
+        call.discharge_moves = _number(record, "plannedDischargeMoves")
+        call.load_moves = _number(record, "plannedLoadMoves")
+        call.restow_moves = _number(record, "plannedShiftingMoves")
+        call.total_moves = call.load_moves + call.discharge_moves + call.restow_moves
+        call.average_cranes = _number(record, "averageCranes", 0.0)
+        # berth_key(record), from the fields already converted
+        call.key = f"{call.voyage}|{call.vessel_code}|{call.imo}"
+        call.fingerprint = berth_fingerprint(record) if fingerprint else None
+        return call
+
+    def __repr__(self):
+        return f"<BerthCall {self.key} {self.planned_bollard or '-'} {self.etb} -> {self.etd}>"
+
+
+def parse_berth_call(record, fingerprint=False, terminal=""):
+    """BerthCall of an API record, or None (logged) when the record is rejected."""
+    try:
+        return BerthCall.from_json(record, fingerprint)
+    except ValueError as e:
+        key = berth_key(record) if isinstance(record, dict) else "?"
+        local_logger.error("%s Berth Plan record %s rejected: %s", terminal, key, e)
+        return None
+
+
+def parse_berth_calls(records, fingerprint=False, terminal=""):
+    """BerthCalls of a list of API records and the number of rejected records."""
+    calls = []
+    for record in records:
+        call = parse_berth_call(record, fingerprint, terminal)
+        if call is not None:
+            calls.append(call)
+    return calls, len(records) - len(calls)
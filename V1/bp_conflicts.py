@@ -0,0 +1,65 @@
+from metrics import IntervalIndex
+import logging
+local_logger = logging.getLogger(__name__)
+
+
+def berth_calls(metrics, calls):
+    """(etb, etd, quay_low, quay_high, call) of every BerthCall with a real quay position and a time window.
+
+    Times are the normalized UTC strings of the XML, which sort chronologically.
+    Records on the mock position (no or unknown bollard) are all parked at
+    the quay end, so they are left out rather than reported against each other.
+    """
+    windows = []
+    for call in calls:
+        if not call.etb or not call.etd or call.etd <= call.etb:
+            continue
+        fore, aft, real = metrics.get_metrics(call.planned_bollard, call.loa, call.is_starboard)
+        if real and fore != aft:
+            windows.append((call.etb, call.etd, min(fore, aft), max(fore, aft), call))
+    return windows
+
+
+def _describe(call, low, high, etb, etd):
+    return {
+        "voyageNumber": call.voyage,
+        "vesselName": call.vessel_name,
+        "vesselCode": call.vessel_code,
+        "plannedBollard": call.planned_bollard,
+        "quay": [low, high],
+        "ETB": etb,
+        "ETD": etd,
+    }
+
+
+def find_conflicts(metrics, calls):
+    """Pairs of berth calls occupying overlapping quay metres at overlapping times.
+
+    IntervalIndex.overlapping_pairs() sweeps the ETB-ETD windows once, so only
+    calls alongside at the same time are compared: O(n log n) plus the pairs
+    overlapping in time, then the quay segments are checked. Conflicts come
+    in arrival order of the later call, then by quay position. Touching
+    segments or back-to-back windows are not conflicts.
+    """
+    windows = sorted(berth_calls(metrics, calls), key=lambda window: window[0])
+    by_time = IntervalIndex((etb, etd, seq) for seq, (etb, etd, _, _, _) in enumerate(windows))
+    pairs = [
+        (earlier, later) for earlier, later in by_time.overlapping_pairs()
+        if windows[earlier][2] < windows[later][3] and windows[later][2] < windows[earlier][3]
+    ]
+    pairs.sort(key=lambda pair: (pair[1], windows[pair[0]][2], pair[0]))
+
+    conflicts = []
+    for earlier, later in pairs:
+        other_etb, other_etd, other_low, other_high, other = windows[earlier]
+        etb, etd, low, high, call = windows[later]
+        conflicts.append({
+            "quay": [max(low, other_low), min(high, other_high)],
+            "from": max(etb, other_etb),
+            "to": min(etd, other_etd),
+            "berths": [
+                _describe(other, other_low, other_high, other_etb, other_etd),
+                _describe(call, low, high, etb, etd),
+            ],
+        })
+    return conflicts
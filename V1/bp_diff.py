@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import hashlib
+import traceback
+import logging
+
+from xml_builder import format_datetime
+local_logger = logging.getLogger(__name__)
+
+# Fields of a Berth Plan record that end up in the TC1 XML
+TEXT_FIELDS = ("arrivalVoyage", "vesselName", "vesselCode", "imoCode", "plannedBollard", "isStarboardBerth",
+               "operatorCode", "service_Route", "serviceName")
+NUMBER_FIELDS = ("vesselLOA", "plannedLoadMoves", "plannedDischargeMoves", "plannedShiftingMoves", "averageCranes")
+DATETIME_FIELDS = ("etb", "etd", "etc")
+
+
+def berth_key(berth):
+    return f"{berth.get('arrivalVoyage', '')}|{berth.get('vesselCode', '')}|{berth.get('imoCode', '')}"
+
+
+def berth_fingerprint(berth):
+    normalized = []
+    for field in TEXT_FIELDS:
+        value = berth.get(field)
+        normalized.append(value.strip() if isinstance(value, str) else value)
+    for field in NUMBER_FIELDS:
+        value = berth.get(field)
+        try:
+            normalized.append(round(float(value), 2) if value is not None else None)
+        except (TypeError, ValueError):
+            normalized.append(str(value))
+    for field in DATETIME_FIELDS:
+        value = berth.get(field)
+        normalized.append(format_datetime(value) if isinstance(value, str) else value)
+    return hashlib.sha1(json.dumps(normalized, default=str).encode("utf-8")).hexdigest()
+
+
+class BerthPlanSnapshot:
+    """Fingerprints of the last acknowledged Berth Plan, keyed by voyage, vessel code and IMO.
+
+    compare() reports what changed in a new plan; commit() makes that plan
+    the new reference once TC1 has it. The snapshot is kept in `path` so
+    one-shot runs can compare against the previous run.
+    """
+
+    def __init__(self, path=None, full_resync_seconds=86400.0):
+        self.path = path
+        self.full_resync_seconds = full_resync_seconds
+        self.window = None
+        self.fingerprints = {}
+        self.sent_at = 0.0
+        self._pending = None
+        if path:
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+            self.window = tuple(data["window"]) if data.get("window") else None
+            self.fingerprints = data["fingerprints"]
+            self.sent_at = float(data.get("sent_at", 0.0))
+        except Exception as e:
+            local_logger.warning("Ignoring unreadable Berth Plan snapshot %s: %s", self.path, e)
+            self.window, self.fingerprints, self.sent_at = None, {}, 0.0
+
+    def _save(self):
+        try:
+            tmp_file = f"{self.path}.tmp"
+            with open(tmp_file, "w") as file:
+                json.dump({"window": self.window, "fingerprints": self.fingerprints, "sent_at": self.sent_at}, file)
+            os.replace(tmp_file, self.path)
+        except Exception as e:
+            local_logger.error("Error writing Berth Plan snapshot: %s", str(traceback.format_exc()))
+
+    def compare(self, calls, start_date, end_date):
+        # BerthCall records parsed with fingerprint=True carry the fingerprint of their raw record
+        fingerprints = {call.key: call.fingerprint for call in calls}
+
+        added = sorted(key for key in fingerprints if key not in self.fingerprints)
+        removed = sorted(key for key in self.fingerprints if key not in fingerprints)
+        changed = sorted(
+            key for key, fingerprint in fingerprints.items()
+            if key in self.fingerprints and self.fingerprints[key] != fingerprint
+        )
+        window = (start_date, end_date)
+        window_changed = window != self.window
+        resync_due = time.time() - self.sent_at >= self.full_resync_seconds
+
+        self._pending = (window, fingerprints)
+        return {
+            "added": added,
+            "removed": removed,
+            "changed": changed,
+            "unchanged": len(fingerprints) - len(added) - len(changed),
+            "window_changed": window_changed,
+            "resync_due": resync_due,
+            "send": bool(added or removed or changed or window_changed or resync_due),
+        }
+
+    @property
+    def pending(self):
+        # The (window, fingerprints) of the last compare(), what commit() makes the reference
+        return self._pending
+
+    def commit(self, pending=None):
+        # `pending`: the state of a message acknowledged after later compare() calls (outbound queue)
+        if pending is None:
+            pending = self._pending
+        if pending is None:
+            return
+        self.window, self.fingerprints = pending
+        self.sent_at = time.time()
+        if pending is self._pending:
+            self._pending = None
+        if self.path:
+            self._save()
@@ -1,25 +1,33 @@
 import os
 import sys
 import json
+import time
 import asyncio
 import traceback
 from datetime import datetime, timedelta
 import logging
 import httpx
-from dotenv import load_dotenv
 
 from metrics import BerthMetricCalculator
-from xml_builder import xml_file_builder
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s | %(levelname)s | %(name)s | Line:%(lineno)d | %(message)s'
-)
+from xml_builder import xml_file_builder, iter_berth_plan_xml, aiter_berth_plan_xml
+from json_stream import aiter_json_array
+from token_manager import TokenManager, TokenError
+from http_client import HttpClientPool
+from bp_diff import BerthPlanSnapshot, berth_key
+from bp_conflicts import find_conflicts
+from berth_call import parse_berth_call, parse_berth_calls
+from terminals import DEFAULT_TERMINAL
+from log_config import setup_logging, LazyJson, truncate_body
+from env_config import load_env
+from archive import MessageArchive
+from instrumentation import (registry, stage_timer, record_send, payload_size, STAGE_SECONDS, PAYLOAD_BYTES,
+                             BP_FETCH_TOTAL, BP_CONFLICTS, BP_REJECTED, BP_UNKNOWN_BOLLARD)
 local_logger = logging.getLogger(__name__)
-load_dotenv()
+load_env()
 
 
 class BerthPlanHandler:
-    def __init__(self):
+    def __init__(self, token_manager=None, http_pool=None, terminal=None, archive=None):
         self.CLIENT_ID = os.getenv("CLIENT_ID")
         self.CLIENT_SECRET = os.getenv("CLIENT_SECRET")
         self.SCOPE = os.getenv("SCOPE")
@@ -48,93 +56,278 @@ class BerthPlanHandler:
             if value is None:
                 raise ValueError(f"Missing required environment variable: {key}")
 
-        self.current_date = datetime.now()
+        # Terminal code, quay geometry, agency mapping and send endpoint, see terminals.load_terminals()
+        self.terminal = terminal or DEFAULT_TERMINAL
+        self.terminal_code = self.terminal["code"]
+        self.send_url = self.terminal.get("send_url") or self.BP_XML_SEND_URL
+        self.agency_map = self.terminal.get("agency")
+        self.file_suffix = self.terminal.get("file_suffix", "")
+
         self.expiration_date = datetime.strptime(self.BP_TOKEN_EXP_DATA, "%Y-%m-%d")
+        self.refresh_window()
+
+        self.BP_DATA = []
+        self.plan_response = None
+        # (response, chunks) of a streamed plan handed out by metrics_handler(), see close_stream()
+        self._open_stream = None
+        self.metrics = BerthMetricCalculator(**self.terminal["quay"])
+        # Raw API responses and generated XML are kept in the (shared) message archive
+        self.archive = archive or MessageArchive.from_env()
+        # Streaming feeds the XML to the request body chunk by chunk instead of building one string
+        self.xml_streaming = os.getenv("BP_XML_STREAMING", "False").lower() == "true"
+        self.xml_pretty = os.getenv("BP_XML_PRETTY", "True").lower() == "true"
+
+        # BP_FETCH_SHARD_DAYS > 0 splits the date window into concurrently fetched shards
+        self.fetch_shard_days = int(os.getenv("BP_FETCH_SHARD_DAYS", 0))
+        self.fetch_concurrency = int(os.getenv("BP_FETCH_CONCURRENCY", 4))
+        self.fetch_shard_retries = int(os.getenv("BP_FETCH_SHARD_RETRIES", 2))
+        # Parse the response while it downloads and build the XML record by record (unsharded, no diff)
+        self.fetch_streaming = os.getenv("BP_FETCH_STREAMING", "False").lower() == "true"
+        self.archive_raw = os.getenv("BP_ARCHIVE_RAW", "True").lower() == "true"
+
+        # Quay / time overlaps between berth calls: "warn" logs them, "block" also holds the plan back
+        self.conflict_check = os.getenv("BP_CONFLICT_CHECK", "warn").lower()
+        if self.conflict_check not in ("off", "warn", "block"):
+            raise ValueError(f"Invalid BP_CONFLICT_CHECK: {self.conflict_check} (expected 'off', 'warn' or 'block')")
+        self.last_conflicts = []
+
+        # Skip the send when the plan is identical to the last one TC1 acknowledged
+        self.snapshot = None
+        self.last_diff = None
+        if os.getenv("BP_DIFF_ENABLED", "False").lower() == "true":
+            self.snapshot = BerthPlanSnapshot(
+                self.terminal_file(os.getenv("BP_SNAPSHOT_FILE", "BerthPlan_snapshot.json")),
+                full_resync_seconds=float(os.getenv("BP_FULL_RESYNC_SECONDS", 86400))
+            )
+        self.token_manager = token_manager or TokenManager(
+            self.TOKEN_URL, self.CLIENT_ID, self.CLIENT_SECRET, self.SCOPE,
+            refresh_margin=float(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", 60)),
+            cache_file=os.getenv("TOKEN_CACHE_FILE"),
+            cache_key=os.getenv("TOKEN_CACHE_KEY")
+        )
+
+        # A pool passed in by the caller is shared with other handlers and closed by its owner
+        self._owns_http_pool = http_pool is None
+        self.http_pool = http_pool or HttpClientPool()
+        self.http_pool.register("maersk_token", timeout=5.0)
+        self.http_pool.register("maersk_bp", timeout=30.0)
+        self.http_pool.register("tc1_bp", timeout=60.0)
+
+    def refresh_window(self):
+        # Recomputed on every cycle so a long-running process keeps a current date window
+        self.current_date = datetime.now()
         self.TOKEN_REMAINING_DAYS = (self.expiration_date - self.current_date).days
         self.TOKEN_MSG = f"Time Left Until Expiry: {self.TOKEN_REMAINING_DAYS} days"
 
         self.start_date = (self.current_date - timedelta(days=8)).strftime("%Y-%m-%d")
         self.end_date = (self.current_date + timedelta(days=40)).strftime("%Y-%m-%d")
-        self.params = {'terminal': 'MAPTMTM', 'fromDate': self.start_date, 'toDate': self.end_date}
-
-        self.BP_DATA = []
-        self.metrics = BerthMetricCalculator()
-
-
-    async def berthPlan_api_proxy(self):
-        local_logger.info(f"Berth Plan api params: {self.params}")
-        data = {
-            'grant_type': 'client_credentials',
-            'client_id': self.CLIENT_ID,
-            'client_secret': self.CLIENT_SECRET,
-            'scope': self.SCOPE
+        self.params = {'terminal': self.terminal_code, 'fromDate': self.start_date, 'toDate': self.end_date}
+
+    def terminal_file(self, filename):
+        # BerthPlan_snapshot.json -> BerthPlan_snapshot_<code>.json when several terminals share a directory
+        root, ext = os.path.splitext(filename)
+        return f"{root}{self.file_suffix}{ext}"
+
+
+    async def _get_berth_plan(self, params, stream=False):
+        # A rejected token is dropped and fetched again, once
+        for attempt in (1, 2):
+            # -----------check token---------------------
+            token = await self.token_manager.get_token(self.http_pool.client("maersk_token"))
+
+            # -----------getting berth data---------------------
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Consumer-Key": self.CONSUMER_KEY
+            }
+            client = self.http_pool.client("maersk_bp")
+            request = client.build_request("GET", self.BP_URL, params=params, headers=headers)
+            # With stream=True the body is left unread, the caller iterates and closes the response
+            data_response = await client.send(request, stream=stream)
+            if data_response.status_code == 401 and attempt == 1:
+                local_logger.warning("Berth Plan api rejected the cached token (401), refreshing and retrying once.")
+                if stream:
+                    await data_response.aclose()
+                self.token_manager.invalidate(token)
+                continue
+            return data_response
+
+    def shard_params(self):
+        # Consecutive windows share their boundary day, duplicates are removed when merging
+        date_format = "%Y-%m-%d"
+        start = datetime.strptime(self.start_date, date_format)
+        end = datetime.strptime(self.end_date, date_format)
+        shards = []
+        while start < end:
+            shard_end = min(start + timedelta(days=self.fetch_shard_days), end)
+            shards.append(dict(self.params, fromDate=start.strftime(date_format), toDate=shard_end.strftime(date_format)))
+            start = shard_end
+        return shards
+
+    async def _fetch_shard(self, params, semaphore):
+        shard = f"{params['fromDate']} → {params['toDate']}"
+        for attempt in range(1, self.fetch_shard_retries + 2):
+            try:
+                async with semaphore:
+                    data_response = await self._get_berth_plan(params)
+                if data_response.status_code == 200:
+                    return data_response.json()
+                local_logger.warning("Berth Plan shard %s failed with status code %s (attempt %s)", shard, data_response.status_code, attempt)
+            except TokenError:
+                raise
+            except Exception as e:
+                local_logger.warning("Berth Plan shard %s failed (attempt %s): %s", shard, attempt, e)
+            if attempt <= self.fetch_shard_retries:
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+        local_logger.error("Berth Plan shard %s failed after %s attempt(s), continuing without it.", shard, attempt)
+        return None
+
+    async def _sharded_berth_plan(self):
+        shards = self.shard_params()
+        semaphore = asyncio.Semaphore(self.fetch_concurrency)
+        tasks = [asyncio.create_task(self._fetch_shard(params, semaphore)) for params in shards]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # A shard that gives up the whole fetch (TokenError) stops its siblings too: none may
+            # keep using the HTTP clients once the cycle is over and they may be closed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        merged = []
+        seen = set()
+        for records in results:
+            for berth in records or []:
+                key = berth_key(berth)
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(berth)
+        if self.archive_raw:
+            await self.archive.write("BerthPlan_data", json.dumps(merged), ext="json", tag=self.terminal_code)
+        self.BP_DATA = self.parse_records(merged)
+
+        failed = sum(1 for records in results if records is None)
+        if not failed:
+            status = "success"
+        elif failed < len(shards):
+            status = "partial"
+        else:
+            status = "failed"
+        res_msg = {
+            "status": status,
+            "status_code": 200 if status != "failed" else 502,
+            "message": f"{len(shards) - failed}/{len(shards)} shard(s) of {self.fetch_shard_days} day(s) fetched, {len(self.BP_DATA)} berth call(s)",
+            "token_left_time": self.TOKEN_MSG
         }
+        if status == "success":
+            local_logger.info("Response info: %s", LazyJson(res_msg))
+        else:
+            local_logger.critical("Berth Plan fetch %s: %s", status, res_msg['message'])
+        return res_msg
+
+    def parse_records(self, records):
+        # Each record is parsed and validated once, the metrics/diff/conflict/XML stages use the BerthCalls
+        calls, rejected = parse_berth_calls(records, fingerprint=self.snapshot is not None, terminal=self.terminal_code)
+        if rejected:
+            registry.inc(BP_REJECTED, rejected, terminal=self.terminal_code)
+            local_logger.warning("%s Berth Plan: %s of %s record(s) rejected, see the errors above.",
+                                 self.terminal_code, rejected, len(records))
+        for call in calls:
+            self.check_bollard(call)
+        return calls
+
+    def check_bollard(self, call):
+        # Every cycle, per record: the bollard lookup itself is cached and only sees each string once
+        if self.metrics.unknown_bollard(call.planned_bollard):
+            registry.inc(BP_UNKNOWN_BOLLARD, terminal=self.terminal_code)
+            local_logger.warning("%s Berth Plan record %s: unknown bollard %r, using the mock position",
+                                 self.terminal_code, call.key, call.planned_bollard)
+
+    async def _aiter_berth_calls(self, records):
+        async for record in records:
+            call = parse_berth_call(record, terminal=self.terminal_code)
+            if call is None:
+                registry.inc(BP_REJECTED, terminal=self.terminal_code)
+                continue
+            self.check_bollard(call)
+            yield call
+
+    async def berthPlan_api_proxy(self, stream=False):
+        # With stream=True a successful response is left unread in self.plan_response, see _stream_fetched_xml()
+        local_logger.info("Berth Plan api params: %s", self.params)
 
         self.BP_DATA = []
+        self.plan_response = None
 
         try:
-            async with httpx.AsyncClient(verify=False) as client:
-                # -----------check token---------------------
-                token_response = await client.post(self.TOKEN_URL, data=data)
-                if token_response.status_code == 200:
-                    token_data = token_response.json()
-                    token = token_data.get('access_token')
-
-                    # -----------getting berth data---------------------
-                    headers = {
-                        "Authorization": f"Bearer {token}",
-                        "Consumer-Key": self.CONSUMER_KEY
-                    }
-
-                    async with httpx.AsyncClient(verify=False) as client:
-                        data_response = await client.get(self.BP_URL, params=self.params, headers=headers)
-
-                        if data_response.status_code == 200:
-                            self.BP_DATA = data_response.json()
-
-                            with open("BerthPlan_data.json", "w") as file:
-                                json.dump(self.BP_DATA, file, indent=4)
-
-                            res_msg = {
-                                "status": "success",
-                                "status_code": data_response.status_code,
-                                "message": "OK",
-                                "token_left_time": self.TOKEN_MSG
-                            }
-                            local_logger.info(f"Response info: {json.dumps(res_msg, indent=4)}")
-                            return res_msg
-                        else:
-                            res_msg = {
-                                "status": "failed",
-                                "status_code": data_response.status_code,
-                                "message": f"token_response:\n{token_response.text} \ndata_response:\n{data_response.text}",
-                                "token_left_time": self.TOKEN_MSG
-                            }
-                            local_logger.critical(f"Request failed with status code: {data_response.status_code}")
-                            local_logger.debug(f"Response content: {json.dumps(res_msg, indent=4)}")
-                            return res_msg
-
-                else:
-                    res_msg = {
-                        "status": "error",
-                        "status_code": token_response.status_code,
-                        "message": f"token_response:\n{token_response.text}",
-                        "token_left_time": self.TOKEN_MSG
-                    }
-                    local_logger.error(f'Request failed:{json.dumps(res_msg, indent=4)}')
-                    return res_msg
-
+            if self.fetch_shard_days > 0:
+                return await self._sharded_berth_plan()
+
+            data_response = await self._get_berth_plan(self.params, stream=stream)
+
+            if data_response.status_code == 200 and stream:
+                self.plan_response = data_response
+                res_msg = {
+                    "status": "success",
+                    "status_code": data_response.status_code,
+                    "message": "OK (streaming)",
+                    "token_left_time": self.TOKEN_MSG
+                }
+                local_logger.info("Response info: %s", LazyJson(res_msg))
+                return res_msg
+            elif data_response.status_code == 200:
+                self.BP_DATA = self.parse_records(data_response.json())
+                # The response body as received, no re-serialization
+                if self.archive_raw:
+                    await self.archive.write("BerthPlan_data", data_response.content, ext="json", tag=self.terminal_code)
+
+                res_msg = {
+                    "status": "success",
+                    "status_code": data_response.status_code,
+                    "message": "OK",
+                    "token_left_time": self.TOKEN_MSG
+                }
+                local_logger.info("Response info: %s", LazyJson(res_msg))
+                return res_msg
+            else:
+                if stream:
+                    await data_response.aread()
+                    await data_response.aclose()
+                res_msg = {
+                    "status": "failed",
+                    "status_code": data_response.status_code,
+                    "message": f"data_response:\n{truncate_body(data_response.text)}",
+                    "token_left_time": self.TOKEN_MSG
+                }
+                local_logger.critical("Request failed with status code: %s", data_response.status_code)
+                local_logger.debug("Response content: %s", LazyJson(res_msg))
+                return res_msg
+
+        except TokenError as e:
+            res_msg = {
+                "status": "error",
+                "status_code": e.status_code,
+                "message": f"token_response:\n{truncate_body(e.text)}",
+                "token_left_time": self.TOKEN_MSG
+            }
+            local_logger.error("Request failed:%s", LazyJson(res_msg))
+            return res_msg
         except Exception as e:
             err = traceback.format_exc()
             res_msg = {"status": "error", "status_code": 500, "message": str(err), "token_left_time": self.TOKEN_MSG}
-            local_logger.error(json.dumps(res_msg, indent=4))
+            local_logger.error("%s", LazyJson(res_msg))
             return res_msg
 
-    async def send_xml(self, xml_str: str) -> bool:
+    async def send_xml(self, xml_str) -> bool:
+        # xml_str may also be an async iterator of byte chunks, see metrics_handler(stream=True)
         if xml_str is None:
             raise ValueError("send_xml() error: 'xml_str' cannot be None. Please provide valid XML data before sending.")
         auth = (self.BP_XML_USER, self.BP_XML_PASSWORD)
         headers = {'Content-Type': 'text/xml'}
+        started = time.perf_counter()
+        status = "error"
 
         try:
             date_format = "%Y-%m-%d"
@@ -142,54 +335,219 @@ class BerthPlanHandler:
             end = datetime.strptime(self.end_date, date_format)
             diff_days = (end - start).days
 
-            local_logger.debug(f"Preparing to send BerthPlan XML data for {diff_days} day(s): {self.start_date} → {self.end_date}")
-
-            async with httpx.AsyncClient(verify=False, timeout=60.0) as client:
-                response = await client.post(
-                    self.BP_XML_SEND_URL,
-                    content=xml_str,
-                    auth=auth,
-                    headers=headers
-                )
-
-                response.raise_for_status()
-
-                msg = {
-                    "message": f"BerthPlan XML data successfully sent to {self.BP_XML_SEND_URL}",
-                    "info": f"Sent BerthPlan data for {diff_days} day(s), from {self.start_date} to {self.end_date}",
-                    "date_range": f"{self.start_date} to {self.end_date}",
-                    "response_status": f"{response.status_code} OK"
-                }
-                local_logger.info(f"\n{json.dumps(msg, indent=4)}")
-                return True
+            local_logger.debug("Preparing to send BerthPlan XML data for %s day(s): %s → %s",
+                               diff_days, self.start_date, self.end_date)
+
+            client = self.http_pool.client("tc1_bp")
+            response = await client.post(
+                self.send_url,
+                content=xml_str,
+                auth=auth,
+                headers=headers
+            )
+            status = str(response.status_code)
+
+            response.raise_for_status()
+
+            msg = {
+                "message": f"{self.terminal_code} BerthPlan XML data successfully sent to {self.send_url}",
+                "info": f"Sent BerthPlan data for {diff_days} day(s), from {self.start_date} to {self.end_date}",
+                "date_range": f"{self.start_date} to {self.end_date}",
+                "response_status": f"{response.status_code} OK"
+            }
+            local_logger.info("\n%s", LazyJson(msg))
+            return True
 
         except httpx.HTTPStatusError as e:
-            local_logger.error(f"HTTP error {e.response.status_code}: {e.response.text}")
+            local_logger.error("HTTP error %s: %s", e.response.status_code, truncate_body(e.response.text))
         except httpx.TimeoutException as e:
-            local_logger.error(f"Request timed out after 10 seconds: {e}")
+            local_logger.error("Request timed out after %s seconds: %s", self.http_pool.endpoints['tc1_bp']['timeout'], e)
         except httpx.RequestError as e:
-            local_logger.error(f"Request error: {e}")
+            local_logger.error("Request error: %s", e)
         except IOError as e:
-            local_logger.error(f"I/O error while handling file or response: {e}")
+            local_logger.error("I/O error while handling file or response: %s", e)
         except Exception as e:
-            local_logger.exception(f"Unexpected error occurred: {e}")
+            local_logger.exception("Unexpected error occurred: %s", e)
+        finally:
+            record_send("bp", status, time.perf_counter() - started, payload_size(xml_str), terminal=self.terminal_code)
 
         return False
 
-    async def metrics_handler(self):
+    async def _stream_xml(self, chunk_size=64 * 1024):
+        chunks = iter_berth_plan_xml(self.metrics, self.BP_DATA, self.start_date, self.end_date,
+                                     pretty=self.xml_pretty, chunk_size=chunk_size, agency_map=self.agency_map)
+        # Only the time spent producing chunks counts as xml_build, not the time waiting on the upload
+        build_seconds = 0.0
+        size = 0
+        archived = await self.archive.open_stream("APMT_BP", ext="xml", tag=self.terminal_code)
         try:
-            await self.berthPlan_api_proxy()
-
-            final_xml = await xml_file_builder(self.metrics, self.BP_DATA, self.start_date, self.end_date, local_logger)
-
-            with open("xml_file.xml", "w") as f:
-                f.write(final_xml)
+            while True:
+                started = time.perf_counter()
+                chunk = next(chunks, None)
+                build_seconds += time.perf_counter() - started
+                if chunk is None:
+                    break
+                size += len(chunk)
+                await archived.write(chunk)
+                yield chunk
+        finally:
+            await archived.close()
+        registry.observe(STAGE_SECONDS, build_seconds, stage="xml_build", terminal=self.terminal_code)
+        registry.observe(PAYLOAD_BYTES, size, message="bp", terminal=self.terminal_code)
+
+    async def _stream_fetched_xml(self, response, chunk_size=64 * 1024):
+        # Berth records are parsed as the response downloads and turned into XML one by one,
+        # the plan is never held in memory as a whole
+        raw = None
+        if self.archive_raw:
+            raw = await self.archive.open_stream("BerthPlan_data", ext="json", tag=self.terminal_code)
+
+        async def body():
+            async for chunk in response.aiter_bytes():
+                if raw is not None:
+                    await raw.write(chunk)
+                yield chunk
+
+        archived = await self.archive.open_stream("APMT_BP", ext="xml", tag=self.terminal_code)
+        size = 0
+        try:
+            calls = self._aiter_berth_calls(aiter_json_array(body()))
+            async for chunk in aiter_berth_plan_xml(self.metrics, calls, self.start_date, self.end_date,
+                                                    pretty=self.xml_pretty, chunk_size=chunk_size,
+                                                    agency_map=self.agency_map):
+                size += len(chunk)
+                await archived.write(chunk)
+                yield chunk
+        finally:
+            await response.aclose()
+            await archived.close()
+            if raw is not None:
+                await raw.close()
+        registry.observe(PAYLOAD_BYTES, size, message="bp", terminal=self.terminal_code)
+
+    async def metrics_handler(self, stream=None):
+        if stream is None:
+            stream = self.xml_streaming
+        # The change detection, a blocking conflict check and the merge of sharded fetches all need the whole plan
+        stream_fetch = (self.fetch_streaming and self.snapshot is None and self.fetch_shard_days <= 0
+                        and self.conflict_check != "block")
+        try:
+            # A previous cycle's stream that was never read would otherwise hold its connection forever
+            await self.close_stream()
+            self.refresh_window()
+            with stage_timer("bp_fetch", terminal=self.terminal_code):
+                fetch_result = await self.berthPlan_api_proxy(stream=stream_fetch)
+            registry.inc(BP_FETCH_TOTAL, terminal=self.terminal_code, status=fetch_result["status"])
+
+            if self.snapshot is not None and not self.plan_changed(fetch_result):
+                return None
+
+            # A plan parsed while it downloads is never held whole: in "warn" mode it is sent unchecked
+            if self.plan_response is None and not self.check_conflicts():
+                return None
+
+            if self.plan_response is not None:
+                response, self.plan_response = self.plan_response, None
+                chunks = self._stream_fetched_xml(response)
+                if stream:
+                    # Only closed by the generator itself once iterated: close_stream() covers a send
+                    # that fails before reading the body
+                    self._open_stream = (response, chunks)
+                    return chunks
+                return b"".join([chunk async for chunk in chunks]).decode("utf-8")
+
+            if stream:
+                return self._stream_xml()
+
+            with stage_timer("xml_build", terminal=self.terminal_code):
+                final_xml = await xml_file_builder(self.metrics, self.BP_DATA, self.start_date, self.end_date,
+                                                   local_logger, pretty=self.xml_pretty, agency_map=self.agency_map)
+
+            await self.archive.write("APMT_BP", final_xml, ext="xml", tag=self.terminal_code)
             return final_xml
         except Exception as e:
-            local_logger.error(f"Error generating XML data: {str(traceback.format_exc())}")
+            local_logger.error("Error generating XML data: %s", str(traceback.format_exc()))
+            await self.close_stream()
             return None
 
+    async def close_stream(self):
+        """Release a streamed Berth Plan response that was not read to the end.
+
+        Called once the XML returned by metrics_handler(stream=True) has been
+        sent or given up on: a send failing before it reads the body (connect
+        error, timeout, exception) never starts the generator, whose `finally`
+        would close the response, so its pooled connection would leak.
+        """
+        response, self.plan_response = self.plan_response, None
+        if self._open_stream is not None:
+            (response, chunks), self._open_stream = self._open_stream, None
+            await chunks.aclose()
+        if response is not None:
+            await response.aclose()
+
+    def plan_changed(self, fetch_result):
+        # A partial (sharded) plan is still compared, its missing calls count as removed
+        if fetch_result.get("status") not in ("success", "partial"):
+            local_logger.error("Berth Plan fetch failed, not comparing or sending an incomplete plan.")
+            return False
+
+        self.last_diff = self.snapshot.compare(self.BP_DATA, self.start_date, self.end_date)
+        diff = self.last_diff
+        local_logger.info(
+            "%s Berth Plan changes: %s added, %s removed, %s changed, %s unchanged%s%s",
+            self.terminal_code, len(diff['added']), len(diff['removed']), len(diff['changed']), diff['unchanged'],
+            ', new date window' if diff['window_changed'] else '', ', full resync due' if diff['resync_due'] else ''
+        )
+        for label in ("added", "removed", "changed"):
+            if diff[label]:
+                local_logger.debug("Berth calls %s: %s", label, diff[label])
+        if not diff["send"]:
+            local_logger.info("%s Berth Plan unchanged since the last acknowledged send, skipping.", self.terminal_code)
+        return diff["send"]
+
+    def check_conflicts(self):
+        """Validation before send_xml(); False when the plan must not be sent."""
+        if self.conflict_check == "off":
+            return True
+        with stage_timer("bp_conflicts", terminal=self.terminal_code):
+            self.last_conflicts = find_conflicts(self.metrics, self.BP_DATA)
+        if not self.last_conflicts:
+            return True
+
+        registry.inc(BP_CONFLICTS, len(self.last_conflicts), terminal=self.terminal_code)
+        local_logger.warning(
+            "%s Berth Plan has %s quay/time conflict(s) between berth calls:\n%s",
+            self.terminal_code, len(self.last_conflicts), LazyJson(self.last_conflicts[:50])
+        )
+        if self.conflict_check == "block":
+            local_logger.error("%s Berth Plan not sent because of the conflicts above (BP_CONFLICT_CHECK=block).",
+                               self.terminal_code)
+            return False
+        return True
+
+    def pending_state(self):
+        # The snapshot state commit_sent() records for the last generated message, kept with it while it is queued
+        return self.snapshot.pending if self.snapshot is not None else None
+
+    def commit_sent(self, pending=None):
+        # Called once a BerthPlan message has been acknowledged: by default the last generated one
+        if self.snapshot is not None:
+            self.snapshot.commit(pending)
+
+    async def aclose(self):
+        await self.close_stream()
+        if self._owns_http_pool:
+            await self.http_pool.aclose()
+
 
 if __name__ == "__main__":
-    handler = BerthPlanHandler()
-    asyncio.run(handler.metrics_handler())
+    setup_logging()
+
+    async def run():
+        handler = BerthPlanHandler()
+        try:
+            await handler.metrics_handler()
+        finally:
+            await handler.aclose()
+
+    asyncio.run(run())
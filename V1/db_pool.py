@@ -0,0 +1,164 @@
+import time
+import asyncio
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+local_logger = logging.getLogger(__name__)
+
+_EXHAUSTED = object()
+
+
+class OdbcConnectionPool:
+    """Runs blocking DB-API work on a bounded thread pool with reusable connections.
+
+    `connect` is any zero-argument callable returning a DB-API connection; by
+    default pyodbc.connect(connection_string) is used, imported on first use.
+    Connections are health-checked when they have been idle for
+    `health_check_after` seconds and recycled after `max_age` seconds or
+    `max_uses` checkouts. Connections are handed across worker threads, so a
+    stand-in such as sqlite3 must be created with check_same_thread=False.
+    """
+
+    def __init__(self, connection_string=None, connect=None, max_size=2, max_age=1800.0,
+                 max_uses=500, health_check_after=30.0, health_query="SELECT 1"):
+        if connect is None and connection_string is None:
+            raise ValueError("OdbcConnectionPool needs either a connection_string or a connect callable")
+        self.connection_string = connection_string
+        self._connect = connect or self._pyodbc_connect
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_uses = max_uses
+        self.health_check_after = health_check_after
+        self.health_query = health_query
+
+        self.stats = {"checkouts": 0, "opened": 0, "recycled": 0, "failed_health_checks": 0}
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._semaphore = None
+
+    def _pyodbc_connect(self):
+        import pyodbc
+        return pyodbc.connect(self.connection_string)
+
+    def _open(self):
+        cnxn = self._connect()
+        self.stats["opened"] += 1
+        now = time.monotonic()
+        return {"cnxn": cnxn, "created": now, "last_used": now, "uses": 0}
+
+    @staticmethod
+    def _close_quietly(entry):
+        try:
+            entry["cnxn"].close()
+        except Exception:
+            local_logger.debug("Ignoring error while closing a pooled connection: %s", traceback.format_exc())
+
+    def _is_healthy(self, entry):
+        try:
+            cursor = entry["cnxn"].cursor()
+            try:
+                cursor.execute(self.health_query)
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            return True
+        except Exception as e:
+            self.stats["failed_health_checks"] += 1
+            local_logger.warning("Pooled DB connection failed health check, reconnecting: %s", e)
+            return False
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                entry = self._idle.popleft() if self._idle else None
+            if entry is None:
+                return self._open()
+
+            now = time.monotonic()
+            if now - entry["created"] > self.max_age or entry["uses"] >= self.max_uses:
+                self.stats["recycled"] += 1
+                self._close_quietly(entry)
+                continue
+            if now - entry["last_used"] > self.health_check_after and not self._is_healthy(entry):
+                self._close_quietly(entry)
+                continue
+            return entry
+
+    def _checkin(self, entry):
+        entry["uses"] += 1
+        entry["last_used"] = time.monotonic()
+        with self._lock:
+            self._idle.append(entry)
+
+    def _run_blocking(self, fn, args):
+        entry = self._checkout()
+        self.stats["checkouts"] += 1
+        try:
+            result = fn(entry["cnxn"], *args)
+        except Exception:
+            # The connection may be in an unknown state, do not hand it out again
+            self._close_quietly(entry)
+            raise
+        self._checkin(entry)
+        return result
+
+    def _start_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_size, thread_name_prefix="odbc")
+            self._semaphore = asyncio.Semaphore(self.max_size)
+
+    async def run(self, fn, *args):
+        """Run fn(connection, *args) on a worker thread and return its result."""
+        self._start_executor()
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._run_blocking, fn, args)
+
+    def _discard(self, items, entry):
+        try:
+            items.close()
+        finally:
+            self._close_quietly(entry)
+
+    async def iterate(self, fn, *args):
+        """Yield the items of the generator fn(connection, *args), each one produced on a worker thread.
+
+        The connection stays checked out until the generator is exhausted, so a
+        cursor can be read batch by batch (fetchmany) while the caller consumes
+        the batches, without holding the whole result set.
+        """
+        self._start_executor()
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            entry = await loop.run_in_executor(self._executor, self._checkout)
+            self.stats["checkouts"] += 1
+            items = fn(entry["cnxn"], *args)
+            try:
+                while True:
+                    item = await loop.run_in_executor(self._executor, next, items, _EXHAUSTED)
+                    if item is _EXHAUSTED:
+                        break
+                    yield item
+            except BaseException:
+                # Failed or abandoned mid-way: the cursor may still hold pending rows, drop the connection
+                await loop.run_in_executor(self._executor, self._discard, items, entry)
+                raise
+            self._checkin(entry)
+
+    def _shutdown(self, executor):
+        # Queries still running check their connection in before the idle ones are closed
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._lock:
+            entries = list(self._idle)
+            self._idle.clear()
+        for entry in entries:
+            self._close_quietly(entry)
+
+    async def close(self):
+        executor, self._executor, self._semaphore = self._executor, None, None
+        # Off the event loop: waiting for a running query must not stall the other pipelines
+        await asyncio.to_thread(self._shutdown, executor)
@@ -0,0 +1,18 @@
+import logging
+local_logger = logging.getLogger(__name__)
+
+_loaded = False
+
+
+def load_env():
+    """Load .env into os.environ once per process; variables already set win, as with load_dotenv().
+
+    Called by main before logging is configured and by the handler modules
+    when they run on their own; python-dotenv is only imported here.
+    """
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    from dotenv import load_dotenv
+    load_dotenv()
@@ -1,24 +1,51 @@
-import json
 import sys
-import pyodbc
 import traceback
 import asyncio
 import os
+import time
 from datetime import datetime
+from contextlib import aclosing
 # import requests
 import httpx
-from dotenv import load_dotenv
+
+from http_client import HttpClientPool
+from db_pool import OdbcConnectionPool
+from xml_builder import etc_xml_builder, etc_envelope_xml, aiter_etc_xml
+from instrumentation import stage_timer, record_send, payload_size
+from log_config import setup_logging, LazyJson
+from env_config import load_env
 import logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s | %(levelname)s | %(name)s | Line:%(lineno)d | %(message)s'
-)
 local_logger = logging.getLogger(__name__)
 
-load_dotenv()
+load_env()
+
+ETC_CTE = """
+WITH cte AS (
+    SELECT a.est_move_time, b.id, lloyds_id, name
+    FROM Sparcsn4.dbo.inv_wi a
+    INNER JOIN Sparcsn4.dbo.argo_carrier_visit b ON a.carrier_locid = b.id
+    LEFT OUTER JOIN argo_visit_details c ON c.gkey = b.cvcvd_gkey
+    LEFT OUTER JOIN vsl_vessel_visit_details d ON d.vvd_gkey = c.gkey
+    LEFT OUTER JOIN vsl_vessels e ON e.gkey = d.vessel_gkey
+    WHERE a.move_kind IN ('LOAD', 'DSCH')
+    AND a.move_stage NOT LIKE '%COMPLETE%'
+    AND b.phase = '40WORKING'
+)
+"""
+
+ETC_ROWS_QUERY = ETC_CTE + """
+SELECT id AS visitId,
+    RIGHT(id, LEN(id) - 3) AS voyageNumber,
+    name AS vesselName,
+    LEFT(id, 3) AS vesselCode,
+    lloyds_id AS IMO,
+    MAX(CONVERT(varchar, est_move_time, 126) + '.000' + DATENAME(tz, SYSDATETIMEOFFSET())) AS ETC
+FROM cte
+GROUP BY id, lloyds_id, name;
+"""
 
 class EtcHandler:
-    def __init__(self):
+    def __init__(self, http_pool=None, db_pool=None):
         required_vars = [
             "DB_DATA_SOURCE",
             "DB_INITIAL_CATALOG",
@@ -43,129 +70,271 @@ class EtcHandler:
         self.port = int(os.getenv("DB_PORT", 1433))
         self.MultipleActiveResultSets = os.getenv("DB_MARS", "True").lower() == "true"
 
-        self.cnxn = None
-        self.cursor = None
+        # "full" sends every working visit each cycle, "incremental" only the visits whose ETC changed
+        self.mode = os.getenv("ETC_MODE", "full").lower()
+        if self.mode not in ("full", "incremental"):
+            raise ValueError(f"Invalid ETC_MODE: {self.mode} (expected 'full' or 'incremental')")
+        self.full_resync_seconds = float(os.getenv("ETC_FULL_RESYNC_SECONDS", 3600))
+        # "sql" lets sparcsN4 render the document with FOR XML, "service" fetches plain rows and renders it here
+        self.render = os.getenv("ETC_RENDER", "sql").lower()
+        if self.render not in ("sql", "service"):
+            raise ValueError(f"Invalid ETC_RENDER: {self.render} (expected 'sql' or 'service')")
+        self.fetch_batch_size = int(os.getenv("ETC_FETCH_BATCH_SIZE", 500))
+        self.last_sent_etc = {}
+        self.last_full_sync = float("-inf")
+        self._pending = None
+
+        # Connections are reused across cycles and all blocking ODBC calls run off the event loop
+        self.db_pool = db_pool or OdbcConnectionPool(
+            self.connection_string(),
+            max_size=int(os.getenv("DB_POOL_SIZE", 2)),
+            max_age=float(os.getenv("DB_POOL_MAX_AGE_SECONDS", 1800)),
+            health_check_after=float(os.getenv("DB_POOL_HEALTH_CHECK_SECONDS", 30))
+        )
+
+        # A pool passed in by the caller is shared with other handlers and closed by its owner
+        self._owns_http_pool = http_pool is None
+        self.http_pool = http_pool or HttpClientPool()
+        self.http_pool.register("tc1_etc", timeout=5.0)
+
+    def connection_string(self):
+        return (
+            f'DRIVER={{ODBC Driver 17 for SQL Server}};'
+            f'SERVER={self.Data_Source};'
+            f'DATABASE={self.Initial_Catalog};'
+            f'UID={self.User_ID};'
+            f'PWD={self.Password}'
+        )
 
     async def sqlConnection(self):
+        # Opens (or health-checks) a pooled connection ahead of the first read
         try:
-            connection_string = (
-                f'DRIVER={{ODBC Driver 17 for SQL Server}};'
-                f'SERVER={self.Data_Source};'
-                f'DATABASE={self.Initial_Catalog};'
-                f'UID={self.User_ID};'
-                f'PWD={self.Password}'
-            )
-            self.cnxn = pyodbc.connect(connection_string)
-            self.cursor = self.cnxn.cursor()
+            await self.db_pool.run(lambda cnxn: None)
             return 1
         except Exception as e:
-            local_logger.error(f"Error during connection: {str(traceback.format_exc())}")
+            local_logger.error("Error during connection: %s", str(traceback.format_exc()))
             return 0
 
     async def closeSqlConnection(self):
         try:
-            if self.cursor:
-                self.cursor.close()
-            if self.cnxn:
-                self.cnxn.close()
+            await self.db_pool.close()
             return 1
         except Exception as e:
-            local_logger.error(f"Error closing connection: {str(traceback.format_exc())}")
+            local_logger.error("Error closing connection: %s", str(traceback.format_exc()))
             return 0
 
+    @staticmethod
+    def _fetch_etc_blob(cnxn):
+        sql_query = ETC_CTE + """
+        SELECT (
+            SELECT '1.0' AS msgVersion,
+                CONVERT(varchar, GETDATE(), 126) + DATENAME(tz, SYSDATETIMEOFFSET()) AS GenerationTime,
+                'APMT' AS sender,
+                'TerminalComercialOperationETC' AS msgFunction
+            FOR XML PATH('header'), TYPE
+        ), (
+            SELECT RIGHT(id, LEN(id) - 3) AS voyageNumber,
+                name AS vesselName,
+                LEFT(id, 3) AS vesselCode,
+                lloyds_id AS IMO,
+                MAX(CONVERT(varchar, est_move_time, 126) + '.000' + DATENAME(tz, SYSDATETIMEOFFSET())) AS ETC
+            FROM cte
+            GROUP BY id, lloyds_id, name
+            FOR XML PATH('comercialOperation'), TYPE, ELEMENTS
+        ) AS 'body/comercialOperations'
+        FOR XML PATH(''), ROOT('TerminalComercialOperation');
+        """
+        cursor = cnxn.cursor()
+        try:
+            cursor.execute(sql_query)
+            result = cursor.fetchone()
+            return result[0] if result else None
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _iter_etc_rows(cnxn, batch_size):
+        # Default (forward-only, read-only) result set: rows are streamed to the client as
+        # fetchmany() asks for them, without an API cursor or the whole result set in memory
+        cursor = cnxn.cursor()
+        try:
+            cursor.execute(ETC_ROWS_QUERY)
+            columns = [column[0] for column in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [dict(zip(columns, row)) for row in rows]
+        finally:
+            cursor.close()
+
+    async def iter_row_batches(self):
+        """ETC rows in batches of ETC_FETCH_BATCH_SIZE, read from one pooled connection."""
+        # aclosing(): a consumer that stops early releases the connection right away
+        async with aclosing(self.db_pool.iterate(self._iter_etc_rows, self.fetch_batch_size)) as batches:
+            async for rows in batches:
+                yield rows
+
     async def read_data(self):
         try:
-            if await self.sqlConnection():
-                sql_query = """
-                WITH cte AS (
-                    SELECT a.est_move_time, b.id, lloyds_id, name
-                    FROM Sparcsn4.dbo.inv_wi a
-                    INNER JOIN Sparcsn4.dbo.argo_carrier_visit b ON a.carrier_locid = b.id
-                    LEFT OUTER JOIN argo_visit_details c ON c.gkey = b.cvcvd_gkey
-                    LEFT OUTER JOIN vsl_vessel_visit_details d ON d.vvd_gkey = c.gkey
-                    LEFT OUTER JOIN vsl_vessels e ON e.gkey = d.vessel_gkey
-                    WHERE a.move_kind IN ('LOAD', 'DSCH')
-                    AND a.move_stage NOT LIKE '%COMPLETE%'
-                    AND b.phase = '40WORKING'
-                )
-                SELECT (
-                    SELECT '1.0' AS msgVersion,
-                        CONVERT(varchar, GETDATE(), 126) + DATENAME(tz, SYSDATETIMEOFFSET()) AS GenerationTime,
-                        'APMT' AS sender,
-                        'TerminalComercialOperationETC' AS msgFunction
-                    FOR XML PATH('header'), TYPE
-                ), (
-                    SELECT RIGHT(id, LEN(id) - 3) AS voyageNumber,
-                        name AS vesselName,
-                        LEFT(id, 3) AS vesselCode,
-                        lloyds_id AS IMO,
-                        MAX(CONVERT(varchar, est_move_time, 126) + '.000' + DATENAME(tz, SYSDATETIMEOFFSET())) AS ETC
-                    FROM cte
-                    GROUP BY id, lloyds_id, name
-                    FOR XML PATH('comercialOperation'), TYPE, ELEMENTS
-                ) AS 'body/comercialOperations'
-                FOR XML PATH(''), ROOT('TerminalComercialOperation');
-                """
-
-                self.cursor.execute(sql_query)
-                result = self.cursor.fetchone()
-                return result[0] if result else None
-            else:
-                local_logger.error("Failed to establish database connection")
+            with stage_timer("etc_sql", query="blob"):
+                return await self.db_pool.run(self._fetch_etc_blob)
+        except Exception as e:
+            local_logger.error("Error during data fetch: %s", str(traceback.format_exc()))
+            return None
+
+    async def read_rows(self):
+        try:
+            with stage_timer("etc_sql", query="rows"):
+                rows = []
+                async for batch in self.iter_row_batches():
+                    rows.extend(batch)
+                return rows
+        except Exception as e:
+            local_logger.error("Error during data fetch: %s", str(traceback.format_exc()))
+            return None
+
+    async def render_etc_xml(self):
+        # Fetching and rendering overlap, one batch at a time; nothing is sent before the last row
+        row_count = 0
+
+        async def counted_batches():
+            nonlocal row_count
+            async for rows in self.iter_row_batches():
+                row_count += len(rows)
+                yield rows
+
+        try:
+            with stage_timer("etc_sql", query="stream"):
+                chunks = [chunk async for chunk in aiter_etc_xml(counted_batches())]
+            if not row_count:
+                # An envelope without operations is not sent, as with the sql render
+                local_logger.warning("No XML data to save.")
                 return None
+            return b"".join(chunks).decode("utf-8")
         except Exception as e:
-            local_logger.error(f"Error during data fetch: {str(traceback.format_exc())}")
+            local_logger.error("Error during data fetch: %s", str(traceback.format_exc()))
             return None
-        finally:
-            await self.closeSqlConnection()
 
     async def get_etc_xml(self):
+        """The ETC SOAP envelope to send, or None when there is nothing to send."""
+        if self.mode == "incremental":
+            return await self.get_incremental_etc_xml()
+        if self.render == "service":
+            return await self.render_etc_xml()
         try:
             xml_data = await self.read_data()
 
-            if not xml_data:
+            # FOR XML still returns the header when no visit is working; that document is not sent either
+            if not xml_data or "<comercialOperation>" not in xml_data:
                 local_logger.warning("No XML data to save.")
                 return None
-            return xml_data
+            return etc_envelope_xml(xml_data)
+        except Exception as e:
+            local_logger.error("Error generating XML data: %s", str(traceback.format_exc()))
+            return None
+
+    async def get_incremental_etc_xml(self):
+        # Only visits whose ETC moved since the last sent message, plus a periodic full resync
+        try:
+            self._pending = None
+            rows = await self.read_rows()
+            if rows is None:
+                return None
+
+            full_sync = time.monotonic() - self.last_full_sync >= self.full_resync_seconds
+            if full_sync:
+                changed = rows
+            else:
+                changed = [row for row in rows if self.last_sent_etc.get(row["visitId"]) != row["ETC"]]
+
+            local_logger.info(
+                "ETC %s: %s of %s working visit(s) to send",
+                'full resync' if full_sync else 'incremental', len(changed), len(rows)
+            )
+            if not changed:
+                return None
+
+            self._pending = (changed, full_sync)
+            return await etc_xml_builder(changed)
         except Exception as e:
-            local_logger.error(f"Error generating XML data: {str(traceback.format_exc())}")
+            local_logger.error("Error generating XML data: %s", str(traceback.format_exc()))
             return None
 
+    def pending_state(self):
+        # The state commit_sent() records for the last generated message, kept with it while it is queued
+        return self._pending
+
+    def commit_sent(self, pending=None):
+        # Called once an ETC message has been delivered: by default the last generated one, or the
+        # pending_state() taken when a queued message was built
+        if pending is None:
+            pending = self._pending
+        if pending is None:
+            return
+        rows, full_sync = pending
+        if full_sync:
+            self.last_sent_etc = {}
+            self.last_full_sync = time.monotonic()
+        for row in rows:
+            self.last_sent_etc[row["visitId"]] = row["ETC"]
+        if pending is self._pending:
+            self._pending = None
+
     async def send_xml(self, xml_str: str):
         if xml_str is None:
             raise ValueError("send_xml() error: 'xml_str' cannot be None. Please provide valid XML data before sending.")
         ETC_auth = (self.ETC_AUTH_USER, self.ETC_AUTH_PASSWORD)
+        started = time.perf_counter()
+        status = "error"
         try:
-            async with httpx.AsyncClient(verify=False) as client:
-                response = await client.post(
-                    self.ETC_URI, 
-                    content=xml_str, 
-                    auth=ETC_auth, 
-                    headers={'Content-Type': 'text/xml'}
-                )
-                response.raise_for_status()
-                msg = {
-                    "message": f"ETC XML data successfully sent to {self.ETC_URI}",
-                    "response_status": f"{response.status_code} OK"
-                }
-                local_logger.info(f"\n{json.dumps(msg, indent=4)}")
-                local_logger.info(f"ETC XML file successfully sent to {self.ETC_URI}. Response status code: {response.status_code}")
+            client = self.http_pool.client("tc1_etc")
+            response = await client.post(
+                self.ETC_URI, 
+                content=xml_str, 
+                auth=ETC_auth, 
+                headers={'Content-Type': 'text/xml'}
+            )
+            status = str(response.status_code)
+            response.raise_for_status()
+            msg = {
+                "message": f"ETC XML data successfully sent to {self.ETC_URI}",
+                "response_status": f"{response.status_code} OK"
+            }
+            local_logger.info("\n%s", LazyJson(msg))
+            local_logger.info("ETC XML file successfully sent to %s. Response status code: %s", self.ETC_URI, response.status_code)
+            return True
 
         except httpx.HTTPStatusError as e:
-            local_logger.error(f"HTTP error occurred: {e}")
+            local_logger.error("HTTP error occurred: %s", e)
         except httpx.RequestError as e:
-            local_logger.error(f"An error occurred while requesting: {e}")
+            local_logger.error("An error occurred while requesting: %s", e)
         except IOError as e:
-            local_logger.error(f"An error occurred while saving the file: {e}")
+            local_logger.error("An error occurred while saving the file: %s", e)
         except Exception as e:
-            local_logger.error(f"An unexpected error occurred: {e}")
+            local_logger.error("An unexpected error occurred: %s", e)
+        finally:
+            record_send("etc", status, time.perf_counter() - started, payload_size(xml_str))
 
         return False
 
+    async def aclose(self):
+        await self.closeSqlConnection()
+        if self._owns_http_pool:
+            await self.http_pool.aclose()
+
 if __name__ == '__main__':
-    db_obj = EtcHandler()
+    setup_logging()
+
+    async def run():
+        db_obj = EtcHandler()
+        try:
+            return await db_obj.get_etc_xml()
+        finally:
+            await db_obj.aclose()
+
     try:
-        xml_file = asyncio.run(db_obj.get_etc_xml())
+        xml_file = asyncio.run(run())
         print(xml_file)
     except Exception as e:
         print(str(traceback.format_exc()))
@@ -0,0 +1,96 @@
+import os
+import logging
+import httpx
+local_logger = logging.getLogger(__name__)
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HttpClientPool:
+    """One long-lived httpx.AsyncClient per named endpoint.
+
+    Each client keeps its connections alive between requests, so repeated
+    sends to the same endpoint skip DNS, TCP and TLS setup. Limits and
+    timeouts can be overridden per endpoint with HTTP_<NAME>_TIMEOUT,
+    HTTP_<NAME>_MAX_CONNECTIONS and HTTP_<NAME>_MAX_KEEPALIVE.
+    """
+
+    def __init__(self, http2=None, verify=False, transport=None):
+        if http2 is None:
+            http2 = os.getenv("HTTP2_ENABLED", "True").lower() == "true"
+        if http2 and not _http2_available():
+            local_logger.debug("Package 'h2' not installed, falling back to HTTP/1.1 keep-alive.")
+            http2 = False
+        self.http2 = http2
+        self.verify = verify
+        self.transport = transport
+        self.keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))
+
+        self.endpoints = {}
+        self.clients = {}
+        self.stats = {}
+
+    def register(self, name, timeout=5.0, max_connections=10, max_keepalive=5):
+        prefix = f"HTTP_{name.upper()}_"
+        self.endpoints[name] = {
+            "timeout": float(os.getenv(prefix + "TIMEOUT", timeout)),
+            "max_connections": int(os.getenv(prefix + "MAX_CONNECTIONS", max_connections)),
+            "max_keepalive": int(os.getenv(prefix + "MAX_KEEPALIVE", max_keepalive)),
+        }
+        self.stats.setdefault(name, {"requests": 0, "new_connections": 0, "tls_handshakes": 0})
+
+    def client(self, name):
+        client = self.clients.get(name)
+        if client is None or client.is_closed:
+            if name not in self.endpoints:
+                self.register(name)
+            config = self.endpoints[name]
+            client = httpx.AsyncClient(
+                verify=self.verify,
+                http2=self.http2,
+                timeout=config["timeout"],
+                limits=httpx.Limits(
+                    max_connections=config["max_connections"],
+                    max_keepalive_connections=config["max_keepalive"],
+                    keepalive_expiry=self.keepalive_expiry
+                ),
+                transport=self.transport,
+                event_hooks={"request": [self._request_hook(name)]}
+            )
+            self.clients[name] = client
+        return client
+
+    def _request_hook(self, name):
+        stats = self.stats[name]
+
+        async def trace(event_name, info):
+            # httpcore reports every new connection; anything else was served from the pool
+            if event_name == "connection.connect_tcp.complete":
+                stats["new_connections"] += 1
+            elif event_name == "connection.start_tls.complete":
+                stats["tls_handshakes"] += 1
+
+        async def on_request(request):
+            stats["requests"] += 1
+            request.extensions["trace"] = trace
+
+        return on_request
+
+    def connection_stats(self):
+        summary = {}
+        for name, stats in self.stats.items():
+            reused = max(stats["requests"] - stats["new_connections"], 0)
+            summary[name] = dict(stats, reused_connections=reused)
+        return summary
+
+    async def aclose(self):
+        for name, client in self.clients.items():
+            if not client.is_closed:
+                await client.aclose()
+        self.clients = {}
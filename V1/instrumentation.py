@@ -0,0 +1,201 @@
+import json
+import time
+import bisect
+import asyncio
+import threading
+import traceback
+from contextlib import contextmanager
+import logging
+local_logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+BYTES_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 * 1024, 5 * 1024 * 1024, 20 * 1024 * 1024)
+
+STAGE_SECONDS = "tc1_stage_duration_seconds"
+STAGE_ERRORS = "tc1_stage_errors_total"
+PAYLOAD_BYTES = "tc1_payload_bytes"
+SEND_SECONDS = "tc1_send_duration_seconds"
+SEND_TOTAL = "tc1_send_total"
+BP_FETCH_TOTAL = "tc1_bp_fetch_total"
+BP_CONFLICTS = "tc1_bp_conflicts_total"
+BP_REJECTED = "tc1_bp_rejected_records_total"
+BP_UNKNOWN_BOLLARD = "tc1_bp_unknown_bollard_total"
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    escaped = (
+        name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in items
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class MetricsRegistry:
+    """In-process counters and histograms, rendered in the Prometheus text format.
+
+    Series are keyed by metric name and label values. Histograms also keep
+    min / max so the one-shot JSON summary can show the slowest observation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def counter(self, name, help_text):
+        self._meta[name] = ("counter", help_text, None)
+
+    def histogram(self, name, help_text, buckets=SECONDS_BUCKETS):
+        self._meta[name] = ("histogram", help_text, tuple(buckets))
+
+    def inc(self, name, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = self._meta[name][2]
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                state = series[key] = {"buckets": [0] * len(buckets), "count": 0, "sum": 0.0, "min": value, "max": value}
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                state["buckets"][index] += 1
+            state["count"] += 1
+            state["sum"] += value
+            state["min"] = min(state["min"], value)
+            state["max"] = max(state["max"], value)
+
+    @contextmanager
+    def timer(self, name, errors=None, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            if errors:
+                self.inc(errors, **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in self._meta.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for key, value in self._counters.get(name, {}).items():
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+                    continue
+                for key, state in self._histograms.get(name, {}).items():
+                    cumulative = 0
+                    for bound, count in zip(buckets, state["buckets"]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', repr(float(bound)))])} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {state['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {state['sum']}")
+                    lines.append(f"{name}_count{_format_labels(key)} {state['count']}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        result = {}
+        with self._lock:
+            for name, series in self._counters.items():
+                result[name] = [dict(key, value=value) for key, value in series.items()]
+            for name, series in self._histograms.items():
+                result[name] = [
+                    dict(key, count=state["count"], sum=round(state["sum"], 6),
+                         mean=round(state["sum"] / state["count"], 6), min=state["min"], max=state["max"])
+                    for key, state in series.items()
+                ]
+        return result
+
+
+registry = MetricsRegistry()
+registry.histogram(STAGE_SECONDS, "Duration of pipeline stages (token_fetch, bp_fetch, bp_conflicts, etc_sql, xml_build, *_pipeline).")
+registry.counter(STAGE_ERRORS, "Pipeline stages that raised.")
+registry.histogram(PAYLOAD_BYTES, "Size of the XML messages sent to TC1.", BYTES_BUCKETS)
+registry.histogram(SEND_SECONDS, "Latency of the TC1 send requests.")
+registry.counter(SEND_TOTAL, "TC1 send requests by HTTP status, \"error\" when no response came back.")
+registry.counter(BP_FETCH_TOTAL, "Berth Plan fetches by result status.")
+registry.counter(BP_CONFLICTS, "Quay / time conflicts found in the Berth Plans before sending.")
+registry.counter(BP_REJECTED, "Berth Plan records rejected as invalid when the plan is parsed.")
+registry.counter(BP_UNKNOWN_BOLLARD, "Berth Plan records with an unknown or malformed planned bollard, sent at the mock position.")
+
+
+def stage_timer(stage, **labels):
+    return registry.timer(STAGE_SECONDS, errors=STAGE_ERRORS, stage=stage, **labels)
+
+
+def payload_size(payload):
+    if isinstance(payload, str):
+        return len(payload.encode("utf-8"))
+    if isinstance(payload, (bytes, bytearray)):
+        return len(payload)
+    # Streamed bodies are measured by their producer
+    return None
+
+
+def record_send(message, status, seconds, size=None, **labels):
+    registry.observe(SEND_SECONDS, seconds, message=message, **labels)
+    registry.inc(SEND_TOTAL, message=message, status=status, **labels)
+    if size is not None:
+        registry.observe(PAYLOAD_BYTES, size, message=message, **labels)
+
+
+def write_summary(path):
+    summary = registry.summary()
+    try:
+        with open(path, "w") as file:
+            json.dump(summary, file, indent=4)
+        local_logger.info("Metrics summary written to %s", path)
+    except Exception as e:
+        local_logger.error("Error writing metrics summary: %s", str(traceback.format_exc()))
+    return summary
+
+
+async def _handle_request(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Headers are not used, read them so the client sees a clean response
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", registry.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            status, body, content_type = "404 Not Found", b"Not Found\n", "text/plain; charset=utf-8"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(host, port, stop_event):
+    """Serve GET /metrics until stop_event is set; used as a daemon-mode scheduler service."""
+    server = await asyncio.start_server(_handle_request, host, port)
+    local_logger.info("Metrics endpoint listening on http://%s:%s/metrics", host, port)
+    try:
+        await stop_event.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
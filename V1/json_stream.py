@@ -0,0 +1,77 @@
+import re
+import json
+import codecs
+
+WHITESPACE = re.compile(r"\s*")
+
+
+class JsonArrayParser:
+    """Incremental parser for a top-level JSON array, fed with text as it arrives.
+
+    feed() returns the elements completed by the new text; close() checks
+    that the array was terminated. Only the unparsed tail is kept in memory.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._state = "start"  # start -> first -> value <-> separator -> done
+
+    def feed(self, text):
+        buffer = self._buffer + text
+        pos = 0
+        items = []
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            char = buffer[pos]
+            if self._state == "start":
+                if char != "[":
+                    raise ValueError(f"Expected a JSON array, got {buffer[pos:pos + 40]!r}")
+                self._state = "first"
+                pos += 1
+            elif self._state in ("first", "separator") and char == "]":
+                self._state = "done"
+                pos += 1
+            elif self._state == "separator":
+                if char != ",":
+                    raise ValueError(f"Expected ',' or ']' in JSON array, got {buffer[pos:pos + 40]!r}")
+                self._state = "value"
+                pos += 1
+            elif self._state in ("first", "value"):
+                try:
+                    item, end = self._decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # Most likely an element cut by the chunk boundary, wait for more text
+                    break
+                if not isinstance(item, (dict, list)) and (end == len(buffer) or buffer[end] not in " \t\r\n,]"):
+                    # A number cut by the chunk boundary ("12" of "12.5") parses too, wait for its delimiter
+                    break
+                items.append(item)
+                self._state = "separator"
+                pos = end
+            else:
+                raise ValueError(f"Unexpected data after the JSON array: {buffer[pos:pos + 40]!r}")
+        self._buffer = buffer[pos:]
+        return items
+
+    def close(self):
+        items = self.feed("")
+        if self._state in ("first", "value", "separator") and self._buffer.strip():
+            # Whatever is left could not be decoded even with the whole body
+            self._decoder.raw_decode(self._buffer.lstrip())
+        if self._state != "done":
+            raise ValueError("Truncated JSON array")
+        return items
+
+
+async def aiter_json_array(chunks):
+    """Yield the elements of a JSON array from an async iterator of UTF-8 byte chunks."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parser = JsonArrayParser()
+    async for chunk in chunks:
+        for item in parser.feed(decoder.decode(chunk)):
+            yield item
+    for item in parser.feed(decoder.decode(b"", final=True)) + parser.close():
+        yield item
@@ -0,0 +1,258 @@
+"""Load test of the ETC / Berth Plan cycles against the in-process mock services.
+
+Runs full cycles (sparcsN4 query, token, Berth Plan fetch, XML build, TC1
+sends) against mock_services with configurable latency, error rate and
+payload size, then reports throughput and tail latency per pipeline.
+
+Usage:
+    python load_test.py                                   # 50 cycles, 4 concurrent workers
+    python load_test.py --cycles 500 --concurrency 16 --latency 0.05 --error-rate 0.02
+    python load_test.py --berths 5000 --etc-rows 2000 --json result.json
+    python load_test.py --target main --cycles 5          # drive main.main() itself
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(samples):
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "p50_ms": _percentile(values, 50) * 1000,
+        "p95_ms": _percentile(values, 95) * 1000,
+        "p99_ms": _percentile(values, 99) * 1000,
+        "max_ms": (values[-1] if values else 0.0) * 1000,
+    }
+
+
+def build_mocks(args):
+    from mock_services import MockServices, FakeSparcsDatabase, Behaviour
+
+    def behaviour(latency):
+        return Behaviour(latency=latency, error_rate=args.error_rate)
+
+    services = MockServices(
+        berths=args.berths,
+        token_ttl=args.token_ttl,
+        token=behaviour(args.latency),
+        berth_plan=behaviour(args.bp_latency if args.bp_latency is not None else args.latency),
+        tc1_bp=behaviour(args.latency),
+        tc1_etc=behaviour(args.latency),
+    )
+    database = FakeSparcsDatabase(
+        visits=args.etc_rows, query_latency=args.db_latency, fetch_latency=args.db_latency / 10,
+        error_rate=args.error_rate
+    )
+    return services, database
+
+
+class Worker:
+    """One ETC and one Berth Plan handler; workers share the HTTP, token and DB pools like main.py."""
+
+    def __init__(self, http_pool, db_pool, archive, token_manager=None):
+        from etc_handler_api import EtcHandler
+        from bp_handler_api import BerthPlanHandler
+
+        self.etc_handler = EtcHandler(http_pool=http_pool, db_pool=db_pool)
+        self.bp_handler = BerthPlanHandler(token_manager=token_manager, http_pool=http_pool, archive=archive)
+
+    async def etc_cycle(self):
+        xml = await self.etc_handler.get_etc_xml()
+        if xml is None:
+            return "empty"
+        if not await self.etc_handler.send_xml(xml):
+            return "failed"
+        self.etc_handler.commit_sent()
+        return "sent"
+
+    async def bp_cycle(self):
+        try:
+            xml = await self.bp_handler.metrics_handler()
+            if xml is None:
+                return "empty"
+            if not await self.bp_handler.send_xml(xml):
+                return "failed"
+            self.bp_handler.commit_sent()
+            return "sent"
+        finally:
+            await self.bp_handler.close_stream()
+
+
+async def _timed(results, name, cycle):
+    started = time.perf_counter()
+    try:
+        outcome = await cycle()
+    except Exception as e:
+        outcome = f"error: {type(e).__name__}"
+    elapsed = time.perf_counter() - started
+    results[name]["latency"].append(elapsed)
+    results[name]["outcomes"][outcome] = results[name]["outcomes"].get(outcome, 0) + 1
+    return elapsed
+
+
+async def run_handlers(args, services, database, workdir):
+    from http_client import HttpClientPool
+    from db_pool import OdbcConnectionPool
+    from archive import MessageArchive
+
+    http_pool = HttpClientPool(transport=services.transport())
+    db_pool = OdbcConnectionPool(connect=database.connect, max_size=args.db_pool_size)
+    archive = MessageArchive(os.path.join(workdir, "archive"))
+    workers = [Worker(http_pool, db_pool, archive)]
+    for _ in range(args.concurrency - 1):
+        workers.append(Worker(http_pool, db_pool, archive, token_manager=workers[0].bp_handler.token_manager))
+
+    results = {name: {"latency": [], "outcomes": {}} for name in ("cycle", "etc", "bp")}
+    remaining = iter(range(args.cycles))
+
+    async def work(worker):
+        # Cycles are handed out one at a time; a handler never runs two cycles at once
+        for _ in remaining:
+            started = time.perf_counter()
+            await asyncio.gather(
+                _timed(results, "etc", worker.etc_cycle), _timed(results, "bp", worker.bp_cycle)
+            )
+            results["cycle"]["latency"].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(work(worker) for worker in workers))
+    finally:
+        elapsed = time.perf_counter() - started
+        for worker in workers:
+            await worker.etc_handler.aclose()
+            await worker.bp_handler.aclose()
+        connection_stats = http_pool.connection_stats()
+        await http_pool.aclose()
+    return results, elapsed, {"http": connection_stats, "db_pool": dict(db_pool.stats)}
+
+
+async def run_main(args, services, database):
+    # main builds its handlers in setup(), from the environment set up by run()
+    import main
+    from db_pool import OdbcConnectionPool
+
+    main.setup()
+    main.http_pool.transport = services.transport()
+    main.etc_handler.db_pool = OdbcConnectionPool(connect=database.connect, max_size=args.db_pool_size)
+
+    results = {name: {"latency": [], "outcomes": {}} for name in ("cycle", "etc", "bp")}
+    started = time.perf_counter()
+    try:
+        for _ in range(args.cycles):
+            cycle_started = time.perf_counter()
+            etc_sent, bp_sent = await main.main()
+            results["cycle"]["latency"].append(time.perf_counter() - cycle_started)
+            for name, outcome in [("etc", etc_sent)] + [("bp", sent) for sent in bp_sent.values()]:
+                key = "sent" if outcome else "not sent"
+                results[name]["outcomes"][key] = results[name]["outcomes"].get(key, 0) + 1
+    finally:
+        elapsed = time.perf_counter() - started
+        db_stats = dict(main.etc_handler.db_pool.stats)
+        connection_stats = main.http_pool.connection_stats()
+        await main.shutdown()
+    return results, elapsed, {"http": connection_stats, "db_pool": db_stats}
+
+
+def print_report(report):
+    print(f"\n{report['cycles']} cycle(s) in {report['elapsed_s']:.2f}s "
+          f"({report['cycles_per_s']:.2f} cycles/s, concurrency {report['concurrency']})")
+    print(f"{'pipeline':<10}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'max ms':>11}  outcomes")
+    for name, entry in report["pipelines"].items():
+        summary = entry["latency"]
+        if not summary["count"]:
+            # main.main() only reports outcomes per pipeline, their timings are in the "stages" summary
+            print(f"{name:<10}{'-':>7}{'-':>11}{'-':>11}{'-':>11}{'-':>11}  {entry['outcomes']}")
+            continue
+        print(f"{name:<10}{summary['count']:>7}{summary['p50_ms']:>11.1f}{summary['p95_ms']:>11.1f}"
+              f"{summary['p99_ms']:>11.1f}{summary['max_ms']:>11.1f}  {entry['outcomes'] or ''}")
+    print(f"\n{'mock route':<12}{'requests':>10}{'errors':>8}{'bytes in':>14}{'bytes out':>14}")
+    for route, stats in report["mock_services"].items():
+        if stats["requests"]:
+            print(f"{route:<12}{stats['requests']:>10}{stats['errors']:>8}{stats['bytes_in']:>14,}{stats['bytes_out']:>14,}")
+    print(f"\nsparcsN4 mock: {report['mock_database']}")
+    print(f"DB pool: {report['pools']['db_pool']}")
+    print(f"HTTP pool: {report['pools']['http']}")
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="tc1_load_")
+    services, database = build_mocks(args)
+    # Before the handler modules are imported: they read the environment (and .env) on import
+    os.environ.update(services.environ())
+    os.environ.setdefault("ARCHIVE_DIR", os.path.join(workdir, "archive"))
+    os.environ.setdefault("LOG_LEVEL", args.log_level)
+    os.environ.setdefault("METRICS_SUMMARY_FILE", os.path.join(workdir, "metrics_summary.json"))
+    os.environ["ETC_RENDER"] = args.etc_render
+
+    from log_config import setup_logging
+    from instrumentation import registry
+    setup_logging()
+
+    if args.target == "main":
+        results, elapsed, pools = asyncio.run(run_main(args, services, database))
+        concurrency = 1
+    else:
+        results, elapsed, pools = asyncio.run(run_handlers(args, services, database, workdir))
+        concurrency = args.concurrency
+
+    cycles = len(results["cycle"]["latency"])
+    return {
+        "target": args.target,
+        "cycles": cycles,
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "cycles_per_s": cycles / elapsed if elapsed else 0.0,
+        "pipelines": {
+            name: {"latency": latency_summary(entry["latency"]), "outcomes": entry["outcomes"]}
+            for name, entry in results.items()
+        },
+        "mock_services": services.stats,
+        "mock_database": database.stats,
+        "pools": pools,
+        "stages": registry.summary(),
+        "workdir": workdir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the ETC / Berth Plan cycles against mock services")
+    parser.add_argument("--target", choices=("handlers", "main"), default="handlers",
+                        help="'handlers': concurrent workers sharing the pools; 'main': main.main() cycle after cycle")
+    parser.add_argument("--cycles", type=int, default=50, help="Number of cycles to run")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent workers (handlers target)")
+    parser.add_argument("--berths", type=int, default=500, help="Berth calls in the mocked Berth Plan response")
+    parser.add_argument("--etc-rows", type=int, default=300, help="Working vessel visits in the mocked sparcsN4")
+    parser.add_argument("--latency", type=float, default=0.02, help="Mean latency of the mocked HTTP endpoints (s)")
+    parser.add_argument("--bp-latency", type=float, help="Latency of the Berth Plan endpoint, default --latency")
+    parser.add_argument("--db-latency", type=float, default=0.01, help="Latency of the mocked sparcsN4 query (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Failure probability of every mocked call")
+    parser.add_argument("--token-ttl", type=int, default=3600, help="expires_in of the mocked OAuth tokens (s)")
+    parser.add_argument("--db-pool-size", type=int, default=2, help="OdbcConnectionPool max_size")
+    parser.add_argument("--etc-render", choices=("sql", "service"), default="sql", help="ETC_RENDER mode")
+    parser.add_argument("--log-level", default="WARNING", help="LOG_LEVEL of the pipeline modules")
+    parser.add_argument("--json", help="Write the report to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=4, default=str)
+
+
+if __name__ == "__main__":
+    main()
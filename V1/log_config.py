@@ -0,0 +1,115 @@
+import os
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+
+TEXT_FORMAT = '%(asctime)s | %(levelname)s | %(name)s | Line:%(lineno)d | %(message)s'
+
+# Third-party loggers that are too chatty at DEBUG/INFO, overridable through LOG_LEVELS
+DEFAULT_LEVELS = {"httpx": "WARNING", "httpcore": "WARNING", "asyncio": "WARNING"}
+
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra={...}` fields are kept as top-level keys."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        elif record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class LazyJson:
+    """Pretty-printed JSON rendered only if the record is actually emitted."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(self.value, indent=4, default=str)
+
+
+def truncate_body(text, limit=None):
+    # Failure paths log response bodies; keep them bounded
+    limit = int(os.getenv("LOG_BODY_LIMIT", 2000)) if limit is None else limit
+    if text is None or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more characters]"
+
+
+def parse_levels(spec):
+    # "bp_handler_api=DEBUG,httpx=INFO" -> {"bp_handler_api": "DEBUG", "httpx": "INFO"}
+    levels = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Route all records through a queue to a background writer thread.
+
+    Settings (environment):
+        LOG_LEVEL               root level (default INFO)
+        LOG_LEVELS              per-logger levels, e.g. "bp_handler_api=DEBUG,httpx=INFO"
+        LOG_FORMAT              "text" (default) or "json"
+        LOG_FILE                also write to this file, rotated at LOG_FILE_MAX_BYTES
+                                (default 10 MiB) keeping LOG_FILE_BACKUPS files (default 5)
+    Calling it again is a no-op.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if os.getenv("LOG_FORMAT", "text").lower() == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if os.getenv("LOG_FILE"):
+        handlers.append(logging.handlers.RotatingFileHandler(
+            os.getenv("LOG_FILE"),
+            maxBytes=int(os.getenv("LOG_FILE_MAX_BYTES", 10 * 1024 * 1024)),
+            backupCount=int(os.getenv("LOG_FILE_BACKUPS", 5)),
+            encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(queue.SimpleQueue()))
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name, level in {**DEFAULT_LEVELS, **parse_levels(os.getenv("LOG_LEVELS"))}.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(root.handlers[0].queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    # Flushes whatever is still queued; registered with atexit by setup_logging()
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,88 +1,292 @@
-from datetime import datetime, timedelta
 import os
-import traceback, sys
+import time
 import asyncio
-
-import xml.etree.ElementTree as ET
+import argparse
+import traceback
+from functools import partial
 import logging
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s | %(levelname)s | %(name)s | Line:%(lineno)d | %(message)s'
-)
+from env_config import load_env
+from log_config import setup_logging
+from instrumentation import registry, write_summary, payload_size, STAGE_SECONDS
+
 local_logger = logging.getLogger(__name__)
 
+PIPELINES = ("etc", "bp")
+
+# Built by setup() for the selected pipelines only: importing main constructs nothing, and a
+# BP-only run never imports the ETC handler, the ODBC pool or the outbound queue
+http_pool = None
+archive = None
+etc_handler = None
+bp_handlers = []
+outbound_queue = None
+# dry-run: build, archive and log the messages, but send / queue nothing and commit no state
+dry_run = False
+
+
+def setup(pipelines=PIPELINES):
+    """Create the shared pools and the handlers of `pipelines`; what already exists is kept."""
+    global http_pool, archive, etc_handler, outbound_queue
+    created = []
+
+    if http_pool is None:
+        from http_client import HttpClientPool
+        from archive import MessageArchive
+
+        # All handlers share one set of keep-alive HTTP clients and one message archive
+        http_pool = HttpClientPool()
+        archive = MessageArchive.from_env()
+
+    if "etc" in pipelines and etc_handler is None:
+        local_logger.debug("Starting EtcHandler.")
+        from etc_handler_api import EtcHandler
+
+        etc_handler = EtcHandler(http_pool=http_pool)
+        created.append(("tc1_etc", etc_handler))
+
+    if "bp" in pipelines and not bp_handlers:
+        local_logger.debug("Starting BerthPlanHandler.")
+        from bp_handler_api import BerthPlanHandler
+        from terminals import load_terminals
+
+        # One BerthPlanHandler per terminal (TERMINALS_CONFIG), all using the same Maersk token
+        for terminal in load_terminals():
+            token_manager = bp_handlers[0].token_manager if bp_handlers else None
+            bp_handlers.append(BerthPlanHandler(
+                token_manager=token_manager, http_pool=http_pool, terminal=terminal, archive=archive
+            ))
+            created.append((bp_destination(bp_handlers[-1]), bp_handlers[-1]))
 
-local_logger.debug(f"Starting EtcHandler, BerthPlanHandler.")
-# Suppress httpx and httpcore debug logs
-logging.getLogger("httpx").setLevel(logging.WARNING)
-logging.getLogger("httpcore").setLevel(logging.WARNING)
+    # With OUTBOUND_QUEUE_PATH set, messages go through a durable retry queue instead of a single send attempt
+    if os.getenv("OUTBOUND_QUEUE_PATH") and not dry_run:
+        if outbound_queue is None:
+            from outbound_queue import OutboundQueue
 
-from etc_handler_api import EtcHandler
-from bp_handler_api import BerthPlanHandler
+            outbound_queue = OutboundQueue(
+                os.getenv("OUTBOUND_QUEUE_PATH"),
+                base_delay=float(os.getenv("QUEUE_BASE_DELAY_SECONDS", 2)),
+                max_delay=float(os.getenv("QUEUE_MAX_DELAY_SECONDS", 60))
+            )
+        queue_concurrency = int(os.getenv("QUEUE_CONCURRENCY", 1))
+        for destination, handler in created:
+            outbound_queue.register_destination(destination, handler.send_xml, concurrency=queue_concurrency)
 
-        
-etc_handler = EtcHandler()
-bp_handler = BerthPlanHandler()
 
-async def delete_old_xml_files(directory, days=31):
+def bp_destination(handler):
+    # The default terminal keeps the original queue destination, so queued messages survive an upgrade
+    return f"tc1_bp:{handler.terminal_code}" if handler.file_suffix else "tc1_bp"
+
+
+def state_commit(handler):
+    # Bound to the state of the message just built: a queued message may reach TC1 after later cycles ran
+    pending = handler.pending_state()
+    return None if pending is None else partial(handler.commit_sent, pending)
+
+
+async def deliver(destination, handler, payload, kind, supersede=True, commit=None):
+    """Send (or queue) one message; `commit` runs once TC1 has acknowledged it.
+
+    Returns True when the message was sent, or queued with OUTBOUND_QUEUE_PATH; a queued
+    message commits from the queue's delivery callback, not when it is enqueued.
+    """
+    if dry_run:
+        if hasattr(payload, "__aiter__"):
+            # Still built (and archived) chunk by chunk, only the upload is skipped
+            payload = b"".join([chunk async for chunk in payload])
+        local_logger.info("Dry run: %s message for %s built (%s bytes), not sent.", kind, destination, payload_size(payload))
+        return False
+    if outbound_queue is None:
+        sent = await handler.send_xml(payload)
+        if sent and commit is not None:
+            commit()
+        return sent
+    if hasattr(payload, "__aiter__"):
+        # Queued messages are stored whole, a streamed body is collected first
+        payload = b"".join([chunk async for chunk in payload])
+    await outbound_queue.enqueue(destination, payload, kind=kind, supersede=supersede, on_delivered=commit)
+    return True
+
+
+async def run_etc_pipeline():
+    started = time.perf_counter()
     try:
-        now = datetime.now()
-        cutoff = now - timedelta(days=days)
+        # Fetch the ETC SOAP envelope from etc_handler
+        etc_soap_data = await etc_handler.get_etc_xml()
+        if etc_soap_data is None:
+            local_logger.warning("ETC pipeline: no ETC data (or no ETC change) this cycle, nothing to send.")
+            return False
 
-        for filename in os.listdir(directory):
-            if filename.lower().endswith(".xml"):
-                file_path = os.path.join(directory, filename)
-                file_mtime = datetime.fromtimestamp(os.path.getmtime(file_path))
-                if file_mtime < cutoff:
-                    os.remove(file_path)
-                    local_logger.info(f"Deleted old XML file: {file_path}")
+        # send etc xml file
+        # An incremental message is diffed against the last delivered state, so it carries every change of the
+        # pending ones too and replaces them like a full message
+        sent = await deliver("tc1_etc", etc_handler, etc_soap_data, kind="etc", commit=state_commit(etc_handler))
 
+        await archive.write("APMT_ETC", etc_soap_data, ext="xml")
+        return sent
     except Exception as e:
-        local_logger.error(f"Error deleting old XML files: {str(traceback.format_exc())}")
+        local_logger.error("ETC pipeline failed: %s", str(traceback.format_exc()))
+        return False
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe(STAGE_SECONDS, elapsed, stage="etc_pipeline")
+        local_logger.info("ETC pipeline finished in %.3fs", elapsed)
+
+
+async def run_bp_pipeline(bp_handler):
+    started = time.perf_counter()
+    terminal = bp_handler.terminal_code
+    try:
+        final_bp_xml = await bp_handler.metrics_handler()
+        if final_bp_xml is None:
+            local_logger.warning("BP pipeline %s: no BerthPlan XML (or no plan change) this cycle, nothing to send.", terminal)
+            return False
+        sent = await deliver(bp_destination(bp_handler), bp_handler, final_bp_xml, kind="bp",
+                             commit=state_commit(bp_handler))
+        return sent
+    except Exception as e:
+        local_logger.error("BP pipeline %s failed: %s", terminal, str(traceback.format_exc()))
+        return False
+    finally:
+        # Sent, queued or failed, a streamed Berth Plan response must not keep its connection
+        await bp_handler.close_stream()
+        elapsed = time.perf_counter() - started
+        registry.observe(STAGE_SECONDS, elapsed, stage="bp_pipeline", terminal=terminal)
+        local_logger.info("BP pipeline %s finished in %.3fs", terminal, elapsed)
+
+
+async def prune_archive():
+    # Drops whole date partitions past ARCHIVE_RETENTION_DAYS / ARCHIVE_MAX_MB, using the archive index.
+    # Run after every cycle (and as a daemon job) whatever pipelines are selected and however they ended
+    if archive is not None:
+        await archive.prune()
 
 
 async def main():
+    # ETC and every terminal's BP are independent: run them side by side so a slow
+    # sparcsN4 query, Maersk fetch or TC1 endpoint does not delay the other messages.
+    # Runs the pipelines set up by setup(), all of them when nothing has been set up yet.
+    if http_pool is None:
+        setup()
+    started = time.perf_counter()
+    etc_run = [run_etc_pipeline()] if etc_handler is not None else []
+    results = await asyncio.gather(*etc_run, *(run_bp_pipeline(bp_handler) for bp_handler in bp_handlers))
+    etc_sent = results.pop(0) if etc_run else None
+    bp_sent = dict(zip((bp_handler.terminal_code for bp_handler in bp_handlers), results))
+    await prune_archive()
+    action = 'built' if dry_run else 'queued' if outbound_queue else 'sent'
+    local_logger.info(
+        "Cycle finished in %.3fs (ETC %s: %s, BP %s: %s)", time.perf_counter() - started,
+        action, etc_sent, action, bp_sent
+    )
+    local_logger.debug("HTTP connection stats: %s", http_pool.connection_stats())
+    return etc_sent, bp_sent
+
+
+async def shutdown():
+    # Release resources that are kept warm between cycles
+    if outbound_queue is not None:
+        # Sends still running past the drain would otherwise lose their HTTP client and database
+        await outbound_queue.cancel_deliveries()
+    if etc_handler is not None:
+        await etc_handler.aclose()
+    for bp_handler in bp_handlers:
+        await bp_handler.aclose()
+    if http_pool is not None:
+        local_logger.info("HTTP connection stats: %s", http_pool.connection_stats())
+        await http_pool.aclose()
+    if outbound_queue is not None:
+        outbound_queue.close()
+
+
+async def run_once():
     try:
-        # Fetch XML data from etc_handler
-        etc_content = await etc_handler.get_etc_xml()
-        etc_soap_data =f'''
-        <soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"
-                xmlns:tmsa="http://ADEVEAI/TMSA_BERTHPLAN.pub">
-            <soapenv:Header/>
-            <soapenv:Body>
-                <tmsa:processETC>
-                    <ETC>
-                        {etc_content}
-                    </ETC>
-                </tmsa:processETC>
-            </soapenv:Body>
-        </soapenv:Envelope>
-        '''
-        
-        # send etc xml file
-        await etc_handler.send_xml(etc_soap_data)
+        await main()
+        if outbound_queue is not None:
+            # Bounded: whatever is still failing stays queued for the next run
+            await outbound_queue.drain(timeout=float(os.getenv("QUEUE_DRAIN_SECONDS", 30)))
+    finally:
+        await shutdown()
+        # One-shot runs have no /metrics endpoint, leave the stage timings behind instead
+        write_summary(os.getenv("METRICS_SUMMARY_FILE", "metrics_summary.json"))
 
-        xml_directory = f"{os.getcwd()}/SOAP_Archive"
-        os.makedirs(xml_directory, exist_ok=True)
 
-        # Save XML locally
-        timestamp = datetime.now().strftime("%Y%m%d_%H:%M:%S")
-        filename = f"{xml_directory}/APMT_ETC_{timestamp}.xml"
-        with open(filename, mode='w') as xml_file:
-            xml_file.write(etc_soap_data)
+async def log_connection_stats():
+    local_logger.info("HTTP connection stats: %s", http_pool.connection_stats())
 
-        local_logger.info(f"ETC XML saved locally as {filename}")
 
-        # Delete XML files older than one month (31 days)
-        await delete_old_xml_files(xml_directory, days=30)
-        final_bp_xml = await bp_handler.metrics_handler()
-        await bp_handler.send_xml(final_bp_xml)
-    except Exception as e:
-        local_logger.error(f"Error saving XML data: {str(traceback.format_exc())}")
-        
+async def run_daemon():
+    from scheduler import CycleScheduler
+    from instrumentation import serve_metrics
 
+    etc_interval = float(os.getenv("ETC_INTERVAL_SECONDS", 300))
+    bp_interval = float(os.getenv("BP_INTERVAL_SECONDS", 3600))
+    shutdown_timeout = float(os.getenv("SHUTDOWN_TIMEOUT_SECONDS", 60))
 
-if __name__ == '__main__':
+    scheduler = CycleScheduler(shutdown_timeout=shutdown_timeout)
+    if etc_handler is not None:
+        scheduler.add_job("ETC", etc_interval, run_etc_pipeline)
+    for bp_handler in bp_handlers:
+        scheduler.add_job(f"BP {bp_handler.terminal_code}", bp_interval, partial(run_bp_pipeline, bp_handler))
+    if archive is not None:
+        scheduler.add_job("Archive retention", float(os.getenv("ARCHIVE_PRUNE_INTERVAL_SECONDS", 3600)), prune_archive)
+    if outbound_queue is not None:
+        scheduler.add_service("Outbound queue", outbound_queue.run_worker)
+    scheduler.add_job("HTTP stats", float(os.getenv("STATS_INTERVAL_SECONDS", 900)), log_connection_stats)
+    metrics_port = int(os.getenv("METRICS_PORT", 9108))
+    if metrics_port:
+        scheduler.add_service(
+            "Metrics endpoint", partial(serve_metrics, os.getenv("METRICS_HOST", "127.0.0.1"), metrics_port)
+        )
+    try:
+        await scheduler.run()
+    finally:
+        await shutdown()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="TC1 Port Authority ETC / Berth Plan sender",
+        epilog="Without a command both pipelines run once, as 'all'."
+    )
+    parser.add_argument(
+        "--daemon", action="store_true",
+        help="Same as the 'daemon' command: run as a resident service, scheduling ETC and BP cycles on "
+             "ETC_INTERVAL_SECONDS / BP_INTERVAL_SECONDS instead of a single run"
+    )
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.add_parser("etc", help="Run the ETC pipeline once (sparcsN4 -> TC1)")
+    commands.add_parser("bp", help="Run the Berth Plan pipeline(s) once (Maersk -> TC1), without loading the ODBC driver")
+    commands.add_parser("all", help="Run both pipelines once, concurrently")
+    for name, help_text in (
+        ("dry-run", "Build and archive the messages of a pipeline without sending them or updating the diff state"),
+        ("daemon", "Run the pipeline(s) as a resident service on their intervals"),
+    ):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("pipeline", nargs="?", choices=("etc", "bp", "all"), default="all")
+    args = parser.parse_args(argv)
+
+    command = args.command or ("daemon" if args.daemon else "all")
+    pipeline = getattr(args, "pipeline", None) or (command if command in PIPELINES else "all")
+    if args.daemon and command != "daemon":
+        parser.error("--daemon cannot be combined with a command other than 'daemon'")
+    return command, PIPELINES if pipeline == "all" else (pipeline,)
 
-    asyncio.run(main())
+
+def cli(argv=None):
+    global dry_run
+    command, pipelines = parse_args(argv)
+    load_env()
+    # Before the handlers are imported, so their start-up messages go through the queue
+    setup_logging()
+    dry_run = command == "dry-run"
+    setup(pipelines)
+
+    if command == "daemon":
+        asyncio.run(run_daemon())
+    else:
+        asyncio.run(run_once())
+
+
+if __name__ == '__main__':
+    cli()
@@ -1,42 +1,136 @@
 import asyncio
 from datetime import datetime
-import pyodbc
 import os
 import sys
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
 import logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s | %(levelname)s | %(name)s | Line:%(lineno)d | %(message)s'
-)
 local_logger = logging.getLogger(__name__)
 
-local_logger.debug(f"Starting BerthMetricCalculator.")
+local_logger.debug("Starting BerthMetricCalculator.")
+
+class IntervalIndex:
+    """Static set of intervals for overlap queries.
+
+    Takes (start, end, item) triples, in any order and direction; bounds only
+    need to be comparable (metric points, normalized UTC timestamps).
+    Intervals are kept sorted by start, ties in input order. Touching
+    intervals do not overlap.
+
+    overlapping(lo, hi) needs numeric bounds: one overlapping [lo, hi] must
+    start inside (lo - longest, hi), so a query bisects that range instead of
+    scanning every interval.
+    """
+
+    def __init__(self, intervals):
+        self._entries = sorted(
+            ((min(start, end), max(start, end), item) for start, end, item in intervals), key=lambda entry: entry[0]
+        )
+        # Built by the first overlapping() query, string bounds have no length
+        self._starts = None
+        self._longest = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def overlapping(self, lo, hi):
+        """Items of the intervals overlapping [lo, hi], by start."""
+        if self._starts is None:
+            self._starts = [entry[0] for entry in self._entries]
+            self._longest = max((end - start for start, end, _ in self._entries), default=0)
+        lo, hi = min(lo, hi), max(lo, hi)
+        first = bisect_right(self._starts, lo - self._longest)
+        last = bisect_left(self._starts, hi)
+        return [item for start, end, item in self._entries[first:last] if end > lo]
+
+    def overlapping_pairs(self):
+        """Every pair of overlapping intervals, as (earlier, later) by start, from one sweep."""
+        pairs = []
+        active = []  # heap of (end, position) of the intervals still open at the current start
+        for position, (start, end, item) in enumerate(self._entries):
+            while active and active[0][0] <= start:
+                heapq.heappop(active)
+            pairs.extend((self._entries[other][2], item) for _, other in active)
+            heapq.heappush(active, (end, position))
+        return pairs
+
 
 class BerthMetricCalculator:
-    def __init__(self, start_index=0, end_index=1585, last_bollard=81, bollard_spacing=20):
+    def __init__(self, start_index=0, end_index=1585, last_bollard=81, bollard_spacing=20, max_sub_bollard=9,
+                 bollard_cache_size=4096):
         self.start_index = start_index
         self.end_index = end_index
         self.last_bollard = last_bollard
         self.bollard_spacing = bollard_spacing
+        self.max_sub_bollard = max_sub_bollard
         self.berth_map = {}
         self._generate_berth_map()
+        # Parsed planned bollard strings, per calculator: the same few hundred values repeat across cycles
+        self.resolve_bollard = lru_cache(maxsize=bollard_cache_size)(self._parse_bollard)
 
     def _generate_berth_map(self):
+        # berth_map: interned "Bn" -> fore metric point; bollard_points: the same indexed by n (-1 = no bollard)
+        self.bollard_points = array("i", [-1] * (self.last_bollard + 1))
         bollard = self.last_bollard
         for idx in range(self.end_index, self.start_index, -self.bollard_spacing):
-            self.berth_map[f"B{bollard}"] = idx
+            self.berth_map[sys.intern(f"B{bollard}")] = idx
+            if bollard >= 0:
+                self.bollard_points[bollard] = idx
             bollard -= 1
+        # Ascending metric points for the reverse lookups
+        ordered = sorted((idx, number) for number, idx in enumerate(self.bollard_points) if idx >= 0)
+        self._sorted_points = array("i", (idx for idx, _ in ordered))
+        self._sorted_numbers = array("i", (number for _, number in ordered))
+
+    def _parse_bollard(self, planned_bollard):
+        # "B45.3" -> fore metric point of B45 plus 3 sub-positions of 2 m; None for anything that
+        # does not name a known bollard, which then gets the mock position. Cached, so nothing is
+        # logged here: unknown_bollard() lets the caller report every record concerned
+        normalized = planned_bollard.strip().upper()
+        if not normalized.startswith("B"):
+            return None
+        parts = normalized.split(".")
+        fore = self.berth_map.get(parts[0].strip())
+        if fore is None:
+            return None
+        if len(parts) > 1:
+            try:
+                fore += int(parts[1]) * 2
+            except ValueError:
+                return None
+        return fore
+
+    def bollard_for_point(self, metric_point):
+        """Planned bollard string ("B45" / "B45.3") of a fore metric point, None off the bollard range."""
+        position = bisect_right(self._sorted_points, metric_point) - 1
+        if position < 0:
+            return None
+        sub = round((metric_point - self._sorted_points[position]) / 2)
+        if sub > self.max_sub_bollard:
+            return None
+        number = self._sorted_numbers[position]
+        return f"B{number}.{sub}" if sub else f"B{number}"
+
+    def segment(self, planned_bollard, loa, is_starboard):
+        """(low, high) metric points of the quay a vessel occupies."""
+        fore, aft, _ = self.get_metrics(planned_bollard, loa, is_starboard)
+        return min(fore, aft), max(fore, aft)
 
-    def __generate_real_metrics(self, planned_bollard: str, loa: float, is_starboard: bool):
-        metrics = planned_bollard.split(".")
-        base = metrics[0].strip().upper()
-        offset = int(metrics[1]) * 2 if len(metrics) > 1 else 0
+    def quay_index(self, calls):
+        """IntervalIndex of the quay segments of BerthCall records, keyed by the records themselves."""
+        return IntervalIndex(
+            (*self.segment(call.planned_bollard, call.loa, call.is_starboard), call)
+            for call in calls
+        )
 
-        if base not in self.berth_map:
-            local_logger.error(f"Unknown bollard: {base}")
-            raise ValueError(f"Unknown bollard: {base}")
+    def unknown_bollard(self, planned_bollard):
+        """True when planned_bollard names a bollard ("B...") that is unknown or malformed; it gets the mock position."""
+        return (isinstance(planned_bollard, str) and planned_bollard.strip().upper().startswith("B")
+                and self.resolve_bollard(planned_bollard) is None)
 
-        fore = self.berth_map[base] + offset
+    def __generate_real_metrics(self, fore, loa: float, is_starboard: bool):
         aft = fore + loa if is_starboard else fore - loa
 
         # local_logger.info(f"[Real] plannedBollard: {planned_bollard}, fore_metric_point: {fore}, aft_metric_point: {aft}")
@@ -56,10 +150,75 @@ class BerthMetricCalculator:
         return (round(fore, 2), round(aft, 2), real)
 
     def get_metrics(self, planned_bollard: str, loa: float, is_starboard: bool):
-        if isinstance(planned_bollard, str) and planned_bollard.strip().upper().startswith("B"):
-            return self.__generate_real_metrics(planned_bollard, loa, is_starboard)
+        fore = self.resolve_bollard(planned_bollard) if isinstance(planned_bollard, str) else None
+        if fore is not None:
+            return self.__generate_real_metrics(fore, loa, is_starboard)
         return self.__generate_mock_metrics(loa, is_starboard)
 
+    def get_metrics_batch(self, planned_bollards, loas, is_starboard, backend="python"):
+        """Compute metrics for many berths at once.
+
+        Takes three equally long columns and returns (fore, aft, real) columns
+        with the same values get_metrics() returns row by row. With
+        backend="numpy" the columns are float/bool NumPy arrays instead of lists
+        (requires numpy).
+        """
+        if not (len(planned_bollards) == len(loas) == len(is_starboard)):
+            raise ValueError("planned_bollards, loas and is_starboard must have the same length")
+
+        # Resolve each bollard string to its fore point once; None marks a mock position
+        resolve = self.resolve_bollard
+        bases = [resolve(planned_bollard) if isinstance(planned_bollard, str) else None
+                 for planned_bollard in planned_bollards]
+
+        if backend == "numpy":
+            return self._metrics_batch_numpy(bases, loas, is_starboard)
+        if backend != "python":
+            raise ValueError(f"Unknown backend: {backend} (expected 'python' or 'numpy')")
+
+        end = self.end_index
+        fores, afts, reals = [], [], []
+        for base, loa, starboard in zip(bases, loas, is_starboard):
+            if base is not None:
+                fore = base
+                aft = fore + loa if starboard else fore - loa
+                real = True
+            elif starboard:
+                fore, aft, real = end - loa, end, False
+            else:
+                fore, aft, real = end, end - loa, False
+            fores.append(round(fore, 2))
+            afts.append(round(aft, 2))
+            reals.append(real)
+        return fores, afts, reals
+
+    def _metrics_batch_numpy(self, bases, loas, is_starboard):
+        import numpy as np
+
+        real = np.fromiter((base is not None for base in bases), dtype=bool, count=len(bases))
+        base = np.fromiter((base if base is not None else 0.0 for base in bases), dtype=float, count=len(bases))
+        loa = np.asarray(loas, dtype=float)
+        starboard = np.asarray(is_starboard, dtype=bool)
+        end = float(self.end_index)
+
+        signed_loa = np.where(starboard, loa, -loa)
+        fore = np.where(real, base, np.where(starboard, end - loa, end))
+        aft = np.where(real, base + signed_loa, np.where(starboard, end, end - loa))
+        return self._round_numpy(fore), self._round_numpy(aft), real
+
+    @staticmethod
+    def _round_numpy(values):
+        # np.round() scales by 100 and rounds half to even, round() rounds the exact binary value:
+        # they only disagree within float error of a half-cent tie, those few go through round()
+        import numpy as np
+
+        rounded = np.round(values, 2)
+        scaled = values * 100
+        ties = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+        if ties.any():
+            rounded[ties] = [round(value, 2) for value in values[ties].tolist()]
+        return rounded
+
     def __repr__(self):
         return f"<BerthMetricCalculator: {len(self.berth_map)} bollards mapped>"
 
@@ -0,0 +1,254 @@
+import json
+import time
+import random
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import httpx
+
+from bench_bp_pipeline import make_berth_plan
+from xml_builder import xml_escape
+import logging
+local_logger = logging.getLogger(__name__)
+
+MAERSK_HOST = "maersk.mock"
+TC1_HOST = "tc1.mock"
+
+SOAP_ACK = (
+    '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">'
+    "<soapenv:Body><ack>OK</ack></soapenv:Body></soapenv:Envelope>"
+)
+
+
+class Behaviour:
+    """Latency, failure rate and failure status of one mocked endpoint.
+
+    Each call waits `latency` seconds +/- `jitter` (a fraction of it) and
+    fails with `error_status` with probability `error_rate`.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.2, error_rate=0.0, error_status=503):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def delay(self, rnd):
+        if self.latency <= 0:
+            return 0.0
+        return max(0.0, rnd.uniform(self.latency * (1 - self.jitter), self.latency * (1 + self.jitter)))
+
+    def fails(self, rnd):
+        return self.error_rate > 0 and rnd.random() < self.error_rate
+
+
+class MockServices:
+    """In-process stand-ins for the Maersk OAuth / Berth Plan API and the TC1 SOAP receivers.
+
+    transport() returns an httpx.MockTransport to hand to HttpClientPool;
+    environ() returns the variables pointing the handlers at it. Every
+    request is counted per route in `stats`.
+    """
+
+    ROUTES = ("token", "berth_plan", "tc1_bp", "tc1_etc")
+
+    def __init__(self, berths=500, token_ttl=3600, seed=1, **behaviours):
+        unknown = set(behaviours) - set(self.ROUTES)
+        if unknown:
+            raise ValueError(f"Unknown mock route(s): {sorted(unknown)}")
+        self.token_ttl = token_ttl
+        self.behaviours = {route: behaviours.get(route) or Behaviour() for route in self.ROUTES}
+        self.berth_plan = json.dumps(make_berth_plan(berths)).encode("utf-8")
+        self.stats = {route: {"requests": 0, "errors": 0, "bytes_in": 0, "bytes_out": 0} for route in self.ROUTES}
+        self.stats["unknown"] = {"requests": 0, "errors": 0, "bytes_in": 0, "bytes_out": 0}
+        self._rnd = random.Random(seed)
+        self._token_count = 0
+
+    @staticmethod
+    def environ():
+        return {
+            "TOKEN_URL": f"https://{MAERSK_HOST}/oauth2/token",
+            "BP_URL": f"https://{MAERSK_HOST}/berth-plan",
+            "BP_XML_SEND_URL": f"https://{TC1_HOST}/bp",
+            "ETC_URI": f"https://{TC1_HOST}/etc",
+            "CLIENT_ID": "mock-client",
+            "CLIENT_SECRET": "mock-secret",
+            "SCOPE": "mock-scope",
+            "CONSUMER_KEY": "mock-consumer-key",
+            "BP_XML_USER": "mock-user",
+            "BP_XML_PASSWORD": "mock-password",
+            "BP_TOKEN_EXP_DATA": (datetime.now() + timedelta(days=365)).strftime("%Y-%m-%d"),
+            "ETC_AUTH_USER": "mock-user",
+            "ETC_AUTH_PASSWORD": "mock-password",
+            "DB_DATA_SOURCE": "sparcsn4.mock",
+            "DB_INITIAL_CATALOG": "Sparcsn4",
+            "DB_USER_ID": "mock-user",
+            "DB_PASSWORD": "mock-password",
+        }
+
+    def transport(self):
+        return httpx.MockTransport(self.handle)
+
+    def _route(self, request):
+        if request.url.host == MAERSK_HOST:
+            return "token" if request.url.path.startswith("/oauth2/token") else "berth_plan"
+        if request.url.host == TC1_HOST:
+            return "tc1_etc" if request.url.path.startswith("/etc") else "tc1_bp"
+        return "unknown"
+
+    async def handle(self, request):
+        route = self._route(request)
+        stats = self.stats[route]
+        stats["requests"] += 1
+        stats["bytes_in"] += len(await request.aread())
+        if route == "unknown":
+            stats["errors"] += 1
+            return httpx.Response(404, text=f"No mock for {request.url}")
+
+        behaviour = self.behaviours[route]
+        delay = behaviour.delay(self._rnd)
+        if delay:
+            await asyncio.sleep(delay)
+        if behaviour.fails(self._rnd):
+            stats["errors"] += 1
+            return httpx.Response(behaviour.error_status, text=f"Mock {route} failure")
+
+        if route == "token":
+            self._token_count += 1
+            response = httpx.Response(200, json={
+                "access_token": f"mock-token-{self._token_count}", "token_type": "Bearer",
+                "expires_in": self.token_ttl
+            })
+        elif route == "berth_plan":
+            if not request.headers.get("Authorization", "").startswith("Bearer mock-token-"):
+                stats["errors"] += 1
+                return httpx.Response(401, text="Invalid token")
+            response = httpx.Response(200, content=self.berth_plan, headers={"Content-Type": "application/json"})
+        else:
+            response = httpx.Response(200, text=SOAP_ACK, headers={"Content-Type": "text/xml"})
+        stats["bytes_out"] += len(response.content)
+        return response
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self._database = database
+        self._rows = []
+        self._position = 0
+        self.description = None
+
+    def execute(self, sql):
+        self._database._query(sql, self)
+        return self
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchmany(self, size=1):
+        self._database._wait(self._database.fetch_latency)
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchall(self):
+        return self.fetchmany(len(self._rows) - self._position)
+
+    def close(self):
+        self._rows = []
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self._database = database
+        self.closed = False
+
+    def cursor(self):
+        if self.closed:
+            raise RuntimeError("Connection is closed")
+        return FakeCursor(self._database)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSparcsDatabase:
+    """DB-API stand-in for the sparcsN4 ETC queries, for OdbcConnectionPool(connect=db.connect).
+
+    Serves `visits` working vessel visits, both as plain rows and as the
+    FOR XML document; `change_rate` of the ETC values move on every query so
+    incremental mode has something to send. Latencies are blocking sleeps,
+    like a real driver call on the pool's worker threads.
+    """
+
+    ROW_COLUMNS = ("visitId", "voyageNumber", "vesselName", "vesselCode", "IMO", "ETC")
+
+    def __init__(self, visits=300, query_latency=0.0, fetch_latency=0.0, error_rate=0.0, change_rate=0.1, seed=1):
+        self.query_latency = query_latency
+        self.fetch_latency = fetch_latency
+        self.error_rate = error_rate
+        self.change_rate = change_rate
+        self.stats = {"connections": 0, "queries": 0, "errors": 0}
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        base = datetime(2026, 10, 1, 8, 0)
+        self._visits = [
+            [f"{('MSC', 'MSK', 'CGM')[i % 3]}{400 + i}", f"{400 + i}", f"VESSEL {i}", ("MSC", "MSK", "CGM")[i % 3],
+             None if i % 11 == 0 else str(9000000 + i), base + timedelta(hours=i)]
+            for i in range(visits)
+        ]
+
+    def connect(self):
+        with self._lock:
+            self.stats["connections"] += 1
+        return FakeConnection(self)
+
+    @staticmethod
+    def _wait(seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def _rows(self):
+        with self._lock:
+            for visit in self._visits:
+                if self._rnd.random() < self.change_rate:
+                    visit[5] += timedelta(minutes=self._rnd.randint(5, 90))
+            return [
+                (visit_id, voyage, name, code, imo, etc.strftime("%Y-%m-%dT%H:%M:%S.000+01:00"))
+                for visit_id, voyage, name, code, imo, etc in self._visits
+            ]
+
+    def _document(self, rows):
+        operations = "".join(
+            "<comercialOperation>" + "".join(
+                f"<{tag}>{xml_escape(value)}</{tag}>"
+                for tag, value in zip(self.ROW_COLUMNS[1:], row[1:]) if value is not None
+            ) + "</comercialOperation>"
+            for row in rows
+        )
+        return (
+            "<TerminalComercialOperation><header><msgVersion>1.0</msgVersion>"
+            f"<GenerationTime>{datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]}+01:00</GenerationTime>"
+            "<sender>APMT</sender><msgFunction>TerminalComercialOperationETC</msgFunction></header>"
+            f"<body><comercialOperations>{operations}</comercialOperations></body></TerminalComercialOperation>"
+        )
+
+    def _query(self, sql, cursor):
+        with self._lock:
+            self.stats["queries"] += 1
+            failed = self.error_rate > 0 and self._rnd.random() < self.error_rate
+            if failed:
+                self.stats["errors"] += 1
+        if sql.strip().upper() == "SELECT 1":
+            cursor.description, cursor._rows = [("",)], [(1,)]
+            return
+        self._wait(self.query_latency)
+        if failed:
+            raise RuntimeError("Mock sparcsN4 query failure")
+        rows = self._rows()
+        if "FOR XML" in sql:
+            cursor.description, cursor._rows = [("",)], [(self._document(rows),)]
+        else:
+            cursor.description, cursor._rows = [(column,) for column in self.ROW_COLUMNS], rows
+        cursor._position = 0
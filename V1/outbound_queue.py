@@ -0,0 +1,241 @@
+import time
+import random
+import sqlite3
+import asyncio
+import threading
+import traceback
+import logging
+local_logger = logging.getLogger(__name__)
+
+
+class OutboundQueue:
+    """Durable SQLite-backed queue of outgoing messages with retry and backoff.
+
+    Each destination is registered with an async send function returning
+    True on success. Messages of a destination are delivered in order, up to
+    `concurrency` at a time. Failed sends are retried with exponential
+    backoff and jitter, capped at `max_delay`. Enqueuing with `supersede=True` drops the
+    pending messages of the same destination and kind, so only the newest
+    full message is kept. An `on_delivered` callback given to enqueue() runs
+    once that message has been sent successfully, never when it is superseded
+    or dropped; callbacks live in memory only, so after a restart a message
+    still delivered from the database runs none.
+    """
+
+    def __init__(self, path, base_delay=2.0, max_delay=60.0, max_attempts=None, poll_interval=1.0):
+        self.path = path
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+
+        self.destinations = {}
+        self._delivery_hooks = {}
+        self._in_flight = set()
+        self._tasks = set()
+        self._wakeup = None
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS outbound (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                destination TEXT NOT NULL,
+                kind TEXT,
+                payload BLOB NOT NULL,
+                created REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbound_due ON outbound (next_attempt, id)")
+
+    def register_destination(self, name, send_fn, concurrency=1):
+        self.destinations[name] = {"send": send_fn, "concurrency": concurrency}
+
+    def _execute(self, sql, params=()):
+        with self._db_lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _enqueue_blocking(self, destination, payload, kind, supersede):
+        now = time.time()
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                superseded = []
+                if supersede and kind is not None:
+                    superseded = [row[0] for row in self._db.execute(
+                        "SELECT id FROM outbound WHERE destination = ? AND kind = ?", (destination, kind)
+                    ).fetchall()]
+                    self._db.execute("DELETE FROM outbound WHERE destination = ? AND kind = ?", (destination, kind))
+                message_id = self._db.execute(
+                    "INSERT INTO outbound (destination, kind, payload, created, next_attempt) VALUES (?, ?, ?, ?, ?)",
+                    (destination, kind, payload, now, now)
+                ).lastrowid
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return message_id, superseded
+
+    async def enqueue(self, destination, payload, kind=None, supersede=True, on_delivered=None):
+        if destination not in self.destinations:
+            raise ValueError(f"Unknown outbound destination: {destination}")
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        message_id, superseded = await asyncio.to_thread(self._enqueue_blocking, destination, payload, kind, supersede)
+        for superseded_id in superseded:
+            self._delivery_hooks.pop(superseded_id, None)
+        if on_delivered is not None:
+            self._delivery_hooks[message_id] = on_delivered
+        if superseded:
+            local_logger.info("Outbound message %s (%s/%s) superseded %s pending message(s)", message_id, destination, kind, len(superseded))
+        else:
+            local_logger.debug("Outbound message %s queued for %s", message_id, destination)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return message_id
+
+    async def pending(self):
+        rows = await asyncio.to_thread(self._execute, "SELECT destination, COUNT(*) FROM outbound GROUP BY destination")
+        return dict(rows)
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        # Equal jitter: keep at least half the delay, spread the rest
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _deliver(self, message_id, destination, payload, attempts):
+        config = self.destinations[destination]
+        try:
+            sent = await config["send"](payload)
+            error = None if sent else "send returned False"
+        except Exception as e:
+            sent = False
+            error = str(traceback.format_exc())
+
+        if sent:
+            await asyncio.to_thread(self._execute, "DELETE FROM outbound WHERE id = ?", (message_id,))
+            if attempts:
+                # The destination is reachable again: retry its other backlog right away
+                await asyncio.to_thread(
+                    self._execute, "UPDATE outbound SET next_attempt = ? WHERE destination = ?",
+                    (time.time(), destination)
+                )
+            local_logger.info("Outbound message %s delivered to %s after %s attempt(s)", message_id, destination, attempts + 1)
+            hook = self._delivery_hooks.pop(message_id, None)
+            if hook is not None:
+                try:
+                    hook()
+                except Exception as e:
+                    local_logger.error("Delivery callback of outbound message %s failed: %s", message_id, str(traceback.format_exc()))
+            return
+
+        attempts += 1
+        if self.max_attempts is not None and attempts >= self.max_attempts:
+            await asyncio.to_thread(self._execute, "DELETE FROM outbound WHERE id = ?", (message_id,))
+            self._delivery_hooks.pop(message_id, None)
+            local_logger.error("Outbound message %s to %s dropped after %s attempt(s): %s", message_id, destination, attempts, error)
+            return
+        delay = self._backoff(attempts)
+        await asyncio.to_thread(
+            self._execute, "UPDATE outbound SET attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+            (attempts, time.time() + delay, error, message_id)
+        )
+        local_logger.warning("Outbound message %s to %s failed (attempt %s), retrying in %.1fs", message_id, destination, attempts, delay)
+
+    async def _dispatch_due(self):
+        """Start delivery of the oldest messages of each destination, keeping them in order.
+
+        Returns the number of seconds until the next waiting message becomes
+        due, or None when nothing is waiting outside of in-flight deliveries.
+        """
+        rows = await asyncio.to_thread(
+            self._execute, "SELECT id, destination, attempts, next_attempt FROM outbound ORDER BY id"
+        )
+        now = time.time()
+        next_due = None
+        heads = {}
+        for message_id, destination, attempts, next_attempt in rows:
+            config = self.destinations.get(destination)
+            if config is None:
+                continue
+            # Only the `concurrency` oldest messages of a destination are eligible, newer ones wait their turn
+            position = heads.get(destination, 0)
+            heads[destination] = position + 1
+            if position >= config["concurrency"] or message_id in self._in_flight:
+                continue
+            if next_attempt > now:
+                wait = next_attempt - now
+                next_due = wait if next_due is None else min(next_due, wait)
+                continue
+            payload_rows = await asyncio.to_thread(self._execute, "SELECT payload FROM outbound WHERE id = ?", (message_id,))
+            if not payload_rows:
+                continue
+            self._in_flight.add(message_id)
+            task = asyncio.create_task(self._deliver(message_id, destination, payload_rows[0][0], attempts))
+            self._tasks.add(task)
+            task.add_done_callback(lambda t, mid=message_id: self._on_delivered(t, mid))
+        return next_due
+
+    def _on_delivered(self, task, message_id):
+        self._tasks.discard(task)
+        self._in_flight.discard(message_id)
+        # The next message of that destination may be eligible now
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run_worker(self, stop_event):
+        """Deliver messages until stop_event is set; used in daemon mode."""
+        self._wakeup = asyncio.Event()
+        while not stop_event.is_set():
+            self._wakeup.clear()
+            wait = await self._dispatch_due()
+            wait = self.poll_interval if wait is None else min(max(wait, 0.01), self.poll_interval)
+            stopper = asyncio.ensure_future(stop_event.wait())
+            waker = asyncio.ensure_future(self._wakeup.wait())
+            await asyncio.wait([stopper, waker], timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+            stopper.cancel()
+            waker.cancel()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def drain(self, timeout):
+        """Deliver what can be delivered within `timeout` seconds; used by one-shot runs."""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = await self._dispatch_due()
+            remaining = deadline - time.monotonic()
+            if self._tasks:
+                await asyncio.wait(list(self._tasks), timeout=max(0.0, remaining), return_when=asyncio.FIRST_COMPLETED)
+                if time.monotonic() < deadline:
+                    continue
+                break
+            if wait is None or remaining <= 0 or wait > remaining:
+                break
+            await asyncio.sleep(wait)
+        left = await self.pending()
+        if left:
+            local_logger.warning("Outbound messages still pending for the next run: %s", left)
+        return not left
+
+    async def cancel_deliveries(self):
+        """Cancel the sends still running and wait for them; their messages stay queued for the next run.
+
+        A bounded drain() can return while a send is still waiting on its
+        destination's timeout: called before the HTTP clients and the database
+        are closed underneath it.
+        """
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            local_logger.warning("Outbound queue: %s delivery(ies) still running cancelled, kept for the next run", len(tasks))
+        self._in_flight.clear()
+        return len(tasks)
+
+    def close(self):
+        with self._db_lock:
+            self._db.close()
@@ -0,0 +1,88 @@
+import asyncio
+import signal
+import time
+import traceback
+import logging
+local_logger = logging.getLogger(__name__)
+
+
+class CycleScheduler:
+    """Runs each registered job on its own fixed interval until stopped.
+
+    Jobs never overlap with themselves: the next run of a job starts
+    `interval` seconds after the previous one started, or right away if the
+    previous run took longer than the interval.
+    """
+
+    def __init__(self, shutdown_timeout=60.0):
+        self.shutdown_timeout = shutdown_timeout
+        self.jobs = []
+        self.services = []
+        self._stop_event = None
+
+    def add_job(self, name, interval, coro_fn):
+        if interval <= 0:
+            raise ValueError(f"Interval for job '{name}' must be positive, got {interval}")
+        self.jobs.append((name, float(interval), coro_fn))
+
+    def add_service(self, name, coro_fn):
+        # Long-running background task, called as coro_fn(stop_event) and expected to return once it is set
+        self.services.append((name, coro_fn))
+
+    def stop(self):
+        if self._stop_event is not None and not self._stop_event.is_set():
+            local_logger.info("Scheduler stop requested, finishing in-flight cycles...")
+            self._stop_event.set()
+
+    async def _run_job(self, name, interval, coro_fn):
+        cycle = 0
+        while not self._stop_event.is_set():
+            cycle += 1
+            started = time.perf_counter()
+            try:
+                await coro_fn()
+            except Exception as e:
+                local_logger.error("Job '%s' cycle %s failed: %s", name, cycle, str(traceback.format_exc()))
+            elapsed = time.perf_counter() - started
+            delay = max(0.0, interval - elapsed)
+            local_logger.debug("Job '%s' cycle %s took %.3fs, next run in %.1fs", name, cycle, elapsed, delay)
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # add_signal_handler is not available on Windows event loops
+                signal.signal(sig, lambda *_: loop.call_soon_threadsafe(self.stop))
+
+    async def run(self):
+        if not self.jobs:
+            raise ValueError("CycleScheduler.run() called without any registered job")
+        self._stop_event = asyncio.Event()
+        self._install_signal_handlers()
+
+        local_logger.info(
+            "Scheduler started: " + ", ".join(f"{name} every {interval:g}s" for name, interval, _ in self.jobs)
+        )
+        tasks = [
+            asyncio.create_task(self._run_job(name, interval, coro_fn), name=name)
+            for name, interval, coro_fn in self.jobs
+        ]
+        tasks += [
+            asyncio.create_task(coro_fn(self._stop_event), name=name)
+            for name, coro_fn in self.services
+        ]
+
+        await self._stop_event.wait()
+        done, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+        for task in pending:
+            local_logger.warning("Job '%s' did not finish within %ss, cancelling.", task.get_name(), self.shutdown_timeout)
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        local_logger.info("Scheduler stopped.")
@@ -0,0 +1,56 @@
+import os
+import json
+import logging
+local_logger = logging.getLogger(__name__)
+
+# Quay geometry of the original single-terminal setup
+DEFAULT_QUAY = {"start_index": 0, "end_index": 1585, "last_bollard": 81, "bollard_spacing": 20}
+
+DEFAULT_TERMINAL = {
+    "code": "MAPTMTM",
+    "quay": DEFAULT_QUAY,
+    "agency": None,     # None keeps xml_builder.agency
+    "send_url": None,   # None keeps BP_XML_SEND_URL
+    "file_suffix": "",  # keeps BerthPlan_snapshot.json unchanged
+}
+
+
+def load_terminals(path=None):
+    """Return the terminal configurations from TERMINALS_CONFIG, or the default terminal.
+
+    The file holds a JSON list of objects with a required "code" and optional
+    "quay" (BerthMetricCalculator arguments), "agency" (operator code to
+    marine agent) and "send_url" (TC1 Berth Plan endpoint).
+    """
+    path = path or os.getenv("TERMINALS_CONFIG")
+    if not path:
+        return [dict(DEFAULT_TERMINAL)]
+
+    with open(path) as file:
+        entries = json.load(file)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path} must contain a non-empty JSON list of terminals")
+
+    terminals = []
+    codes = set()
+    for entry in entries:
+        code = entry.get("code")
+        if not code:
+            raise ValueError(f"Terminal without 'code' in {path}: {entry}")
+        if code in codes:
+            raise ValueError(f"Duplicate terminal code in {path}: {code}")
+        codes.add(code)
+
+        unknown = set(entry.get("quay", {})) - set(DEFAULT_QUAY)
+        if unknown:
+            raise ValueError(f"Unknown quay setting(s) for terminal {code}: {sorted(unknown)}")
+        terminals.append({
+            "code": code,
+            "quay": dict(DEFAULT_QUAY, **entry.get("quay", {})),
+            "agency": entry.get("agency"),
+            "send_url": entry.get("send_url"),
+            "file_suffix": f"_{code}",
+        })
+
+    local_logger.info("Loaded %s terminal(s) from %s: %s", len(terminals), path, sorted(codes))
+    return terminals
@@ -0,0 +1,71 @@
+import os
+import sys
+
+import pytest
+
+# The pipeline modules live flat in V1 and import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def services(monkeypatch, tmp_path):
+    """Mock Maersk / TC1 / sparcsN4 behind a fresh main module state, in a scratch directory."""
+    import main
+    from mock_services import MockServices, FakeSparcsDatabase, Behaviour
+
+    services = MockServices(berths=20, tc1_etc=Behaviour(), tc1_bp=Behaviour())
+    services.database = FakeSparcsDatabase(visits=20, change_rate=0.5)
+    monkeypatch.chdir(tmp_path)
+    for name, value in services.environ().items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setenv("ARCHIVE_DIR", str(tmp_path / "archive"))
+    monkeypatch.setenv("METRICS_SUMMARY_FILE", str(tmp_path / "metrics_summary.json"))
+    monkeypatch.delenv("OUTBOUND_QUEUE_PATH", raising=False)
+    for name, value in (("http_pool", None), ("archive", None), ("etc_handler", None), ("bp_handlers", []),
+                        ("outbound_queue", None), ("dry_run", False)):
+        monkeypatch.setattr(main, name, value)
+    return services
+
+
+@pytest.fixture
+def start_pipelines(services):
+    """main.setup() of the given pipelines, wired to the mock services."""
+    import main
+    from db_pool import OdbcConnectionPool
+
+    def start(pipelines):
+        main.setup(pipelines)
+        main.http_pool.transport = services.transport()
+        if main.etc_handler is not None:
+            main.etc_handler.db_pool = OdbcConnectionPool(connect=services.database.connect)
+
+    return start
+
+
+@pytest.fixture
+def berth():
+    """Factory of Berth Plan API records: berth(index, **fields) overrides the defaults of call `index`."""
+    def make(index, **fields):
+        record = {
+            "arrivalVoyage": f"{410 + index}N",
+            "vesselName": f"VESSEL {index}",
+            "vesselCode": f"V{index:03d}",
+            "imoCode": str(9000000 + index),
+            "vesselLOA": 294.13,
+            "plannedBollard": f"B{20 + index}",
+            "isStarboardBerth": "1" if index % 2 else "0",
+            "etb": "2026-10-12T06:00:00",
+            "etd": "2026-10-13T18:30:00.000",
+            "etc": "2026-10-13T12:00:00",
+            "operatorCode": "MSK",
+            "service_Route": "ME1",
+            "serviceName": "Med Express",
+            "plannedLoadMoves": 640,
+            "plannedDischargeMoves": 712,
+            "plannedShiftingMoves": 18,
+            "averageCranes": 3.456,
+        }
+        record.update(fields)
+        return record
+
+    return make
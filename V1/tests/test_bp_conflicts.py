@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from berth_call import parse_berth_calls
+from bp_conflicts import berth_calls, find_conflicts
+from metrics import BerthMetricCalculator
+
+
+def random_plan(berth, count, seed):
+    rnd = random.Random(seed)
+    records = []
+    for index in range(count):
+        day, hour = rnd.randint(1, 10), rnd.randint(0, 20)
+        records.append(berth(
+            index, plannedBollard=rnd.choice([f"B{rnd.randint(10, 81)}", f"B{rnd.randint(10, 81)}.{rnd.randint(1, 9)}", ""]),
+            vesselLOA=rnd.choice([199.9, 294.13, 366.0]), isStarboardBerth="1" if rnd.random() < 0.5 else "0",
+            etb=f"2026-10-{day:02d}T{hour:02d}:00:00",
+            etd=f"2026-10-{day + rnd.randint(0, 2):02d}T{rnd.randint(0, 23):02d}:00:00",
+        ))
+    return parse_berth_calls(records)[0]
+
+
+def brute_force(windows):
+    pairs = set()
+    for i, (etb, etd, low, high, call) in enumerate(windows):
+        for other_etb, other_etd, other_low, other_high, other in windows[i + 1:]:
+            if etb < other_etd and other_etb < etd and low < other_high and other_low < high:
+                pairs.add(frozenset((call.voyage, other.voyage)))
+    return pairs
+
+
+@pytest.mark.parametrize("count, seed", [(0, 1), (20, 2), (200, 3), (500, 4)])
+def test_find_conflicts_matches_brute_force(berth, count, seed):
+    metrics = BerthMetricCalculator()
+    calls = random_plan(berth, count, seed)
+
+    conflicts = find_conflicts(metrics, calls)
+
+    found = [frozenset(berth["voyageNumber"] for berth in conflict["berths"]) for conflict in conflicts]
+    assert len(found) == len(set(found))
+    assert set(found) == brute_force(berth_calls(metrics, calls))
+
+
+def test_find_conflicts_report(berth):
+    metrics = BerthMetricCalculator()
+    calls = parse_berth_calls([
+        berth(1, plannedBollard="B40", vesselLOA=200.0, isStarboardBerth="1", etb="2026-10-12T06:00:00", etd="2026-10-12T20:00:00"),
+        berth(2, plannedBollard="B45", vesselLOA=200.0, isStarboardBerth="1", etb="2026-10-12T10:00:00", etd="2026-10-13T04:00:00"),
+        # Back to back with the first call, still alongside with the second one
+        berth(3, plannedBollard="B40", vesselLOA=200.0, isStarboardBerth="1", etb="2026-10-12T20:00:00", etd="2026-10-13T02:00:00"),
+        # Touching the first call on the quay; then two calls on the mock position
+        berth(4, plannedBollard="B35", vesselLOA=100.0, isStarboardBerth="1", etb="2026-10-12T12:00:00", etd="2026-10-12T14:00:00"),
+        berth(5, plannedBollard="", vesselLOA=300.0, isStarboardBerth="1", etb="2026-10-12T06:00:00", etd="2026-10-12T20:00:00"),
+        berth(6, plannedBollard="", vesselLOA=300.0, isStarboardBerth="1", etb="2026-10-12T06:00:00", etd="2026-10-12T20:00:00"),
+    ])[0]
+
+    conflicts = find_conflicts(metrics, calls)
+
+    assert [(conflict["quay"], conflict["from"], conflict["to"]) for conflict in conflicts] == [
+        ([865, 965.0], "2026-10-12T10:00:00.000Z", "2026-10-12T20:00:00.000Z"),
+        ([865, 965.0], "2026-10-12T20:00:00.000Z", "2026-10-13T02:00:00.000Z"),
+    ]
+    assert [berth["voyageNumber"] for berth in conflicts[0]["berths"]] == ["411N", "412N"]
+    assert [berth["voyageNumber"] for berth in conflicts[1]["berths"]] == ["412N", "413N"]
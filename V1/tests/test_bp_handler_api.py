@@ -0,0 +1,43 @@
+import asyncio
+
+import main
+from token_manager import TokenError
+
+
+def test_failed_shard_cancels_the_other_shards(services, start_pipelines, monkeypatch):
+    monkeypatch.setenv("BP_FETCH_SHARD_DAYS", "7")
+    monkeypatch.setenv("BP_FETCH_CONCURRENCY", "2")
+    start_pipelines(("bp",))
+    handler = main.bp_handlers[0]
+    shards = handler.shard_params()
+    assert len(shards) > 2
+
+    started, cancelled = [], []
+
+    async def get_berth_plan(params, stream=False):
+        if params["fromDate"] == shards[1]["fromDate"]:
+            raise TokenError(401, "invalid_client")
+        started.append(params["fromDate"])
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.append(params["fromDate"])
+            raise
+
+    monkeypatch.setattr(handler, "_get_berth_plan", get_berth_plan)
+
+    async def run():
+        try:
+            result = await asyncio.wait_for(handler.berthPlan_api_proxy(), timeout=5)
+            others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        finally:
+            await main.shutdown()
+        return result, others
+
+    result, others = asyncio.run(run())
+
+    assert result["status"] == "error"
+    assert result["status_code"] == 401
+    # Nothing left running against the HTTP pool, every shard that got a request in was cancelled
+    assert others == []
+    assert started and sorted(cancelled) == sorted(started)
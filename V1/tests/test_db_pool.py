@@ -0,0 +1,62 @@
+import time
+import asyncio
+import sqlite3
+
+from db_pool import OdbcConnectionPool
+
+
+class TrackedConnection:
+    def __init__(self):
+        self.cnxn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.closed = False
+
+    def cursor(self):
+        return self.cnxn.cursor()
+
+    def close(self):
+        self.closed = True
+        self.cnxn.close()
+
+
+def slow_query(cnxn, seconds):
+    time.sleep(seconds)
+    cursor = cnxn.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def test_close_does_not_block_the_event_loop():
+    connections = []
+
+    def connect():
+        connections.append(TrackedConnection())
+        return connections[-1]
+
+    async def run():
+        pool = OdbcConnectionPool(connect=connect)
+        query = asyncio.create_task(pool.run(slow_query, 0.3))
+        await asyncio.sleep(0.05)
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        await pool.close()
+        ticking.cancel()
+        return await query, ticks
+
+    result, ticks = asyncio.run(run())
+
+    assert result == 1
+    # The loop kept running while close() waited for the query
+    assert ticks >= 10
+    # The connection of the running query is closed too, not left checked in
+    assert [cnxn.closed for cnxn in connections] == [True]
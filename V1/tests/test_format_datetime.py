@@ -0,0 +1,69 @@
+"""format_datetime() against the strptime-based version it replaced.
+
+Naive timestamps must come out exactly as before; explicit UTC and offsets
+are now converted to UTC instead of being passed through or relabelled.
+"""
+import random
+from datetime import datetime
+
+import pytest
+
+from xml_builder import format_datetime
+
+
+def baseline_format_datetime(dt_string):
+    if not dt_string:
+        return ""
+    try:
+        if 'T' in dt_string:
+            if '.' in dt_string:
+                dt = datetime.strptime(dt_string, "%Y-%m-%dT%H:%M:%S.%f")
+            else:
+                dt = datetime.strptime(dt_string, "%Y-%m-%dT%H:%M:%S")
+        else:
+            dt = datetime.fromisoformat(dt_string.replace('Z', '+00:00'))
+        return dt.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    except ValueError:
+        return dt_string
+
+
+@pytest.mark.parametrize("dt_string", [
+    "", "2026-10-12", "2026-10-12T06:00:00", "2026-10-12T06:00:00.000", "2026-10-12T06:00:00.123456",
+    "2026-10-12 06:00:00", "2026-10-12 06:00", "2024-02-29T23:59:59", "2026-02-30T06:00:00",
+    "2026-10-12T06:00", "2026-10-12T06:00:00.1234567", "2026-10-12T06:00:00,5", "2026-10-12T6:00:00",
+    "2026-10-12T06:00:00.", "TBD", "12/10/2026",
+])
+def test_naive_timestamps_unchanged(dt_string):
+    assert format_datetime(dt_string) == baseline_format_datetime(dt_string)
+
+
+def random_naive_timestamp(rnd):
+    date = rnd.choice(["2026-10-12", "2024-02-29", "2026-02-30", "2026-1-12", "2026-12-31"])
+    if rnd.random() < 0.15:
+        return date
+    hour = rnd.choice(["06", "6", "23", "24"])
+    time = f"{hour}:{rnd.choice(['00', '59', '7'])}"
+    if rnd.random() < 0.8:
+        time += f":{rnd.choice(['00', '30', '60', '5'])}"
+        if rnd.random() < 0.5:
+            time += rnd.choice([".", ","]) + "".join(rnd.choice("0123456789") for _ in range(rnd.randint(0, 9)))
+    return f"{date}{rnd.choice('TT ')}{time}"
+
+
+def test_random_naive_timestamps_unchanged():
+    rnd = random.Random(14)
+    for _ in range(5000):
+        dt_string = random_naive_timestamp(rnd)
+        assert format_datetime(dt_string) == baseline_format_datetime(dt_string), dt_string
+
+
+@pytest.mark.parametrize("dt_string, expected", [
+    ("2026-10-12T06:00:00Z", "2026-10-12T06:00:00.000Z"),
+    ("2026-10-12T06:00:00.000Z", "2026-10-12T06:00:00.000Z"),
+    ("2026-10-12T06:00Z", "2026-10-12T06:00:00.000Z"),
+    ("2026-10-12T06:00:00+02:00", "2026-10-12T04:00:00.000Z"),
+    ("2026-10-12T01:00:00-03:30", "2026-10-12T04:30:00.000Z"),
+    ("2026-10-12 01:00:00+0100", "2026-10-12T00:00:00.000Z"),
+])
+def test_utc_offsets_converted(dt_string, expected):
+    assert format_datetime(dt_string) == expected
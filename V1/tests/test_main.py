@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+import main
+
+
+def test_incremental_etc_replaces_undelivered_deltas(services, start_pipelines, monkeypatch, tmp_path):
+    monkeypatch.setenv("OUTBOUND_QUEUE_PATH", str(tmp_path / "queue.db"))
+    monkeypatch.setenv("ETC_MODE", "incremental")
+    monkeypatch.setenv("QUEUE_BASE_DELAY_SECONDS", "0.01")
+    monkeypatch.setenv("QUEUE_MAX_DELAY_SECONDS", "0.01")
+    start_pipelines(("etc",))
+    services.behaviours["tc1_etc"].error_rate = 1.0
+
+    async def run():
+        try:
+            for _ in range(3):
+                assert await main.run_etc_pipeline()
+                await main.outbound_queue.drain(timeout=0.05)
+            # TC1 down: one message waiting, carrying every change of the three cycles
+            assert await main.outbound_queue.pending() == {"tc1_etc": 1}
+            assert main.etc_handler.last_sent_etc == {}
+
+            services.behaviours["tc1_etc"].error_rate = 0.0
+            delivered_before = services.stats["tc1_etc"]["requests"] - services.stats["tc1_etc"]["errors"]
+            assert await main.outbound_queue.drain(timeout=2)
+            delivered = services.stats["tc1_etc"]["requests"] - services.stats["tc1_etc"]["errors"] - delivered_before
+        finally:
+            await main.shutdown()
+        return delivered
+
+    delivered = asyncio.run(run())
+
+    assert delivered == 1
+    assert len(main.etc_handler.last_sent_etc) == 20
+
+
+def old_partition(tmp_path):
+    # Archived by an earlier run, long past ARCHIVE_RETENTION_DAYS; indexed when the archive opens
+    partition = tmp_path / "archive" / "2000-01-01"
+    partition.mkdir(parents=True)
+    (partition / "APMT_BP_000000_000000.xml").write_bytes(b"<old/>")
+    return partition
+
+
+def test_bp_only_run_expires_old_archive_partitions(services, start_pipelines, tmp_path):
+    partition = old_partition(tmp_path)
+    start_pipelines(("bp",))
+    assert "2000-01-01" in main.archive.index
+
+    asyncio.run(main.run_once())
+
+    assert main.etc_handler is None
+    assert not partition.exists()
+    assert "2000-01-01" not in main.archive.index
+
+
+def test_bp_daemon_schedules_archive_retention(services, start_pipelines, monkeypatch, tmp_path):
+    import scheduler
+
+    partition = old_partition(tmp_path)
+    monkeypatch.setenv("METRICS_PORT", "0")
+    start_pipelines(("bp",))
+    jobs = {}
+
+    async def run(self):
+        jobs.update((name, coro_fn) for name, interval, coro_fn in self.jobs)
+        await jobs["Archive retention"]()
+
+    monkeypatch.setattr(scheduler.CycleScheduler, "run", run)
+    asyncio.run(main.run_daemon())
+
+    assert "ETC" not in jobs
+    assert not partition.exists()
+
+
+@pytest.mark.parametrize("argv", [["bp"], ["dry-run", "bp"], ["daemon", "bp"]])
+def test_bp_commands_expire_old_archive_partitions(services, start_pipelines, monkeypatch, tmp_path, argv):
+    import scheduler
+
+    partition = old_partition(tmp_path)
+    monkeypatch.setenv("METRICS_PORT", "0")
+    setup = main.setup
+
+    def setup_against_mocks(pipelines):
+        # cli() sets up the selected pipelines itself, wired here to the mock services
+        monkeypatch.setattr(main, "setup", setup)
+        start_pipelines(pipelines)
+
+    monkeypatch.setattr(main, "setup", setup_against_mocks)
+    monkeypatch.setattr(main, "load_env", lambda: None)
+    monkeypatch.setattr(main, "setup_logging", lambda: None)
+
+    async def run(self):
+        for name, interval, coro_fn in self.jobs:
+            await coro_fn()
+
+    monkeypatch.setattr(scheduler.CycleScheduler, "run", run)
+    main.cli(argv)
+
+    assert main.etc_handler is None
+    assert not partition.exists()
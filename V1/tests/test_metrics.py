@@ -0,0 +1,146 @@
+import random
+
+import pytest
+
+from berth_call import parse_berth_calls
+from metrics import IntervalIndex, BerthMetricCalculator
+
+
+def brute_force_pairs(intervals):
+    pairs = set()
+    for i, (start, end, item) in enumerate(intervals):
+        for other_start, other_end, other in intervals[i + 1:]:
+            if min(start, end) < max(other_start, other_end) and min(other_start, other_end) < max(start, end):
+                pairs.add(frozenset((item, other)))
+    return pairs
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_overlapping_pairs_matches_brute_force(seed):
+    rnd = random.Random(seed)
+    intervals = []
+    for item in range(300):
+        start = rnd.randint(0, 1585)
+        end = start + rnd.choice([-1, 1]) * rnd.choice([20, 199.9, 294.13, 366])
+        intervals.append((start, end, item))
+    # Touching and identical segments
+    intervals += [(100, 200, "a"), (200, 300, "b"), (100, 200, "c")]
+
+    pairs = IntervalIndex(intervals).overlapping_pairs()
+
+    assert len(pairs) == len(set(map(frozenset, pairs)))
+    assert set(map(frozenset, pairs)) == brute_force_pairs(intervals)
+
+
+def test_overlapping_pairs_order_and_timestamps():
+    index = IntervalIndex([
+        ("2026-10-12T18:00:00.000Z", "2026-10-13T06:00:00.000Z", "late"),
+        ("2026-10-12T06:00:00.000Z", "2026-10-12T20:00:00.000Z", "early"),
+        ("2026-10-13T06:00:00.000Z", "2026-10-13T08:00:00.000Z", "back-to-back"),
+    ])
+
+    assert len(index) == 3
+    assert index.overlapping_pairs() == [("early", "late")]
+
+
+@pytest.mark.parametrize("metric_point, planned_bollard", [
+    # Quay ends: B2 is the first bollard, B81 the last, each followed by up to 9 sub-bollards of 2 m
+    (5, "B2"), (23, "B2.9"), (25, "B3"), (1585, "B81"), (1603, "B81.9"),
+    (871, "B45.3"), (870.4, "B45.3"), (883, "B45.9"),
+    (4, None), (0, None), (-20, None), (1605, None), (2000, None),
+])
+def test_bollard_for_point(metric_point, planned_bollard):
+    assert BerthMetricCalculator().bollard_for_point(metric_point) == planned_bollard
+
+
+def test_bollard_for_point_round_trips_every_bollard():
+    metrics = BerthMetricCalculator()
+    for number in range(2, 82):
+        for sub in range(10):
+            planned_bollard = f"B{number}.{sub}" if sub else f"B{number}"
+            assert metrics.bollard_for_point(metrics.resolve_bollard(planned_bollard)) == planned_bollard
+
+
+def test_quay_index_overlapping_matches_brute_force(berth):
+    rnd = random.Random(22)
+    metrics = BerthMetricCalculator()
+    bollards = ["B2", "B2.9", "B81", "B81.9", "", "Q7"] + [f"B{rnd.randint(2, 81)}.{rnd.randint(0, 9)}" for _ in range(200)]
+    calls = parse_berth_calls([
+        berth(index, plannedBollard=bollard, vesselLOA=rnd.choice([20.0, 199.9, 294.13, 366.0]),
+              isStarboardBerth=rnd.choice("01"))
+        for index, bollard in enumerate(bollards)
+    ])[0]
+    index = metrics.quay_index(calls)
+    segments = [(*metrics.segment(call.planned_bollard, call.loa, call.is_starboard), call) for call in calls]
+
+    queries = [(-100, 0), (0, 5), (5, 25), (1565, 1585), (1585, 1700), (1603, 1585), (871, 871.5)]
+    queries += [(rnd.uniform(-50, 1650), rnd.uniform(-50, 1650)) for _ in range(300)]
+    for lo, hi in queries:
+        low, high = min(lo, hi), max(lo, hi)
+        expected = [call.voyage for start, end, call in segments if start < high and end > low]
+        assert sorted(call.voyage for call in index.overlapping(lo, hi)) == sorted(expected)
+    assert len(index) == len(calls)
+
+
+@pytest.mark.parametrize("planned_bollard, unknown", [
+    ("B45", False), (" b45.3 ", False), ("", False), ("Q7", False), (None, False),
+    ("B99", True), ("B45.x", True), ("B", True),
+])
+def test_unknown_bollard(planned_bollard, unknown):
+    metrics = BerthMetricCalculator()
+
+    assert metrics.unknown_bollard(planned_bollard) is unknown
+    if unknown:
+        assert metrics.get_metrics(planned_bollard, 300.0, True) == (1285.0, 1585, False)
+
+
+def test_unknown_bollard_on_every_lookup():
+    # The bollard parse is cached, the check is not: callers report every record
+    metrics = BerthMetricCalculator()
+    results = [metrics.unknown_bollard("B99") for _ in range(3)]
+
+    assert results == [True, True, True]
+    assert metrics.resolve_bollard.cache_info().misses == 1
+
+
+def random_metric_inputs(count, seed):
+    rnd = random.Random(seed)
+    bollards = [
+        rnd.choice([f"B{rnd.randint(0, 81)}", f"B{rnd.randint(0, 81)}.{rnd.randint(1, 9)}", "", "Q7", "B99", None])
+        for _ in range(count)
+    ]
+    # Three decimals put many results on a half-cent tie
+    loas = [round(rnd.uniform(80, 400), rnd.choice([0, 1, 2, 3])) for _ in range(count)]
+    starboard = [rnd.random() < 0.5 for _ in range(count)]
+    return bollards, loas, starboard
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_get_metrics_batch_matches_get_metrics(seed):
+    metrics = BerthMetricCalculator()
+    bollards, loas, starboard = random_metric_inputs(20000, seed)
+    expected = [metrics.get_metrics(*row) for row in zip(bollards, loas, starboard)]
+
+    fores, afts, reals = metrics.get_metrics_batch(bollards, loas, starboard)
+
+    assert list(zip(fores, afts, reals)) == expected
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_get_metrics_batch_numpy_matches_get_metrics(seed):
+    pytest.importorskip("numpy")
+    metrics = BerthMetricCalculator()
+    bollards, loas, starboard = random_metric_inputs(20000, seed)
+    bollards += ["B3", "B73"]
+    loas += [302.015, 203.475]
+    starboard += [False, True]
+    expected = [metrics.get_metrics(*row) for row in zip(bollards, loas, starboard)]
+
+    fores, afts, reals = metrics.get_metrics_batch(bollards, loas, starboard, backend="numpy")
+
+    assert list(zip(fores.tolist(), afts.tolist(), reals.tolist())) == expected
+
+
+def test_get_metrics_batch_checks_lengths():
+    with pytest.raises(ValueError):
+        BerthMetricCalculator().get_metrics_batch(["B1"], [200.0, 300.0], [True])
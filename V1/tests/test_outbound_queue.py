@@ -0,0 +1,66 @@
+import asyncio
+from functools import partial
+
+from outbound_queue import OutboundQueue
+
+
+def test_cancel_deliveries_keeps_the_message_queued(tmp_path):
+    path = str(tmp_path / "queue.db")
+
+    async def run():
+        queue = OutboundQueue(path)
+
+        async def hanging_send(payload):
+            await asyncio.sleep(60)
+            return True
+
+        committed = []
+        queue.register_destination("tc1_etc", hanging_send)
+        await queue.enqueue("tc1_etc", b"<etc/>", kind="etc", on_delivered=lambda: committed.append(True))
+
+        # The drain gives up while the send is still running, as with a send timeout above QUEUE_DRAIN_SECONDS
+        assert not await queue.drain(timeout=0.05)
+        assert await queue.cancel_deliveries() == 1
+        assert await queue.cancel_deliveries() == 0
+        queue.close()
+
+        sent = []
+
+        async def send(payload):
+            sent.append(payload)
+            return True
+
+        reopened = OutboundQueue(path)
+        reopened.register_destination("tc1_etc", send)
+        assert await reopened.drain(timeout=1)
+        reopened.close()
+        return committed, sent
+
+    committed, sent = asyncio.run(run())
+
+    assert committed == []
+    assert sent == [b"<etc/>"]
+
+
+def test_superseded_message_runs_no_callback(tmp_path):
+    async def run():
+        queue = OutboundQueue(str(tmp_path / "queue.db"))
+        sent = []
+
+        async def send(payload):
+            sent.append(payload)
+            return True
+
+        committed = []
+        queue.register_destination("tc1_etc", send)
+        for number in range(3):
+            await queue.enqueue("tc1_etc", f"<etc n='{number}'/>", kind="etc", on_delivered=partial(committed.append, number))
+        assert await queue.pending() == {"tc1_etc": 1}
+        assert await queue.drain(timeout=1)
+        queue.close()
+        return committed, sent
+
+    committed, sent = asyncio.run(run())
+
+    assert sent == [b"<etc n='2'/>"]
+    assert committed == [2]
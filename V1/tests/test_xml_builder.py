@@ -0,0 +1,151 @@
+"""xml_file_builder() output against the original ElementTree builder.
+
+The reference below is the builder as it was before the streaming writer,
+with the strptime-based format_datetime() of test_format_datetime, so
+timestamp formatting is checked independently of the code under test.
+"""
+import re
+import asyncio
+import logging
+from io import BytesIO
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import xml_builder
+from berth_call import parse_berth_calls
+from metrics import BerthMetricCalculator
+from test_format_datetime import baseline_format_datetime
+
+logger = logging.getLogger(__name__)
+
+GENERATION_TIME = re.compile(r"<GenerationTime>[^<]*</GenerationTime>|<GenerationTime />")
+
+
+def baseline_xml(metrics, berth_data_list, start_date, end_date):
+    SOAPENV, TMSA, ns = xml_builder.SOAPENV, xml_builder.TMSA, xml_builder.ns
+    ET.register_namespace('soapenv', SOAPENV)
+    ET.register_namespace('tmsa', TMSA)
+
+    envelope = ET.Element(ns("Envelope", SOAPENV))
+    ET.SubElement(envelope, ns("Header", SOAPENV))
+    body = ET.SubElement(envelope, ns("Body", SOAPENV))
+    process = ET.SubElement(body, ns("processBerthPlan", TMSA))
+    request = ET.SubElement(process, "berthPlanRequest")
+    demande = ET.SubElement(request, "DemandeInitiale")
+
+    header_elem = ET.SubElement(demande, "header")
+    ET.SubElement(header_elem, "msgVersion").text = "3.0"
+    ET.SubElement(header_elem, "GenerationTime").text = ""
+    ET.SubElement(header_elem, "sender").text = "APMT"
+
+    body_elem = ET.SubElement(demande, "body")
+    ET.SubElement(body_elem, "startDate").text = baseline_format_datetime(start_date)
+    ET.SubElement(body_elem, "endDate").text = baseline_format_datetime(end_date)
+    berths = ET.SubElement(body_elem, "berths")
+
+    for berth in berth_data_list:
+        isStarboardBerth = True if berth.get("isStarboardBerth") == "1" else False
+        planned_bollard = berth.get("plannedBollard", "")
+        vessel_loa = berth.get("vesselLOA", 0.0)
+        after_metric_point, forward_metric_point, is_real = metrics.get_metrics(planned_bollard, vessel_loa, isStarboardBerth)
+        berthing_side = "StarbordSide" if isStarboardBerth else "PortSide"
+
+        binfo = ET.SubElement(berths, "berthinformation")
+        ET.SubElement(binfo, "berthPurpose").text = "DischargeLoad"
+        ET.SubElement(binfo, "requestStatus").text = "Reservation"
+        ET.SubElement(binfo, "voyageNumber").text = str(berth.get("arrivalVoyage", ""))
+        ET.SubElement(binfo, "vesselName").text = str(berth.get("vesselName", ""))
+        ET.SubElement(binfo, "vesselCode").text = str(berth.get("vesselCode", ""))
+        ET.SubElement(binfo, "IMO").text = str(berth.get("imoCode", ""))
+        ET.SubElement(binfo, "vesselType").text = "Container"
+        ET.SubElement(binfo, "LOA").text = str(berth.get("vesselLOA", ""))
+        ET.SubElement(binfo, "afterMetricPoint").text = str(after_metric_point)
+        ET.SubElement(binfo, "forwardMetricPoint").text = str(forward_metric_point)
+        ET.SubElement(binfo, "ETB").text = baseline_format_datetime(berth.get("etb", ""))
+        ET.SubElement(binfo, "ETD").text = baseline_format_datetime(berth.get("etd", ""))
+        ET.SubElement(binfo, "ETC").text = baseline_format_datetime(berth.get("etc", ""))
+        ET.SubElement(binfo, "forwardDraught").text = "0"
+        ET.SubElement(binfo, "afterDraught").text = "0"
+        ET.SubElement(binfo, "dockName").text = "1"
+        ET.SubElement(binfo, "EMP").text = str(berth.get("operatorCode", ""))
+        ET.SubElement(binfo, "bowBollard").text = str(forward_metric_point)
+        ET.SubElement(binfo, "berthingSide").text = str(berthing_side)
+        ET.SubElement(binfo, "serviceCode").text = str(berth.get("service_Route", ""))
+        ET.SubElement(binfo, "serviceName").text = str(berth.get("serviceName", ""))
+
+        total_moves = (
+            berth.get("plannedLoadMoves", 0)
+            + berth.get("plannedDischargeMoves", 0)
+            + berth.get("plannedShiftingMoves", 0)
+        )
+        ET.SubElement(binfo, "totalMoves").text = str(total_moves)
+        ET.SubElement(binfo, "dischargeMoves").text = str(berth.get("plannedDischargeMoves", 0))
+        ET.SubElement(binfo, "loadMoves").text = str(berth.get("plannedLoadMoves", 0))
+        ET.SubElement(binfo, "restowMoves").text = str(berth.get("plannedShiftingMoves", 0))
+        ET.SubElement(binfo, "numberOfCranesAvg").text = f"{berth.get('averageCranes', 0.0):.2f}"
+        ET.SubElement(binfo, "marineAgent").text = str(xml_builder.agency.get(berth.get("operatorCode", "NOA"), "NOA"))
+
+        securite = ET.SubElement(binfo, "securite")
+        ET.SubElement(securite, "siCertificatISPS").text = "false"
+        ET.SubElement(securite, "referenceCertificatISPS").text = "0"
+
+    buffer = BytesIO()
+    tree = ET.ElementTree(envelope)
+    ET.indent(tree, space="  ")
+    tree.write(buffer, encoding="utf-8", xml_declaration=True)
+    return buffer.getvalue().decode("utf-8")
+
+
+def without(record, *fields):
+    return {key: value for key, value in record.items() if key not in fields}
+
+
+# Built from the conftest `berth` record factory
+PLANS = {
+    "empty plan": lambda berth: [],
+    "escaping": lambda berth: [
+        berth(1, vesselName="A < B && C > D"),
+        berth(2, vesselName="\"quoted\" 'name'", serviceName="R&D <test>"),
+        berth(3, operatorCode="PEREZ & CIA"),
+    ],
+    "empty leaves": lambda berth: [
+        berth(1, vesselName="", serviceName="", service_Route="", etc=""),
+        without(berth(2), "etb", "arrivalVoyage", "imoCode", "operatorCode"),
+        berth(3, plannedBollard="", averageCranes=0.0),
+        without(berth(4), "plannedBollard", "isStarboardBerth", "plannedShiftingMoves"),
+    ],
+    "non-ASCII": lambda berth: [
+        berth(1, vesselName="CAP SAN ANTÓNIO", serviceName="Ligne Méditerranée → Tanger"),
+        berth(2, vesselName="北京快航", operatorCode="UNKNOWN"),
+        berth(3, serviceName="Çanakkale – Ağrı 🚢"),
+    ],
+    "timestamps": lambda berth: [
+        berth(1, etb="2026-10-12T06:00:00.123456", etd="2026-10-12", etc="2026-10-12 07:15:00"),
+        berth(2, etb="2026-02-30T06:00:00", etd="TBD", etc="2026-10-12T06:00:00.1234567"),
+        berth(3, etb="2026-10-12T23:59:59.999", etd="2026-12-31T00:00:00"),
+    ],
+    "sub-bollards and mock positions": lambda berth: [
+        berth(1, plannedBollard="B45.3"),
+        berth(2, plannedBollard=" b12 "),
+        berth(3, plannedBollard="Q7"),
+        berth(4, plannedBollard="B81.9", isStarboardBerth="0"),
+    ],
+}
+
+
+@pytest.fixture(scope="module")
+def metrics():
+    return BerthMetricCalculator()
+
+
+@pytest.mark.parametrize("name", PLANS)
+def test_xml_file_builder_matches_baseline(metrics, berth, name):
+    records = PLANS[name](berth)
+    calls, rejected = parse_berth_calls(records)
+    assert rejected == 0
+
+    xml_txt = asyncio.run(xml_builder.xml_file_builder(metrics, calls, "2026-10-10", "2026-11-27T00:00:00", logger))
+    expected = baseline_xml(metrics, records, "2026-10-10", "2026-11-27T00:00:00")
+
+    assert GENERATION_TIME.sub("", xml_txt) == GENERATION_TIME.sub("", expected)
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import asyncio
+import traceback
+import logging
+
+from instrumentation import stage_timer
+local_logger = logging.getLogger(__name__)
+
+
+class TokenError(Exception):
+    def __init__(self, status_code, text):
+        super().__init__(f"Token request failed with status code {status_code}")
+        self.status_code = status_code
+        self.text = text
+
+
+class TokenManager:
+    """Caches an OAuth 2.0 client-credentials token until shortly before it expires.
+
+    Concurrent callers share a single refresh request. When `cache_file` and
+    `cache_key` (a Fernet key) are given, the token is also persisted to an
+    encrypted file so a fresh process can reuse it.
+    """
+
+    def __init__(self, token_url, client_id, client_secret, scope,
+                 refresh_margin=60, cache_file=None, cache_key=None):
+        self.token_url = token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+
+        self.access_token = None
+        self.expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+        self._fernet = None
+        self.cache_file = cache_file
+        if cache_file:
+            self._fernet = self._build_fernet(cache_key)
+            if self._fernet is None:
+                self.cache_file = None
+            else:
+                self._load_from_disk()
+
+    @staticmethod
+    def _build_fernet(cache_key):
+        if not cache_key:
+            local_logger.warning("TOKEN_CACHE_FILE is set without TOKEN_CACHE_KEY, on-disk token cache disabled.")
+            return None
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError:
+            local_logger.warning("The 'cryptography' package is not installed, on-disk token cache disabled.")
+            return None
+        try:
+            return Fernet(cache_key.encode() if isinstance(cache_key, str) else cache_key)
+        except Exception as e:
+            local_logger.error("Invalid TOKEN_CACHE_KEY, on-disk token cache disabled: %s", e)
+            return None
+
+    def _load_from_disk(self):
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "rb") as file:
+                payload = json.loads(self._fernet.decrypt(file.read()))
+            self.access_token = payload["access_token"]
+            self.expires_at = float(payload["expires_at"])
+            local_logger.debug("Loaded cached token, valid for %.0fs", self.seconds_left())
+        except Exception as e:
+            local_logger.warning("Ignoring unreadable token cache %s: %s", self.cache_file, e)
+            self.access_token = None
+            self.expires_at = 0.0
+
+    def _save_to_disk(self):
+        try:
+            payload = json.dumps({"access_token": self.access_token, "expires_at": self.expires_at})
+            tmp_file = f"{self.cache_file}.tmp"
+            fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as file:
+                file.write(self._fernet.encrypt(payload.encode()))
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            local_logger.error("Error writing token cache: %s", str(traceback.format_exc()))
+
+    def seconds_left(self):
+        return self.expires_at - time.time()
+
+    def is_valid(self):
+        return self.access_token is not None and self.seconds_left() > self.refresh_margin
+
+    def invalidate(self, token=None):
+        # Only drop the token the caller saw rejected; another caller may already have refreshed it
+        if token is None or token == self.access_token:
+            self.access_token = None
+            self.expires_at = 0.0
+
+    async def get_token(self, client):
+        if self.is_valid():
+            return self.access_token
+
+        async with self._lock:
+            # Another caller may have refreshed the token while we were waiting
+            if self.is_valid():
+                return self.access_token
+            await self._refresh(client)
+            return self.access_token
+
+    async def _refresh(self, client):
+        data = {
+            'grant_type': 'client_credentials',
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'scope': self.scope
+        }
+        with stage_timer("token_fetch"):
+            token_response = await client.post(self.token_url, data=data)
+        if token_response.status_code != 200:
+            raise TokenError(token_response.status_code, token_response.text)
+
+        token_data = token_response.json()
+        if not token_data.get('access_token'):
+            raise TokenError(token_response.status_code, token_response.text)
+        self.access_token = token_data.get('access_token')
+        self.expires_at = time.time() + float(token_data.get('expires_in', 0))
+        local_logger.info("OAuth token refreshed, expires in %.0fs", self.seconds_left())
+
+        if self.cache_file:
+            self._save_to_disk()
@@ -1,11 +1,8 @@
 null = ""
 
-from io import BytesIO
-import xml.etree.ElementTree as ET
-from datetime import datetime
-
-ET.register_namespace('soapenv', "http://schemas.xmlsoap.org/soap/envelope/")
-ET.register_namespace('tmsa', "http://ADEVEAI/TMSA_BERTHPLAN.pub")
+import re
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
 
 SOAPENV = "http://schemas.xmlsoap.org/soap/envelope/"
 TMSA = "http://ADEVEAI/TMSA_BERTHPLAN.pub"
@@ -49,110 +46,452 @@ agency = {
 def ns(tag, namespace):
     return f"{{{namespace}}}{tag}"
 
-def format_datetime(dt_string):
-    if not dt_string:
-        return ""
+# Timestamp shapes sent by the Maersk API: date, date + time, optional seconds / fraction / UTC offset
+TIMESTAMP_RE = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})"
+    r"(?:([T ])(\d{2}):(\d{2})(?::(\d{2})([.,]\d+)?)?)?"
+    r"(Z|[+-]\d{2}(?::?\d{2})?)?$"
+)
+# Time part strptime("%Y-%m-%dT%H:%M:%S[.%f]") reads, for naive "T" timestamps
+STRPTIME_TIME_RE = re.compile(r"\d{2}:\d{2}:\d{2}(?:\.\d{1,6})?")
+UTC_OFFSET_RE = re.compile(r"(?:Z|[+-]\d{2}(?::?\d{2})?)$")
+
+
+def _format_other_datetime(dt_string):
+    # Everything the fast path does not cover, read as the strptime / fromisoformat version did: naive
+    # "T" timestamps it could not parse are passed through unchanged; explicit offsets are converted to UTC
     try:
-        if 'T' in dt_string:
-            if '.' in dt_string:
-                dt = datetime.strptime(dt_string, "%Y-%m-%dT%H:%M:%S.%f")
-            else:
-                dt = datetime.strptime(dt_string, "%Y-%m-%dT%H:%M:%S")
+        if 'T' in dt_string and not UTC_OFFSET_RE.search(dt_string):
+            dt = datetime.strptime(dt_string, "%Y-%m-%dT%H:%M:%S.%f" if '.' in dt_string else "%Y-%m-%dT%H:%M:%S")
         else:
             dt = datetime.fromisoformat(dt_string.replace('Z', '+00:00'))
-        return dt.strftime("%Y-%m-%dT%H:%M:%S.000Z")
     except ValueError:
         # If parsing fails, return the original string
         return dt_string
- 
-async def xml_file_builder(metrics, berth_data_list, start_date, end_date, logger):
-    global agency
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+@lru_cache(maxsize=4096)
+def format_datetime(dt_string):
+    # The same ETB/ETD/ETC values repeat within and across cycles, hence the memo cache
+    if not dt_string:
+        return ""
+    match = TIMESTAMP_RE.match(dt_string)
+    if match is None:
+        return _format_other_datetime(dt_string)
+
+    year, month, day, separator, hour, minute, second, fraction, offset = match.groups()
+    if separator == "T" and not offset and not STRPTIME_TIME_RE.fullmatch(dt_string, 11):
+        # "T06:00", 7+ digit or comma fractions: strptime rejected them, so they are not rewritten either
+        return _format_other_datetime(dt_string)
+    try:
+        dt = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0))
+    except ValueError:
+        return dt_string
+    if offset and offset != "Z":
+        # Timestamps with an offset are converted to UTC, naive ones are taken as UTC already
+        sign = -1 if offset[0] == "-" else 1
+        dt -= sign * timedelta(hours=int(offset[1:3]), minutes=int(offset[-2:]) if len(offset) > 3 else 0)
+        return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}T{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}.000Z"
+    return f"{year}-{month}-{day}T{hour or '00'}:{minute or '00'}:{second or '00'}.000Z"
+
+def xml_escape(text):
+    # Same character data escaping ElementTree applies to element text
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+class XmlStreamWriter:
+    """Writes elements straight to a list of string parts, one record at a time.
+
+    The output matches ElementTree's serialization (with ET.indent when
+    `pretty` is set), without keeping a DOM of the whole document.
+    """
+
+    def __init__(self, pretty=True, space="  "):
+        self.pretty = pretty
+        self.space = space
+        self.depth = 0
+        self.parts = []
+        self.size = 0
+
+    def _indent(self):
+        return "\n" + self.space * self.depth if self.pretty else ""
+
+    def _write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+
+    def start(self, tag, attrs=""):
+        self._write(f"{self._indent()}<{tag}{attrs}>")
+        self.depth += 1
+
+    def end(self, tag):
+        self.depth -= 1
+        self._write(f"{self._indent()}</{tag}>")
+
+    def empty(self, tag):
+        self._write(f"{self._indent()}<{tag} />")
+
+    def leaf(self, tag, text):
+        if text:
+            self._write(f"{self._indent()}<{tag}>{xml_escape(text)}</{tag}>")
+        else:
+            self._write(f"{self._indent()}<{tag} />")
+
+    def flush(self):
+        data = "".join(self.parts).encode("utf-8")
+        self.parts = []
+        self.size = 0
+        return data
+
+FIELD = object()  # leaf text filled in by XmlTemplate.render()
+RECORDS = object()  # element holding the repeated records, see XmlTemplate.tail
+
+ENVELOPE_ATTRS = f' xmlns:soapenv="{SOAPENV}" xmlns:tmsa="{TMSA}"'
+
+BERTH_PLAN_ENVELOPE = ("soapenv:Envelope", (
+    ("soapenv:Header", ""),
+    ("soapenv:Body", (
+        ("tmsa:processBerthPlan", (
+            ("berthPlanRequest", (
+                ("DemandeInitiale", (
+                    ("header", (
+                        ("msgVersion", "3.0"),
+                        ("GenerationTime", FIELD),
+                        ("sender", "APMT"),
+                    )),
+                    ("body", (
+                        ("startDate", FIELD),
+                        ("endDate", FIELD),
+                        ("berths", RECORDS),
+                    )),
+                )),
+            )),
+        )),
+    )),
+))
+
+ETC_FIELDS = ("voyageNumber", "vesselName", "vesselCode", "IMO", "ETC")
+
+ETC_ENVELOPE = ("soapenv:Envelope", (
+    ("soapenv:Header", ""),
+    ("soapenv:Body", (
+        ("tmsa:processETC", (
+            ("ETC", RECORDS),
+        )),
+    )),
+))
+
+ETC_DOCUMENT = ("TerminalComercialOperation", (
+    ("header", (
+        ("msgVersion", "1.0"),
+        ("GenerationTime", FIELD),
+        ("sender", "APMT"),
+        ("msgFunction", "TerminalComercialOperationETC"),
+    )),
+    ("body", (
+        ("comercialOperations", RECORDS),
+    )),
+))
+
+ETC_OPERATION = ("comercialOperation", tuple((tag, FIELD) for tag in ETC_FIELDS))
+
+BERTH_INFORMATION = ("berthinformation", (
+    ("berthPurpose", "DischargeLoad"),
+    ("requestStatus", "Reservation"),
+    ("voyageNumber", FIELD),
+    ("vesselName", FIELD),
+    ("vesselCode", FIELD),
+    ("IMO", FIELD),
+    ("vesselType", "Container"),
+    ("LOA", FIELD),
+    ("afterMetricPoint", FIELD),
+    ("forwardMetricPoint", FIELD),
+    ("ETB", FIELD),
+    ("ETD", FIELD),
+    ("ETC", FIELD),
+    ("forwardDraught", "0"),
+    ("afterDraught", "0"),
+    ("dockName", "1"),
+    ("EMP", FIELD),
+    ("bowBollard", FIELD),
+    ("berthingSide", FIELD),
+    ("serviceCode", FIELD),
+    ("serviceName", FIELD),
+    ("totalMoves", FIELD),
+    ("dischargeMoves", FIELD),
+    ("loadMoves", FIELD),
+    ("restowMoves", FIELD),
+    ("numberOfCranesAvg", FIELD),
+    ("marineAgent", FIELD),
+    ("securite", (
+        ("siCertificatISPS", "false"),
+        ("referenceCertificatISPS", "0"),
+    )),
+))
+
+class XmlTemplate:
+    """Element layout serialized once, leaving slots for the variable leaves.
+
+    `layout` is a (tag, content) tree where content is a constant text, FIELD,
+    a tuple of children, or RECORDS for the element that will hold repeated
+    records. Constant markup is escaped and indented at compile time with the
+    same rules as XmlStreamWriter, so render() only escapes the field values
+    and joins them between pre-built fragments. A None value leaves its
+    element out, as FOR XML PATH does with NULL columns.
+    """
+
+    def __init__(self, layout, depth=0, pretty=True, space="  ", attrs=""):
+        self.pretty = pretty
+        self.space = space
+        self.fields = []
+        self.records_depth = None
+        self._slots = []
+        self._pending = []
+        self._compile(layout, depth, attrs)
+        if self.records_depth is None:
+            self.suffix, self.tail = "".join(self._pending), ""
+        else:
+            self.tail = "".join(self._pending)
+        del self._pending
+
+    def _indent(self, depth):
+        return "\n" + self.space * depth if self.pretty else ""
+
+    def _compile(self, layout, depth, attrs=""):
+        tag, content = layout
+        indent = self._indent(depth)
+        if content is FIELD:
+            before = "".join(self._pending)
+            self._pending = []
+            self._slots.append((f"{before}{indent}<{tag}>", f"</{tag}>", f"{before}{indent}<{tag} />", before))
+            self.fields.append(tag)
+        elif content is RECORDS:
+            # The records element is opened by the caller, empty plans are written as <tag />
+            self.suffix = "".join(self._pending)
+            self._pending = []
+            self.records_depth = depth
+        elif isinstance(content, tuple):
+            # No whitespace ahead of the document root, like ET.indent
+            self._pending.append(f"{indent if depth else ''}<{tag}{attrs}>")
+            for child in content:
+                self._compile(child, depth + 1)
+            self._pending.append(f"{indent}</{tag}>")
+        elif content:
+            self._pending.append(f"{indent}<{tag}>{xml_escape(content)}</{tag}>")
+        else:
+            self._pending.append(f"{indent}<{tag} />")
+
+    def render(self, values):
+        """Markup up to the records element (or the whole layout), `values` in `fields` order."""
+        parts = []
+        append = parts.append
+        for (start, end, empty, before), value in zip(self._slots, values):
+            if value:
+                append(start)
+                append(xml_escape(value))
+                append(end)
+            elif value is None:
+                append(before)
+            else:
+                append(empty)
+        append(self.suffix)
+        return "".join(parts)
+
+@lru_cache(maxsize=None)
+def compile_template(layout, depth=0, pretty=True, space="  ", attrs=""):
+    return XmlTemplate(layout, depth, pretty, space, attrs)
+
+def berth_information_values(metrics, call, agency_map=None):
+    """Field values of one berthinformation record (a berth_call.BerthCall), in BERTH_INFORMATION order."""
+    agency_map = agency if agency_map is None else agency_map
+    after_metric_point, forward_metric_point, is_real = metrics.get_metrics(
+        call.planned_bollard, call.loa, call.is_starboard
+    )
+    # Maping berthing side
+    berthing_side = "StarbordSide" if call.is_starboard else "PortSide"
+
+    return (
+        call.voyage,
+        call.vessel_name,
+        call.vessel_code,
+        call.imo,
+        call.loa_text,
+        str(after_metric_point),
+        str(forward_metric_point),
+        call.etb,
+        call.etd,
+        call.etc,
+        call.operator,
+        str(forward_metric_point),
+        berthing_side,
+        call.service_code,
+        call.service_name,
+        str(call.total_moves),
+        str(call.discharge_moves),
+        str(call.load_moves),
+        str(call.restow_moves),
+        f"{call.average_cranes:.2f}",
+        str(agency_map.get(call.agency_key, "NOA")),
+    )
+
+def write_berth_information(writer, metrics, call, agency_map=None):
+    template = compile_template(BERTH_INFORMATION, writer.depth, writer.pretty, writer.space)
+    writer._write(template.render(berth_information_values(metrics, call, agency_map)))
+
+def _write_plan_head(writer, start_date, end_date):
+    template = compile_template(BERTH_PLAN_ENVELOPE, 0, writer.pretty, writer.space, ENVELOPE_ATTRS)
+    writer._write("<?xml version='1.0' encoding='utf-8'?>\n")
+    writer._write(template.render((
+        datetime.utcnow().isoformat() + "Z",
+        format_datetime(start_date),
+        format_datetime(end_date),
+    )))
+    writer.depth = template.records_depth
+
+
+def _write_plan_tail(writer, berth_count):
+    if berth_count:
+        writer.end("berths")
+    else:
+        writer.empty("berths")
+
+    template = compile_template(BERTH_PLAN_ENVELOPE, 0, writer.pretty, writer.space, ENVELOPE_ATTRS)
+    writer._write(template.tail)
+    writer.depth = 0
+
+
+def _write_etc_head(writer):
+    envelope = compile_template(ETC_ENVELOPE, 0, writer.pretty, writer.space, ENVELOPE_ATTRS)
+    writer._write(envelope.render(()))
+    writer.depth = envelope.records_depth
+    writer.start("ETC")
+    return envelope
+
+
+def _write_etc_tail(writer, envelope):
+    writer.end("ETC")
+    writer._write(envelope.tail)
+    writer.depth = 0
+
+
+def _write_etc_document_head(writer):
+    document = compile_template(ETC_DOCUMENT, writer.depth, writer.pretty, writer.space)
+    writer._write(document.render((datetime.now().astimezone().isoformat(timespec="milliseconds"),)))
+    etc_depth = writer.depth
+    writer.depth = document.records_depth
+    return document, etc_depth
+
+
+def _write_etc_document_tail(writer, document, etc_depth, operation_count):
+    if operation_count:
+        writer.end("comercialOperations")
+    else:
+        writer.empty("comercialOperations")
+    writer._write(document.tail)
+    writer.depth = etc_depth
+
+
+def etc_operation_values(row):
+    # NULL columns are left out like FOR XML does
+    return tuple(None if row.get(tag) is None else str(row[tag]) for tag in ETC_FIELDS)
+
+
+def etc_envelope_xml(document, pretty=False):
+    """Wrap a TerminalComercialOperation document rendered by SQL Server in the ETC SOAP envelope."""
+    writer = XmlStreamWriter(pretty=pretty)
+    envelope = _write_etc_head(writer)
+    writer._write(writer._indent() + document)
+    _write_etc_tail(writer, envelope)
+    return writer.flush().decode("utf-8")
+
+
+async def aiter_etc_xml(batches, pretty=False, chunk_size=64 * 1024):
+    """Yield the ETC SOAP envelope as UTF-8 byte chunks, written from an async iterator of row batches.
+
+    Produces the document SQL Server renders with FOR XML PATH, one batch at a time.
+    """
+    writer = XmlStreamWriter(pretty=pretty)
+    envelope = _write_etc_head(writer)
+    document, etc_depth = _write_etc_document_head(writer)
+
+    operation_count = 0
+    template = None
+    async for rows in batches:
+        for row in rows:
+            if operation_count == 0:
+                writer.start("comercialOperations")
+                template = compile_template(ETC_OPERATION, writer.depth, writer.pretty, writer.space)
+            writer._write(template.render(etc_operation_values(row)))
+            operation_count += 1
+        if writer.size >= chunk_size:
+            yield writer.flush()
+
+    _write_etc_document_tail(writer, document, etc_depth, operation_count)
+    _write_etc_tail(writer, envelope)
+    yield writer.flush()
+
+
+async def etc_xml_builder(rows, pretty=False):
+    """ETC SOAP envelope for a list of rows, as a string."""
+    async def batches():
+        yield rows
+
+    return b"".join([chunk async for chunk in aiter_etc_xml(batches(), pretty=pretty)]).decode("utf-8")
+
+
+def iter_berth_plan_xml(metrics, berth_data_list, start_date, end_date, pretty=True, chunk_size=64 * 1024,
+                        agency_map=None):
+    """Yield the BerthPlan SOAP envelope of BerthCall records as UTF-8 byte chunks of about `chunk_size` bytes."""
+    writer = XmlStreamWriter(pretty=pretty)
+    _write_plan_head(writer, start_date, end_date)
+
+    # <berths> is only opened once the first record arrives, an empty plan is written as <berths />
+    berth_count = 0
+    for berth in berth_data_list:
+        if berth_count == 0:
+            writer.start("berths")
+        write_berth_information(writer, metrics, berth, agency_map)
+        berth_count += 1
+        if writer.size >= chunk_size:
+            yield writer.flush()
+
+    _write_plan_tail(writer, berth_count)
+    yield writer.flush()
+
+
+async def aiter_berth_plan_xml(metrics, berths, start_date, end_date, pretty=True, chunk_size=64 * 1024,
+                               agency_map=None):
+    """Same as iter_berth_plan_xml() for BerthCall records coming from an async iterator."""
+    writer = XmlStreamWriter(pretty=pretty)
+    _write_plan_head(writer, start_date, end_date)
+
+    berth_count = 0
+    async for berth in berths:
+        if berth_count == 0:
+            writer.start("berths")
+        write_berth_information(writer, metrics, berth, agency_map)
+        berth_count += 1
+        if writer.size >= chunk_size:
+            yield writer.flush()
+
+    _write_plan_tail(writer, berth_count)
+    yield writer.flush()
+
+async def xml_file_builder(metrics, berth_data_list, start_date, end_date, logger, pretty=True, agency_map=None):
     try:
         logger.info("Starting BerthPlan XML file processing...")
-        # Adding root structure
-        envelope = ET.Element(ns("Envelope", SOAPENV))
-        header = ET.SubElement(envelope, ns("Header", SOAPENV))
-        body = ET.SubElement(envelope, ns("Body", SOAPENV))
-        process = ET.SubElement(body, ns("processBerthPlan", TMSA))
-        request = ET.SubElement(process, "berthPlanRequest")
-        demande = ET.SubElement(request, "DemandeInitiale")
-
-        # Adding nHeader
-        header_elem = ET.SubElement(demande, "header")
-        ET.SubElement(header_elem, "msgVersion").text = "3.0"
-        ET.SubElement(header_elem, "GenerationTime").text = datetime.utcnow().isoformat() + "Z"
-        ET.SubElement(header_elem, "sender").text = "APMT"
-
-        # Adding Body
-        body_elem = ET.SubElement(demande, "body")
-        ET.SubElement(body_elem, "startDate").text = format_datetime(start_date)
-        ET.SubElement(body_elem, "endDate").text = format_datetime(end_date)
-        berths = ET.SubElement(body_elem, "berths")
-
-        for berth in berth_data_list:
-            isStarboardBerth = True if berth.get("isStarboardBerth") == "1" else False
-            planned_bollard = berth.get("plannedBollard", "")
-            vessel_loa = berth.get("vesselLOA", 0.0)
-            after_metric_point, forward_metric_point, is_real = metrics.get_metrics(planned_bollard, vessel_loa, isStarboardBerth)
-            # Maping berthing side
-            berthing_side = "StarbordSide" if isStarboardBerth else "PortSide"
-
-            # Formating all datetime fields
-            etb = format_datetime(berth.get("etb", ""))
-            etd = format_datetime(berth.get("etd", ""))
-            etc = format_datetime(berth.get("etc", ""))
-            
-            binfo = ET.SubElement(berths, "berthinformation")
-            ET.SubElement(binfo, "berthPurpose").text = "DischargeLoad"
-            ET.SubElement(binfo, "requestStatus").text = "Reservation"
-            ET.SubElement(binfo, "voyageNumber").text = str(berth.get("arrivalVoyage", ""))
-            ET.SubElement(binfo, "vesselName").text = str(berth.get("vesselName", ""))
-            ET.SubElement(binfo, "vesselCode").text = str(berth.get("vesselCode", ""))
-            ET.SubElement(binfo, "IMO").text = str(berth.get("imoCode", ""))
-            ET.SubElement(binfo, "vesselType").text = "Container"
-            ET.SubElement(binfo, "LOA").text = str(berth.get("vesselLOA", ""))
-            ET.SubElement(binfo, "afterMetricPoint").text = str(after_metric_point)
-            ET.SubElement(binfo, "forwardMetricPoint").text = str(forward_metric_point)
-            ET.SubElement(binfo, "ETB").text = str(etb)
-            ET.SubElement(binfo, "ETD").text = str(etd)
-            ET.SubElement(binfo, "ETC").text = str(etc)
-            ET.SubElement(binfo, "forwardDraught").text = "0"
-            ET.SubElement(binfo, "afterDraught").text = "0"
-            ET.SubElement(binfo, "dockName").text = "1"
-            ET.SubElement(binfo, "EMP").text = str(berth.get("operatorCode", ""))
-            ET.SubElement(binfo, "bowBollard").text = str(forward_metric_point)
-            ET.SubElement(binfo, "berthingSide").text = str(berthing_side)
-            ET.SubElement(binfo, "serviceCode").text = str(berth.get("service_Route", ""))
-            ET.SubElement(binfo, "serviceName").text = str(berth.get("serviceName", ""))
-
-            total_moves = (
-                berth.get("plannedLoadMoves", 0)
-                + berth.get("plannedDischargeMoves", 0)
-                + berth.get("plannedShiftingMoves", 0)
-            )
-            ET.SubElement(binfo, "totalMoves").text = str(total_moves)
-            ET.SubElement(binfo, "dischargeMoves").text = str(berth.get("plannedDischargeMoves", 0))
-            ET.SubElement(binfo, "loadMoves").text = str(berth.get("plannedLoadMoves", 0))
-            ET.SubElement(binfo, "restowMoves").text = str(berth.get("plannedShiftingMoves", 0))
-
-            average_cranes = berth.get("averageCranes", 0.0)
-            ET.SubElement(binfo, "numberOfCranesAvg").text = f"{average_cranes:.2f}"
-
-            ET.SubElement(binfo, "marineAgent").text = str(agency.get(berth.get("operatorCode", "NOA"), "NOA")) #str(berth.get("operatorCode", "NOA"))
-
-            securite = ET.SubElement(binfo, "securite")
-            ET.SubElement(securite, "siCertificatISPS").text = "false"
-            ET.SubElement(securite, "referenceCertificatISPS").text = "0"
-
-
-        # Serializing to XML string
-        buffer = BytesIO()
-        tree = ET.ElementTree(envelope)
-        ET.indent(tree, space="  ")
-        tree.write(buffer, encoding="utf-8", xml_declaration=True)
-        xml_txt = buffer.getvalue().decode("utf-8")
+        chunks = iter_berth_plan_xml(metrics, berth_data_list, start_date, end_date, pretty=pretty, agency_map=agency_map)
+        xml_txt = b"".join(chunks).decode("utf-8")
         logger.info("BerthPlan XML file generated successfully!")
         return xml_txt
     except Exception as e:
-        logger.error(f"BerthPlan XML file generation failed! {e}")
+        logger.error("BerthPlan XML file generation failed! %s", e)
         raise RuntimeError("An error occurred while processing.") from e